@@ -0,0 +1,2 @@
+from host.client import BoardConnection, ConnectionPool, Cell, Gantry, Printer, Storage, Request, \
+    ProtocolError, RequestRejected, RemoteError, RequestCancelled
@@ -0,0 +1,418 @@
+import os
+import tty
+import asyncio
+import termios
+
+from mods import protocol
+
+# An asyncio client for the binary protocol in mods/protocol.py, run on the Linux computer that orchestrates the cell.
+# Each board gets one persistent serial connection, over which any number of coroutines can have requests in
+# flight at once. Requests are matched to their ACK and DONE frames by request ID, so they are pipelined on the
+# board rather than each waiting for the last to complete.
+#
+# Run from the root of this repository (e.g. python -m host.loopback), so mods.protocol can be imported.
+
+
+class ProtocolError(Exception):
+    """Exception to be used when a board does not complete a request"""
+    pass
+
+
+class RequestRejected(ProtocolError):
+    """Exception to be used when a board refuses a request, such as for an unknown opcode or a full queue"""
+    def __init__(self, status):
+        super().__init__(f"Request rejected with status {status}")
+        self.status = status
+
+
+class RemoteError(ProtocolError):
+    """Exception to be used when an operation raised on the board. The message is the board's"""
+    pass
+
+
+class RequestCancelled(ProtocolError):
+    """Exception to be used when a request was cancelled by a stop before it ran"""
+    pass
+
+
+USE_DEFAULT = object()     # Use the connection's timeout
+
+
+class Request:
+    def __init__(self, request_id, opcode, loop):
+        self.request_id = request_id
+        self.opcode = opcode
+        self.acked = loop.create_future()   # Resolves to the number of requests queued ahead on the board
+        self.done = loop.create_future()    # Resolves to the operation's result
+
+    def __await__(self):
+        return self.done.__await__()
+
+
+class BoardConnection:
+    # A persistent connection to one board, over a serial device such as /dev/ttyACM0
+
+    DEFAULT_TIMEOUT = 120.0     # seconds to wait for a request to complete
+    START_TIMEOUT = 5.0         # seconds to wait for the board to answer once serve() has been entered
+    PING_INTERVAL = 0.2
+    SERVE_COMMAND = b"\r\nserve()\r\n"
+
+    def __init__(self, path, timeout=DEFAULT_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self.__fd = None
+        self.__loop = None
+        self.__decoder = protocol.FrameDecoder()
+        self.__requests = {}
+        self.__next_id = 1
+        self.__write_lock = asyncio.Lock()
+
+    def is_open(self):
+        return self.__fd is not None
+
+    async def open(self, enter_serve=True):
+        # Open the device in raw mode. If enter_serve, serve() is typed at the board's REPL to start its server.
+        # Either way, the board is pinged until it answers
+        if self.__fd is not None:
+            return
+
+        self.__loop = asyncio.get_running_loop()
+        fd = os.open(self.path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        try:
+            tty.setraw(fd, termios.TCSANOW)
+        except termios.error:
+            pass    # Not a terminal, such as a pipe or socket stand-in
+        self.__fd = fd
+        self.__loop.add_reader(fd, self.__on_readable)
+
+        if enter_serve:
+            await self.__write(self.SERVE_COMMAND)
+        try:
+            await self.__wait_for_ping(self.START_TIMEOUT)
+        except BaseException:
+            self.__close_fd(ConnectionError(f"{self.path} did not answer"))
+            raise
+
+    async def __wait_for_ping(self, timeout):
+        end = self.__loop.time() + timeout
+        while True:
+            request = await self.submit(protocol.OP_PING)
+            try:
+                await asyncio.wait_for(asyncio.shield(request.done), self.PING_INTERVAL)
+                return
+            except asyncio.TimeoutError:
+                self.__requests.pop(request.request_id, None)
+                if self.__loop.time() >= end:
+                    raise
+
+    async def close(self, exit_serve=True):
+        # Optionally tell the board to leave serve() once its queue has run, returning it to the REPL
+        if self.__fd is None:
+            return
+        if exit_serve:
+            try:
+                await self.request(protocol.OP_EXIT, timeout=self.START_TIMEOUT)
+            except (ProtocolError, ConnectionError, asyncio.TimeoutError):
+                pass
+        self.__close_fd(ConnectionError(f"{self.path} was closed"))
+
+    def __close_fd(self, error):
+        if self.__fd is not None:
+            self.__loop.remove_reader(self.__fd)
+            os.close(self.__fd)
+            self.__fd = None
+        for request in self.__requests.values():
+            for future in (request.acked, request.done):
+                if not future.done():
+                    future.set_exception(error)
+        self.__requests.clear()
+
+    def __allocate_id(self):
+        # IDs run from 1 to 255, skipping any still in flight. 0 is reserved for the board
+        for _ in range(255):
+            request_id = self.__next_id
+            self.__next_id = self.__next_id % 255 + 1
+            if request_id not in self.__requests:
+                return request_id
+        raise ProtocolError("All request IDs are in flight")
+
+    async def submit(self, opcode, *args):
+        # Send a request without waiting for it to complete. Await the returned Request (or its acked future) as needed
+        if self.__fd is None:
+            raise ConnectionError(f"{self.path} is not open")
+
+        request = Request(self.__allocate_id(), opcode, self.__loop)
+        frame = protocol.encode_request(request.request_id, opcode, *args)
+        self.__requests[request.request_id] = request
+        try:
+            await self.__write(frame)
+        except BaseException:
+            self.__requests.pop(request.request_id, None)
+            raise
+        return request
+
+    async def request(self, opcode, *args, timeout=USE_DEFAULT):
+        # Send a request and wait for it to complete, returning its result.
+        # The timeout is in seconds, or None to wait for as long as the operation takes
+        if timeout is USE_DEFAULT:
+            timeout = self.timeout
+        request = await self.submit(opcode, *args)
+        try:
+            return await asyncio.wait_for(asyncio.shield(request.done), timeout)
+        finally:
+            if not request.done.done():
+                self.__requests.pop(request.request_id, None)
+
+    async def stop(self):
+        # Stop the board's running operation, if it runs until stopped, and cancel its queued requests.
+        # Sent straight away, rather than queued behind those requests
+        return await self.request(protocol.OP_STOP)
+
+    async def __write(self, data):
+        async with self.__write_lock:
+            view = memoryview(data)
+            while len(view) > 0:
+                try:
+                    written = os.write(self.__fd, view)
+                    view = view[written:]
+                except BlockingIOError:
+                    writable = self.__loop.create_future()
+                    self.__loop.add_writer(self.__fd, lambda: writable.done() or writable.set_result(None))
+                    try:
+                        await writable
+                    finally:
+                        self.__loop.remove_writer(self.__fd)
+
+    def __on_readable(self):
+        try:
+            data = os.read(self.__fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self.__close_fd(ConnectionError(f"{self.path} failed: {e}"))
+            return
+        if not data:
+            self.__close_fd(ConnectionError(f"{self.path} was disconnected"))
+            return
+
+        if self.__decoder.feed(data) == 0:
+            return
+        frame = self.__decoder.pop()
+        while frame is not None:
+            self.__on_frame(*frame)
+            frame = self.__decoder.pop()
+
+    def __on_frame(self, request_id, opcode, payload):
+        request = self.__requests.get(request_id)
+        if request is None:
+            return  # A reply to a request that timed out, or one the board sent unprompted
+
+        if opcode == protocol.OP_ACK:
+            if not request.acked.done():
+                request.acked.set_result(payload[0] if len(payload) > 0 else 0)
+            return
+
+        del self.__requests[request_id]
+        status, result = protocol.decode_status(payload)
+        if not request.acked.done():
+            request.acked.set_result(0)
+
+        if request.done.done():
+            return
+        if opcode == protocol.OP_ERROR:
+            request.done.set_exception(RequestRejected(status))
+        elif status == protocol.STATUS_OK:
+            request.done.set_result(True if result is None else result)
+        elif status == protocol.STATUS_FAILED:
+            request.done.set_result(False)
+        elif status == protocol.STATUS_CANCELLED:
+            request.done.set_exception(RequestCancelled(f"Request {request_id} was cancelled"))
+        else:
+            request.done.set_exception(RemoteError(result if result is not None else f"Status {status}"))
+
+    def get_stats(self):
+        return {
+            "in_flight": len(self.__requests),
+            "frames": self.__decoder.frames,
+            "crc_errors": self.__decoder.crc_errors,
+            "skipped_bytes": self.__decoder.skipped_bytes
+        }
+
+
+class Board:
+    # Typed coroutines for a board's operations, each sent as one request over a shared connection.
+    # Operations return True (or their result) on success, and False if the board reported a failure
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    async def ping(self):
+        return await self.connection.request(protocol.OP_PING)
+
+    async def stop(self):
+        return await self.connection.stop()
+
+
+class Gantry(Board):
+
+    async def home(self):
+        return await self.connection.request(protocol.OP_GANTRY_HOME)
+
+    async def move_left(self, stations):
+        return await self.connection.request(protocol.OP_GANTRY_MOVE_LEFT, stations)
+
+    async def move_right(self, stations):
+        return await self.connection.request(protocol.OP_GANTRY_MOVE_RIGHT, stations)
+
+    async def move_to(self, station):
+        return await self.connection.request(protocol.OP_GANTRY_MOVE_TO, station)
+
+    async def intake_filament(self):
+        return await self.connection.request(protocol.OP_GANTRY_INTAKE)
+
+    async def spool_up(self, time, speed):
+        return await self.connection.request(protocol.OP_GANTRY_SPOOL_UP, time, speed)
+
+    async def spool_up_until(self, speed):
+        # Completes once stop() has been sent
+        return await self.connection.request(protocol.OP_GANTRY_SPOOL_UP_UNTIL, speed, timeout=None)
+
+    async def retrieve_filament(self):
+        return await self.connection.request(protocol.OP_GANTRY_RETRIEVE)
+
+    async def deliver(self, length=25):
+        return await self.connection.request(protocol.OP_GANTRY_DELIVER, length)
+
+    async def deliver_until(self):
+        return await self.connection.request(protocol.OP_GANTRY_DELIVER_UNTIL, timeout=None)
+
+    async def home_filament(self):
+        return await self.connection.request(protocol.OP_GANTRY_HOME_FILAMENT)
+
+    async def unspool_tension(self):
+        return await self.connection.request(protocol.OP_GANTRY_UNSPOOL_TENSION)
+
+    async def calibrate(self):
+        # Returns the number of stations found. Runs the whole length of the rail, so can take a while
+        return await self.connection.request(protocol.OP_GANTRY_CALIBRATE, timeout=None)
+
+
+class Storage(Board):
+
+    async def deliver(self, mm, index=0):
+        # Returns the overshoot in mm
+        return await self.connection.request(protocol.OP_STORAGE_DELIVER, index, mm)
+
+    async def deliver_until(self, index=0):
+        return await self.connection.request(protocol.OP_STORAGE_DELIVER_UNTIL, index, timeout=None)
+
+    async def little_push(self, index=0):
+        return await self.connection.request(protocol.OP_STORAGE_LITTLE_PUSH, index)
+
+    async def pull_out(self, index=0):
+        return await self.connection.request(protocol.OP_STORAGE_PULL_OUT, index)
+
+    async def cut(self):
+        return await self.connection.request(protocol.OP_STORAGE_CUT)
+
+    async def dock(self):
+        return await self.connection.request(protocol.OP_STORAGE_DOCK)
+
+    async def undock(self):
+        return await self.connection.request(protocol.OP_STORAGE_UNDOCK)
+
+
+class Printer(Board):
+
+    async def dock(self):
+        return await self.connection.request(protocol.OP_PRINTER_DOCK)
+
+    async def undock(self):
+        return await self.connection.request(protocol.OP_PRINTER_UNDOCK)
+
+    async def intake_filament(self):
+        return await self.connection.request(protocol.OP_PRINTER_INTAKE)
+
+    async def spool_up(self, time, max_speed=1.0):
+        return await self.connection.request(protocol.OP_PRINTER_SPOOL_UP, time, max_speed)
+
+    async def spool_up_until(self, max_speed=1.0):
+        return await self.connection.request(protocol.OP_PRINTER_SPOOL_UP_UNTIL, max_speed, timeout=None)
+
+    async def wait_for_intake(self, timeout=60.0):
+        return await self.connection.request(protocol.OP_PRINTER_WAIT_FOR_INTAKE, timeout, timeout=timeout + self.connection.timeout)
+
+
+class ConnectionPool:
+    # Keeps one open connection per serial device, reused by every caller, so a connection's
+    # setup is paid once rather than per operation
+
+    def __init__(self, timeout=BoardConnection.DEFAULT_TIMEOUT, enter_serve=True):
+        self.timeout = timeout
+        self.enter_serve = enter_serve
+        self.__connections = {}
+        self.__opening = {}
+
+    async def get(self, path):
+        connection = self.__connections.get(path)
+        if connection is not None and connection.is_open():
+            return connection
+
+        # Concurrent callers share the one attempt to open the device
+        opening = self.__opening.get(path)
+        if opening is None:
+            opening = asyncio.ensure_future(self.__open(path))
+            self.__opening[path] = opening
+        try:
+            return await asyncio.shield(opening)
+        finally:
+            if opening.done():
+                self.__opening.pop(path, None)
+
+    async def __open(self, path):
+        connection = BoardConnection(path, self.timeout)
+        await connection.open(self.enter_serve)
+        self.__connections[path] = connection
+        return connection
+
+    async def close(self, exit_serve=True):
+        connections = list(self.__connections.values())
+        self.__connections.clear()
+        await asyncio.gather(*(connection.close(exit_serve) for connection in connections))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+class Cell:
+    # The three boards of the cell, each over its pooled connection, e.g.
+    #
+    #   async with Cell("/dev/ttyACM0", "/dev/ttyACM1", "/dev/ttyACM2") as cell:
+    #       await cell.gantry.move_to(2)
+    #       await asyncio.gather(cell.storage.deliver(120), cell.printer.dock())
+
+    def __init__(self, gantry_path, printer_path, storage_path, pool=None):
+        self.pool = pool if pool is not None else ConnectionPool()
+        self.__paths = (gantry_path, printer_path, storage_path)
+        self.gantry = None
+        self.printer = None
+        self.storage = None
+
+    async def open(self):
+        gantry, printer, storage = await asyncio.gather(*(self.pool.get(path) for path in self.__paths))
+        self.gantry = Gantry(gantry)
+        self.printer = Printer(printer)
+        self.storage = Storage(storage)
+        return self
+
+    async def close(self):
+        await self.pool.close()
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
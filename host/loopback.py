@@ -0,0 +1,209 @@
+import os
+import tty
+import time
+import asyncio
+import termios
+
+from mods import protocol
+from host.client import Cell
+
+# A stand-in for a board, serving the binary protocol on the master side of a pseudo terminal, so the
+# client can be run without hardware. The client opens the pty's slave path as it would /dev/ttyACM0.
+# Like the board's Server, requests are ACKed as they arrive and run one at a time, in order.
+#
+# Handlers are coroutine functions, keyed by opcode. Operations that run until stopped should await
+# board.stop_requested. Running this module pipelines a short job across three stand-ins:
+#
+#   python -m host.loopback
+
+
+class LoopbackBoard:
+
+    def __init__(self, handlers, name="loopback"):
+        self.name = name
+        self.handlers = handlers
+        self.stop_requested = asyncio.Event()
+        self.requests = 0
+
+        self.__master, self.__slave = os.openpty()
+        tty.setraw(self.__master, termios.TCSANOW)
+        self.path = os.ttyname(self.__slave)
+
+        self.__decoder = protocol.FrameDecoder()
+        self.__pending = asyncio.Queue()
+        self.__queued = 0
+        self.__worker = None
+        self.__loop = None
+
+    def start(self):
+        self.__loop = asyncio.get_running_loop()
+        os.set_blocking(self.__master, False)
+        self.__loop.add_reader(self.__master, self.__on_readable)
+        self.__worker = asyncio.ensure_future(self.__work())
+        return self
+
+    async def close(self):
+        self.__loop.remove_reader(self.__master)
+        self.__worker.cancel()
+        try:
+            await self.__worker
+        except asyncio.CancelledError:
+            pass
+        os.close(self.__master)
+        os.close(self.__slave)
+
+    def __send(self, request_id, opcode, payload=b""):
+        os.write(self.__master, protocol.encode_frame(request_id, opcode, payload))
+
+    def __done(self, request_id, status, result=None):
+        self.__send(request_id, protocol.OP_DONE, protocol.encode_status(status, result))
+
+    def __on_readable(self):
+        try:
+            data = os.read(self.__master, 4096)
+        except (BlockingIOError, OSError):
+            return  # EIO whilst no client has the slave open
+        if self.__decoder.feed(data) == 0:
+            return
+        frame = self.__decoder.pop()
+        while frame is not None:
+            self.__receive(*frame)
+            frame = self.__decoder.pop()
+
+    def __receive(self, request_id, opcode, payload):
+        self.requests += 1
+        if opcode == protocol.OP_PING:
+            self.__send(request_id, protocol.OP_ACK, bytes((self.__queued,)))
+            self.__done(request_id, protocol.STATUS_OK)
+        elif opcode == protocol.OP_STOP:
+            self.__send(request_id, protocol.OP_ACK, bytes((self.__queued,)))
+            while not self.__pending.empty():
+                self.__done(self.__pending.get_nowait()[0], protocol.STATUS_CANCELLED)
+            self.__queued = 0
+            self.stop_requested.set()
+            self.__done(request_id, protocol.STATUS_OK)
+        elif opcode == protocol.OP_EXIT:
+            self.__send(request_id, protocol.OP_ACK, bytes((self.__queued,)))
+            self.__pending.put_nowait((request_id, opcode, ()))
+        elif opcode not in self.handlers:
+            self.__send(request_id, protocol.OP_ERROR, protocol.encode_status(protocol.STATUS_UNKNOWN_OPCODE))
+        else:
+            args = protocol.decode_args(opcode, payload)
+            if args is None:
+                self.__send(request_id, protocol.OP_ERROR, protocol.encode_status(protocol.STATUS_BAD_ARGUMENTS))
+            else:
+                self.__send(request_id, protocol.OP_ACK, bytes((self.__queued,)))
+                self.__queued += 1
+                self.__pending.put_nowait((request_id, opcode, args))
+
+    async def __work(self):
+        while True:
+            request_id, opcode, args = await self.__pending.get()
+            self.__queued = max(self.__queued - 1, 0)
+            if opcode == protocol.OP_EXIT:
+                self.__done(request_id, protocol.STATUS_OK)
+                continue
+
+            self.stop_requested.clear()
+            try:
+                result = await self.handlers[opcode](self, *args)
+            except Exception as e:
+                self.__done(request_id, protocol.STATUS_EXCEPTION, f"{type(e).__name__}: {e}")
+                continue
+
+            if result is False:
+                self.__done(request_id, protocol.STATUS_FAILED)
+            elif result is None or result is True:
+                self.__done(request_id, protocol.STATUS_OK)
+            else:
+                self.__done(request_id, protocol.STATUS_OK, result)
+
+
+def timed(seconds, result=None):
+    # A handler that takes the given time, whatever its arguments
+    async def handler(board, *args):
+        await asyncio.sleep(seconds)
+        return result
+    return handler
+
+
+async def until_stopped(board, *args):
+    await board.stop_requested.wait()
+
+
+async def storage_deliver(board, index, mm):
+    await asyncio.sleep(mm / 200)
+    return 0.0     # No overshoot
+
+
+# Rough stand-ins for each board's operations, scaled down for quick runs
+GANTRY_HANDLERS = {
+    protocol.OP_GANTRY_HOME: timed(0.05),
+    protocol.OP_GANTRY_MOVE_LEFT: timed(0.05),
+    protocol.OP_GANTRY_MOVE_RIGHT: timed(0.05),
+    protocol.OP_GANTRY_MOVE_TO: timed(0.05),
+    protocol.OP_GANTRY_INTAKE: timed(0.1, True),
+    protocol.OP_GANTRY_SPOOL_UP: timed(0.2, True),
+    protocol.OP_GANTRY_SPOOL_UP_UNTIL: until_stopped,
+    protocol.OP_GANTRY_RETRIEVE: timed(0.05),
+    protocol.OP_GANTRY_DELIVER: timed(0.05),
+    protocol.OP_GANTRY_DELIVER_UNTIL: until_stopped,
+    protocol.OP_GANTRY_HOME_FILAMENT: timed(0.05),
+    protocol.OP_GANTRY_UNSPOOL_TENSION: timed(0.05),
+    protocol.OP_GANTRY_CALIBRATE: timed(0.2, 6),
+}
+
+STORAGE_HANDLERS = {
+    protocol.OP_STORAGE_DELIVER: storage_deliver,
+    protocol.OP_STORAGE_DELIVER_UNTIL: until_stopped,
+    protocol.OP_STORAGE_LITTLE_PUSH: timed(0.05),
+    protocol.OP_STORAGE_PULL_OUT: timed(0.1),
+    protocol.OP_STORAGE_CUT: timed(0.05),
+    protocol.OP_STORAGE_DOCK: timed(0.05),
+    protocol.OP_STORAGE_UNDOCK: timed(0.05),
+}
+
+PRINTER_HANDLERS = {
+    protocol.OP_PRINTER_DOCK: timed(0.05),
+    protocol.OP_PRINTER_UNDOCK: timed(0.05),
+    protocol.OP_PRINTER_INTAKE: timed(0.1, True),
+    protocol.OP_PRINTER_SPOOL_UP: timed(0.2, True),
+    protocol.OP_PRINTER_SPOOL_UP_UNTIL: until_stopped,
+    protocol.OP_PRINTER_WAIT_FOR_INTAKE: timed(0.05, True),
+}
+
+
+async def main():
+    boards = [LoopbackBoard(GANTRY_HANDLERS, "gantry").start(),
+              LoopbackBoard(PRINTER_HANDLERS, "printer").start(),
+              LoopbackBoard(STORAGE_HANDLERS, "storage").start()]
+    try:
+        start = time.perf_counter()
+        async with Cell(*(board.path for board in boards)) as cell:
+            print(f"Connected in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+            start = time.perf_counter()
+            for _ in range(10):
+                await cell.gantry.ping()
+            print(f"Round trip: {(time.perf_counter() - start) * 100:.2f}ms")
+
+            # The gantry's moves are pipelined, whilst the storage and printer work alongside
+            start = time.perf_counter()
+            results = await asyncio.gather(cell.gantry.home(),
+                                           cell.gantry.move_to(2),
+                                           cell.gantry.intake_filament(),
+                                           cell.storage.deliver(120),
+                                           cell.printer.dock())
+            print(f"Job step: {results} in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+            spooling = asyncio.ensure_future(cell.printer.spool_up_until(0.5))
+            await asyncio.sleep(0.1)
+            await cell.printer.stop()
+            print(f"Spool stopped: {await spooling}")
+    finally:
+        for board in boards:
+            await board.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
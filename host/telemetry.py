@@ -0,0 +1,146 @@
+import sys
+import json
+import struct
+from array import array
+
+# Reads the history a board's TelemetryRecorder exported, e.g. after copying it off the board with
+# "mpremote cp :telemetry.bin .":
+#
+#   python -m host.telemetry telemetry.bin                  Each channel's samples, summarised
+#   python -m host.telemetry telemetry.bin --csv out.csv    Every sample, as seconds before the export
+#   python -m host.telemetry --frames capture.bin           The readings frames logged with logging.READINGS_FRAME
+#
+# Times are in seconds relative to when the export was taken, as the board's ticks_ms() wraps around.
+# Frames are read from a capture of the board's serial output, and anything between them, such as text, is skipped.
+
+EXPORT_MAGIC = "yukon-telemetry"
+TICKS_PERIOD = 1 << 30
+
+# As in pimoroni_yukon.logging
+FRAME_SYNC = 0x5A
+FRAME_NAMES = 0
+FRAME_VALUES = 1
+FRAME_HEADER_SIZE = 4
+FRAME_CHECKSUM_SIZE = 2
+
+
+class Telemetry:
+
+    def __init__(self, header, ticks, channels, values):
+        self.header = header
+        self.names = header["names"]
+        self.ticks = ticks
+        self.channels = channels
+        self.values = values
+
+    def seconds(self, ticks):
+        # Seconds before the export was taken, as a negative number
+        return -((self.header["now_ms"] - ticks) % TICKS_PERIOD) / 1000
+
+    def tripped(self):
+        # Seconds before the export that a fault stopped the recording, or None
+        tripped_ms = self.header["tripped_ms"]
+        return None if tripped_ms is None else self.seconds(tripped_ms)
+
+    def rows(self):
+        # (seconds, name, value) for every sample, in time order
+        rows = [(self.seconds(self.ticks[i]), self.names[self.channels[i]], self.values[i])
+                for i in range(len(self.ticks))]
+        rows.sort(key=lambda row: row[0])
+        return rows
+
+    def channel(self, name):
+        # (seconds, value) for each sample of the named channel, in time order
+        return [(seconds, value) for seconds, row_name, value in self.rows() if row_name == name]
+
+
+def read_export(stream):
+    header = json.loads(stream.readline())
+    if header.get("format") != EXPORT_MAGIC:
+        raise ValueError("not a telemetry export")
+    count = header["count"]
+
+    arrays = (array('I'), array('B'), array('f'))
+    for samples in arrays:
+        samples.fromfile(stream, count)
+    if sys.byteorder != "little":
+        arrays[0].byteswap()
+        arrays[2].byteswap()
+    return Telemetry(header, *arrays)
+
+
+def load(path):
+    with open(path, "rb") as file:
+        return read_export(file)
+
+
+def read_frames(data):
+    # Yields (ticks_ms, {name: value}) for each values frame in data, using the names frame sent before it
+    names = None
+    i = 0
+    while i + FRAME_HEADER_SIZE + FRAME_CHECKSUM_SIZE <= len(data):
+        if data[i] != FRAME_SYNC:
+            i += 1
+            continue
+        frame_type = data[i + 1]
+        length = data[i + 2] | (data[i + 3] << 8)
+        end = i + FRAME_HEADER_SIZE + length
+        if end + FRAME_CHECKSUM_SIZE > len(data) or \
+                sum(data[i + 1:end]) & 0xFFFF != data[end] | (data[end + 1] << 8):
+            i += 1      # Not a frame after all, or a damaged one
+            continue
+
+        payload = data[i + FRAME_HEADER_SIZE:end]
+        if frame_type == FRAME_NAMES:
+            names = payload.decode().split(",")
+        elif frame_type == FRAME_VALUES and names is not None and length == 4 + 4 * len(names):
+            ticks = struct.unpack_from("<I", payload)[0]
+            values = struct.unpack_from(f"<{len(names)}f", payload, 4)
+            yield ticks, dict(zip(names, values))
+        i = end + FRAME_CHECKSUM_SIZE
+
+
+def summarise_frames(data):
+    frames = list(read_frames(data))
+    print(f"{len(frames)} frames")
+    if len(frames) > 0:
+        for name, value in frames[-1][1].items():
+            print(f"{name:<20} {value:>10.3f}")
+
+
+def summarise(telemetry):
+    tripped = telemetry.tripped()
+    print(f"{len(telemetry.ticks)} samples, the lowest and highest of each channel per {telemetry.header['interval_ms']}ms" +
+          (f", tripped {abs(tripped):.1f}s before the export" if tripped is not None else ""))
+    print("Channel          samples       from      min      max     last")
+    for name in telemetry.names:
+        samples = telemetry.channel(name)
+        if len(samples) == 0:
+            continue
+        values = [value for _, value in samples]
+        print(f"{name:<16} {len(samples):>7} {samples[0][0]:>9.1f}s {min(values):>8.3f} {max(values):>8.3f} {values[-1]:>8.3f}")
+
+
+def write_csv(telemetry, path):
+    with open(path, "w") as file:
+        file.write("seconds,channel,value\n")
+        for seconds, name, value in telemetry.rows():
+            file.write(f"{seconds:.3f},{name},{value}\n")
+
+
+def main(argv):
+    args = list(argv)
+    if args[0] == "--frames":
+        with open(args[1], "rb") as file:
+            summarise_frames(file.read())
+        return
+    path = args.pop(0)
+    telemetry = load(path)
+    if len(args) >= 2 and args[0] == "--csv":
+        write_csv(telemetry, args[1])
+    else:
+        summarise(telemetry)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
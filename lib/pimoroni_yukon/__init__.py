@@ -4,14 +4,17 @@
 
 import sys
 import time
+import struct
 import tca
 from machine import ADC, Pin, I2C
 from pimoroni_yukon.modules import KNOWN_MODULES
 from pimoroni_yukon.modules.common import ADC_FLOAT, ADC_LOW, ADC_HIGH, YukonModule
 import pimoroni_yukon.logging as logging
+import pimoroni_yukon.spans as spans
 from pimoroni_yukon.errors import OverVoltageError, UnderVoltageError, OverCurrentError, OverTemperatureError, FaultError, VerificationError
-from pimoroni_yukon.timing import ticks_ms, ticks_add, ticks_diff
+from pimoroni_yukon.timing import ticks_ms, ticks_us, ticks_add, ticks_diff
 from pimoroni_yukon.conversion import u16_to_voltage_in, u16_to_voltage_out, u16_to_current, analog_to_temp
+from pimoroni_yukon.stats import RunningStats, TEMPERATURE_LOW, TEMPERATURE_HIGH
 from ucollections import OrderedDict, namedtuple
 
 
@@ -144,6 +147,22 @@ class Yukon:
     OUTPUT_DISSIPATE_TIME_US = 10 * 1000
     OUTPUT_DISSIPATE_LEVEL = 2.0                # The voltage below which we can reliably obtain the address of attached modules
 
+    # The channels monitor() samples, each of which can be given its own interval with set_monitor_intervals()
+    MONITOR_VOLTAGE_IN = 0
+    MONITOR_VOLTAGE_OUT = 1
+    MONITOR_CURRENT = 2
+    MONITOR_TEMPERATURE = 3
+    MONITOR_MODULES = 4
+    NUM_MONITOR_CHANNELS = 5
+    RECORD_NAMES = ("Vi", "Vo", "C", "T")     # The channels attach_recorder() adds, in the order of those above
+    READING_NAMES = ("Vi_max", "Vi_min", "Vi_avg", "Vo_max", "Vo_min", "Vo_avg",
+                     "C_max", "C_min", "C_avg", "T_max", "T_min", "T_avg")
+
+    # The ADC mux is shared by every Yukon object, so the selected address is tracked on the class.
+    # None means the muxes are deselected, or in an unknown state
+    __selected_address = None
+    __mux_switches = 0
+
     def __init__(self, voltage_limit=DEFAULT_VOLTAGE_LIMIT, current_limit=DEFAULT_CURRENT_LIMIT, temperature_limit=DEFAULT_TEMPERATURE_LIMIT, logging_level=logging.LOG_INFO):
         self.__voltage_limit = min(voltage_limit, self.ABSOLUTE_MAX_VOLTAGE_LIMIT)
         self.__current_limit = current_limit
@@ -194,6 +213,7 @@ class Yukon:
                                    1 << tca.get_number(Pin.board.ADC_ADDR_3))
         self.__adc_io_mask = self.__adc_io_ens_addrs[0] | self.__adc_io_ens_addrs[1] | \
             self.__adc_io_adc_addrs[0] | self.__adc_io_adc_addrs[1] | self.__adc_io_adc_addrs[2]
+        Yukon.__selected_address = None     # The pins were just initialised, so any prior selection is lost
 
         # User switches
         self.__switches = (Pin.board.SW_A,
@@ -210,10 +230,41 @@ class Yukon:
         # Shared analog input
         self.__shared_adc = ADC(Pin.board.SHARED_ADC)
 
+        # Every channel is sampled on every monitor() call until set_monitor_intervals() says otherwise
+        self.__monitor_intervals = [0] * self.NUM_MONITOR_CHANNELS
+        self.__monitor_next_ms = [0] * self.NUM_MONITOR_CHANNELS
+        self.__monitor_round_robin = False
+        self.__monitored_modules = []
+        self.__module_index = 0
+
+        self.__last_voltage_in = None
+        self.__last_voltage_out = None
+        self.__last_current = None
+        self.__last_temperature = None
+
+        # The readings of each channel, in the order of the MONITOR_ constants
+        self.__voltage_in_stats = RunningStats()
+        self.__voltage_out_stats = RunningStats()
+        self.__current_stats = RunningStats(low=0.0, high=current_limit)
+        self.__temperature_stats = RunningStats(low=TEMPERATURE_LOW, high=TEMPERATURE_HIGH)
+        self.__stats = (self.__voltage_in_stats, self.__voltage_out_stats, self.__current_stats, self.__temperature_stats)
+
         self.__clear_counts_and_readings()
+        self.reset_monitor_stats()
 
         self.__monitor_action_callback = None
 
+        self.__recorder = None
+        self.__record_channel = 0
+
+        # The formatter for print_readings(), kept between calls so printing does not allocate. It is remade if the
+        # filters passed in or the registered modules change
+        self.__formatter = None
+        self.__formatter_allowed = None
+        self.__formatter_excluded = None
+        self.__formatter_modules = True
+
+
     def reset(self):
         logging.debug("[Yukon] Resetting")
 
@@ -308,6 +359,7 @@ class Yukon:
 
         if self.__slot_assignments[slot] is None:
             self.__slot_assignments[slot] = module
+            self.__refresh_monitored_modules()
         else:
             raise ValueError("The selected slot is already populated")
 
@@ -321,6 +373,12 @@ class Yukon:
         if module is not None:
             module.deregister()
             self.__slot_assignments[slot] = None
+            self.__refresh_monitored_modules()
+
+    def __refresh_monitored_modules(self):
+        self.__monitored_modules = [module for module in self.__slot_assignments.values() if module is not None]
+        self.__formatter = None
+        self.__module_index = 0
 
     def __match_module(self, adc1_level, adc2_level, slow1, slow2, slow3):
         for m in KNOWN_MODULES:
@@ -560,13 +618,14 @@ class Yukon:
         # Deselect the muxes and reset the address to zero
         state = self.__adc_io_ens_addrs[0] | self.__adc_io_ens_addrs[1]
         tca.change_output_mask(self.__adc_io_chip, self.__adc_io_mask, state)
+        Yukon.__selected_address = None
 
     def __select_address(self, address):
         if address < 0:
             raise ValueError("address is less than zero")
         elif address > 0b1111:
             raise ValueError("address is greater than number of available addresses")
-        else:
+        elif address != Yukon.__selected_address:
             state = 0x0000
 
             if address & 0b0001 > 0:
@@ -584,6 +643,8 @@ class Yukon:
                 state |= self.__adc_io_ens_addrs[1]
 
             tca.change_output_mask(self.__adc_io_chip, self.__adc_io_mask, state)
+            Yukon.__selected_address = address
+            Yukon.__mux_switches += 1
 
     def __shared_adc_u16(self, samples=1):
         val = 0
@@ -618,82 +679,238 @@ class Yukon:
         self.__select_address(slot.ADC2_THERM_ADDR)
         return self.__shared_adc_voltage(samples)
 
+    def __channel_address(self, channel):
+        if channel == "Vi":
+            return self.VOLTAGE_IN_SENSE_ADDR
+        if channel == "Vo":
+            return self.VOLTAGE_OUT_SENSE_ADDR
+        if channel == "C":
+            return self.CURRENT_SENSE_ADDR
+        if channel == "T":
+            return self.TEMP_SENSE_ADDR
+        if isinstance(channel, tuple) and len(channel) == 2:
+            slot = self.__check_slot(channel[0])
+            if channel[1] == 1:
+                return slot.ADC1_ADDR
+            if channel[1] == 2:
+                return slot.ADC2_THERM_ADDR
+        raise ValueError(f"{channel} is not a valid channel. Expected 'Vi', 'Vo', 'C', 'T', or (slot, 1) or (slot, 2) for a slot's ADC")
+
+    def __read_channel(self, channel, address, samples):
+        self.__select_address(address)
+        if channel == "Vi":
+            return u16_to_voltage_in(self.__shared_adc_u16(samples))
+        if channel == "Vo":
+            return u16_to_voltage_out(self.__shared_adc_u16(samples))
+        if channel == "C":
+            return u16_to_current(self.__shared_adc_u16(samples))
+        if channel == "T":
+            return analog_to_temp(self.__shared_adc_voltage(samples))
+        return self.__shared_adc_voltage(samples)
+
+    def read_channels(self, channels, samples=1):
+        # Read several channels in one call, returning their values in the order given. Channels are 'Vi', 'Vo', 'C', 'T',
+        # or (slot, 1) and (slot, 2) for a slot's ADC1 and ADC2. The reads are reordered so that the already selected
+        # address goes first and channels sharing an address are read together, so the mux switches as little as possible
+        addresses = [self.__channel_address(channel) for channel in channels]
+        order = sorted(range(len(channels)), key=lambda i: (addresses[i] != Yukon.__selected_address, addresses[i]))
+
+        values = [None] * len(channels)
+        for i in order:
+            values[i] = self.__read_channel(channels[i], addresses[i], samples)
+        return values
+
     def assign_monitor_action(self, callback_function):
-        if not None and not callable(callback_function):
+        if callback_function is not None and not callable(callback_function):
             raise TypeError("callback is not callable or None")
 
         self.__monitor_action_callback = callback_function
 
-    def monitor(self, under_voltage_counter=UNDERVOLTAGE_COUNT_LIMIT):
-        voltage_in = self.read_input_voltage()
+    def attach_recorder(self, recorder):
+        # Record every sample monitor() takes into a TelemetryRecorder, along with those of the initialised modules,
+        # keeping a history that clear_readings() does not wipe. A fault stops the recording, so the lead up to it is kept
+        self.__record_channel = recorder.add_channels("", self.RECORD_NAMES)
+        for module in self.__slot_assignments.values():
+            if module is not None and module.is_initialised():
+                module.attach_recorder(recorder)
+        self.__recorder = recorder
 
-        # Over Voltage
-        if voltage_in > self.__voltage_limit:  # User limit cannot be beyond the absolute max, so this check is fine
-            self.disable_main_output()
-            if voltage_in > self.ABSOLUTE_MAX_VOLTAGE_LIMIT:
-                raise OverVoltageError(f"[Yukon] Input voltage of {voltage_in}V exceeded the maximum of {self.ABSOLUTE_MAX_VOLTAGE_LIMIT}V! Turning off output")
+    def detach_recorder(self):
+        self.__recorder = None
+        for module in self.__slot_assignments.values():
+            if module is not None:
+                module.detach_recorder()
+
+    def set_monitor_intervals(self, voltage_in=0, voltage_out=0, current=0, temperature=0, modules=0, round_robin=False):
+        # Set how often, in milliseconds, monitor() samples each channel. A channel with an interval of 0 is sampled on
+        # every call, as is the default. With round_robin, each modules sample monitors the next registered module,
+        # rather than all of them. Limits are still checked on every sample taken
+        intervals = (voltage_in, voltage_out, current, temperature, modules)
+        for interval in intervals:
+            if interval < 0:
+                raise ValueError("interval out of range. Expected 0 or greater")
+
+        now = ticks_ms()
+        for channel in range(self.NUM_MONITOR_CHANNELS):
+            self.__monitor_intervals[channel] = int(intervals[channel])
+            self.__monitor_next_ms[channel] = now   # Sample everything on the next call
+        self.__monitor_round_robin = round_robin
+        self.__module_index = 0
+
+    def __sample_due(self, channel, now, force):
+        interval = self.__monitor_intervals[channel]
+        if interval > 0 and not force:
+            if ticks_diff(now, self.__monitor_next_ms[channel]) < 0:
+                return False
+            self.__monitor_next_ms[channel] = ticks_add(now, interval)
+        self.__monitor_samples[channel] += 1
+        return True
+
+    def __idle_ms(self, now):
+        # How long until a channel is next due to be sampled
+        idle_ms = None
+        for channel in range(self.NUM_MONITOR_CHANNELS):
+            if self.__monitor_intervals[channel] == 0:
+                return 0
+            due_ms = ticks_diff(self.__monitor_next_ms[channel], now)
+            if idle_ms is None or due_ms < idle_ms:
+                idle_ms = due_ms
+        return max(idle_ms, 0)
+
+    def monitor(self, under_voltage_counter=UNDERVOLTAGE_COUNT_LIMIT, force=False):
+        # Sample the channels that are due, or every channel if forced
+        try:
+            self.__monitor(under_voltage_counter, force)
+        except Exception:
+            if self.__recorder is not None:
+                self.__recorder.trip()
+            raise
+
+    def __monitor(self, under_voltage_counter=UNDERVOLTAGE_COUNT_LIMIT, force=False):
+        start_us = ticks_us()
+        now = ticks_ms()
+        recorder = self.__recorder
+
+        if self.__sample_due(self.MONITOR_VOLTAGE_IN, now, force):
+            voltage_in = self.read_input_voltage()
+            if recorder is not None:
+                recorder.record(self.__record_channel + self.MONITOR_VOLTAGE_IN, voltage_in)
+
+            # Over Voltage
+            if voltage_in > self.__voltage_limit:  # User limit cannot be beyond the absolute max, so this check is fine
+                self.disable_main_output()
+                if voltage_in > self.ABSOLUTE_MAX_VOLTAGE_LIMIT:
+                    raise OverVoltageError(f"[Yukon] Input voltage of {voltage_in}V exceeded the maximum of {self.ABSOLUTE_MAX_VOLTAGE_LIMIT}V! Turning off output")
+                else:
+                    raise OverVoltageError(f"[Yukon] Input voltage of {voltage_in}V exceeded the user set limit of {self.__voltage_limit}V! Turning off output")
+
+            # Under Voltage
+            if voltage_in < self.VOLTAGE_LOWER_LIMIT:
+                self.__undervoltage_count += 1
+                if self.__undervoltage_count > under_voltage_counter or voltage_in < self.VOLTAGE_SHORT_LEVEL:
+                    self.disable_main_output()
+                    raise UnderVoltageError(f"[Yukon] Input voltage of {voltage_in}V below minimum operating level of {self.VOLTAGE_LOWER_LIMIT}V. Turning off output")
             else:
-                raise OverVoltageError(f"[Yukon] Input voltage of {voltage_in}V exceeded the user set limit of {self.__voltage_limit}V! Turning off output")
+                self.__undervoltage_count = 0
+
+            self.__voltage_in_stats.add(voltage_in)
+            self.__last_voltage_in = voltage_in
+
+        voltage_in = self.__last_voltage_in
+
+        if self.__sample_due(self.MONITOR_VOLTAGE_OUT, now, force):
+            voltage_out = self.read_output_voltage()
+            if recorder is not None:
+                recorder.record(self.__record_channel + self.MONITOR_VOLTAGE_OUT, voltage_out)
+
+            # Only check the output voltage if the main output is enabled
+            if self.is_main_output_enabled():
+                # Short Circuit
+                if voltage_out < self.VOLTAGE_SHORT_LEVEL and voltage_in >= self.VOLTAGE_LOWER_LIMIT:
+                    self.disable_main_output()
+                    raise FaultError(f"[Yukon] Possible short circuit! Output voltage was {voltage_out}V whilst the input voltage was {voltage_in}V. Turning off output")
+
+            self.__voltage_out_stats.add(voltage_out)
+            self.__last_voltage_out = voltage_out
 
-        # Under Voltage
-        if voltage_in < self.VOLTAGE_LOWER_LIMIT:
-            self.__undervoltage_count += 1
-            if self.__undervoltage_count > under_voltage_counter or voltage_in < self.VOLTAGE_SHORT_LEVEL:
+        voltage_out = self.__last_voltage_out
+
+        if self.__sample_due(self.MONITOR_CURRENT, now, force):
+            # Over Current
+            current = self.read_current()
+            if recorder is not None:
+                recorder.record(self.__record_channel + self.MONITOR_CURRENT, current)
+            if current > self.__current_limit:
                 self.disable_main_output()
-                raise UnderVoltageError(f"[Yukon] Input voltage of {voltage_in}V below minimum operating level of {self.VOLTAGE_LOWER_LIMIT}V. Turning off output")
-        else:
-            self.__undervoltage_count = 0
+                raise OverCurrentError(f"[Yukon] Current of {current}A exceeded the user set limit of {self.__current_limit}A! Turning off output")
 
-        voltage_out = self.read_output_voltage()
+            self.__current_stats.add(current)
+            self.__last_current = current
 
-        # Only check the output voltage if the main output is enabled
-        if self.is_main_output_enabled():
-            # Short Circuit
-            if voltage_out < self.VOLTAGE_SHORT_LEVEL and voltage_in >= self.VOLTAGE_LOWER_LIMIT:
+        current = self.__last_current
+
+        if self.__sample_due(self.MONITOR_TEMPERATURE, now, force):
+            # Over Temperature
+            temperature = self.read_temperature()
+            if recorder is not None:
+                recorder.record(self.__record_channel + self.MONITOR_TEMPERATURE, temperature)
+            if temperature > self.__temperature_limit:
                 self.disable_main_output()
-                raise FaultError(f"[Yukon] Possible short circuit! Output voltage was {voltage_out}V whilst the input voltage was {voltage_in}V. Turning off output")
+                raise OverTemperatureError(f"[Yukon] Temperature of {temperature}°C exceeded the user set limit of {self.__temperature_limit}°C! Turning off output")
 
-        # Over Current
-        current = self.read_current()
-        if current > self.__current_limit:
-            self.disable_main_output()
-            raise OverCurrentError(f"[Yukon] Current of {current}A exceeded the user set limit of {self.__current_limit}A! Turning off output")
+            self.__temperature_stats.add(temperature)
+            self.__last_temperature = temperature
 
-        # Over Temperature
-        temperature = self.read_temperature()
-        if temperature > self.__temperature_limit:
-            self.disable_main_output()
-            raise OverTemperatureError(f"[Yukon] Temperature of {temperature}°C exceeded the user set limit of {self.__temperature_limit}°C! Turning off output")
+        temperature = self.__last_temperature
 
         # Run some user action based on the latest readings
         if self.__monitor_action_callback is not None:
             self.__monitor_action_callback(voltage_in, voltage_out, current, temperature)
 
-        for module in self.__slot_assignments.values():
-            if module is not None:
+        if self.__sample_due(self.MONITOR_MODULES, now, force):
+            modules = self.__monitored_modules
+            if self.__monitor_round_robin and not force:
+                if len(modules) > 0:
+                    self.__module_index %= len(modules)
+                    modules = (modules[self.__module_index],)
+                    self.__module_index += 1
+
+            for module in modules:
                 try:
                     module.monitor()
                 except Exception:
                     self.disable_main_output()
                     raise  # Now the output is off, let the exception continue into user code
 
-        self.__max_voltage_in = max(voltage_in, self.__max_voltage_in)
-        self.__min_voltage_in = min(voltage_in, self.__min_voltage_in)
-        self.__avg_voltage_in += voltage_in
-
-        self.__max_voltage_out = max(voltage_out, self.__max_voltage_out)
-        self.__min_voltage_out = min(voltage_out, self.__min_voltage_out)
-        self.__avg_voltage_out += voltage_out
-
-        self.__max_current = max(current, self.__max_current)
-        self.__min_current = min(current, self.__min_current)
-        self.__avg_current += current
-
-        self.__max_temperature = max(temperature, self.__max_temperature)
-        self.__min_temperature = min(temperature, self.__min_temperature)
-        self.__avg_temperature += temperature
+        self.__monitor_calls += 1
+        self.__monitor_busy_us += ticks_diff(ticks_us(), start_us)
+
+    def reset_monitor_stats(self):
+        self.__monitor_calls = 0
+        self.__monitor_busy_us = 0
+        self.__monitor_samples = [0] * self.NUM_MONITOR_CHANNELS
+        self.__monitor_mux_base = Yukon.__mux_switches
+        self.__monitor_stats_start_ms = ticks_ms()
+
+    def get_monitor_stats(self):
+        # The throughput of monitor() since the stats were last reset, and the share of time it kept the processor busy
+        elapsed_s = max(ticks_diff(ticks_ms(), self.__monitor_stats_start_ms), 1) / 1000
+        calls = self.__monitor_calls
+        samples = self.__monitor_samples
+        return OrderedDict({
+            "calls_per_s": calls / elapsed_s,
+            "busy_us_avg": self.__monitor_busy_us / calls if calls > 0 else 0,
+            "busy_percent": self.__monitor_busy_us / (elapsed_s * 10000),
+            "Vi_per_s": samples[self.MONITOR_VOLTAGE_IN] / elapsed_s,
+            "Vo_per_s": samples[self.MONITOR_VOLTAGE_OUT] / elapsed_s,
+            "C_per_s": samples[self.MONITOR_CURRENT] / elapsed_s,
+            "T_per_s": samples[self.MONITOR_TEMPERATURE] / elapsed_s,
+            "M_per_s": samples[self.MONITOR_MODULES] / elapsed_s,
+            "mux_per_s": (Yukon.__mux_switches - self.__monitor_mux_base) / elapsed_s
+        })
 
-        self.__count_avg += 1
+    def print_monitor_stats(self):
+        print(logging.format_dict("[Yukon]", self.get_monitor_stats(), None, None))
 
     def monitored_sleep(self, seconds, allowed=None, excluded=None, include_modules=True):
         # Convert and handle the sleep as milliseconds
@@ -704,7 +921,8 @@ class Yukon:
             raise ValueError("sleep length must be non-negative")
 
         # Calculate the time this sleep should end at, and monitor until then
-        self.monitor_until_ms(ticks_add(ticks_ms(), int(ms)), allowed, excluded, include_modules)
+        with spans.step("sleep"):
+            self.monitor_until_ms(ticks_add(ticks_ms(), int(ms)), allowed, excluded, include_modules)
 
     def monitor_until_ms(self, end_ms, allowed=None, excluded=None, include_modules=True):
         if end_ms < 0:
@@ -717,8 +935,12 @@ class Yukon:
         self.monitor()
         remaining_ms = ticks_diff(end_ms, ticks_ms())
 
-        # Perform any subsequent monitors until the end time is reached
+        # Perform any subsequent monitors until the end time is reached, sleeping
+        # whenever no channel is due, so the time goes to other work instead
         while remaining_ms > 0:
+            idle_ms = min(self.__idle_ms(ticks_ms()), remaining_ms)
+            if idle_ms > 0:
+                time.sleep_ms(idle_ms)
             self.monitor()
             remaining_ms = ticks_diff(end_ms, ticks_ms())
 
@@ -726,81 +948,119 @@ class Yukon:
         self.process_readings()
 
         if logging.level >= logging.LOG_DEBUG:
-            self.print_readings(allowed, excluded, include_modules)
+            self.__log_readings(allowed, excluded, include_modules)
 
     def monitor_once(self, allowed=None, excluded=None, include_modules=True):
         # Clear any readings from previous monitoring attempts
         self.clear_readings()
 
-        # Perform a single monitoring check
-        self.monitor(under_voltage_counter=0)
+        # Perform a single monitoring check of every channel
+        self.monitor(under_voltage_counter=0, force=True)
 
         # Process any readings that need it (e.g. averages)
         self.process_readings()
 
         if logging.level >= logging.LOG_DEBUG:
-            self.print_readings(allowed, excluded, include_modules)
+            self.__log_readings(allowed, excluded, include_modules)
 
     def get_readings(self):
+        voltage_in, voltage_out = self.__voltage_in_stats, self.__voltage_out_stats
+        current, temperature = self.__current_stats, self.__temperature_stats
         return OrderedDict({
-            "Vi_max": self.__max_voltage_in,
-            "Vi_min": self.__min_voltage_in,
-            "Vi_avg": self.__avg_voltage_in,
-            "Vo_max": self.__max_voltage_out,
-            "Vo_min": self.__min_voltage_out,
-            "Vo_avg": self.__avg_voltage_out,
-            "C_max": self.__max_current,
-            "C_min": self.__min_current,
-            "C_avg": self.__avg_current,
-            "T_max": self.__max_temperature,
-            "T_min": self.__min_temperature,
-            "T_avg": self.__avg_temperature
+            "Vi_max": voltage_in.max(),
+            "Vi_min": voltage_in.min(),
+            "Vi_avg": voltage_in.mean(),
+            "Vo_max": voltage_out.max(),
+            "Vo_min": voltage_out.min(),
+            "Vo_avg": voltage_out.mean(),
+            "C_max": current.max(),
+            "C_min": current.min(),
+            "C_avg": current.mean(),
+            "T_max": temperature.max(),
+            "T_min": temperature.min(),
+            "T_avg": temperature.mean()
         })
 
-    def get_formatted_readings(self, allowed=None, excluded=None, include_modules=True):
-        text = logging.format_dict("[Yukon]", self.get_readings(), allowed, excluded)
+    def readings_into(self, buffer, index):
+        # Pack the readings into buffer as 4 byte floats from index onwards, in the order of READING_NAMES
+        for stats in self.__stats:
+            struct.pack_into("<fff", buffer, index * 4, stats.max(), stats.min(), stats.mean())
+            index += 3
+        return index
+
+    def get_stats(self, channel):
+        # The RunningStats of a MONITOR_ channel other than MONITOR_MODULES, for its variance, moving average or
+        # percentiles as well as its readings. Kept up to date by monitor() and cleared by clear_readings()
+        if channel < self.MONITOR_VOLTAGE_IN or channel > self.MONITOR_TEMPERATURE:
+            raise ValueError("channel out of range. Expected MONITOR_VOLTAGE_IN to MONITOR_TEMPERATURE")
+        return self.__stats[channel]
+
+    def __readings_formatter(self, allowed, excluded, include_modules):
+        # The formatter for these filters, with the readings collected into it. Filters are compared by identity, so
+        # pass the same lists each time to keep using the same formatter
+        formatter = self.__formatter
+        if formatter is None or allowed is not self.__formatter_allowed or excluded is not self.__formatter_excluded \
+                or include_modules != self.__formatter_modules:
+            sections = [("[Yukon]", self)]
+            if include_modules:
+                for module in self.__monitored_modules:
+                    sections.append((f"[Slot{module.slot.ID}]", module))
+            formatter = logging.ReadingsFormatter(sections, allowed, excluded)
+            self.__formatter = formatter
+            self.__formatter_allowed = allowed
+            self.__formatter_excluded = excluded
+            self.__formatter_modules = include_modules
+
+        formatter.collect()
+        return formatter
 
-        if include_modules:
-            for module in self.__slot_assignments.values():
-                if module is not None:
-                    text += module.get_formatted_readings(allowed, excluded)
-        return text
+    def get_formatted_readings(self, allowed=None, excluded=None, include_modules=True):
+        return self.__readings_formatter(allowed, excluded, include_modules).text()
 
     def print_readings(self, allowed=None, excluded=None, include_modules=True):
-        print(self.get_formatted_readings(allowed, excluded, include_modules))
+        # Written straight from the formatter's buffer, so printing does not allocate
+        self.__readings_formatter(allowed, excluded, include_modules).write(self.__output_stream())
+
+    def write_readings_frame(self, stream=None, allowed=None, excluded=None, include_modules=True):
+        # Write the readings as a binary frame, see logging.ReadingsFormatter, to stream or otherwise stdout
+        stream = stream if stream is not None else self.__output_stream()
+        self.__readings_formatter(allowed, excluded, include_modules).write_frame(stream, ticks_ms())
+
+    @staticmethod
+    def __output_stream():
+        # stdout's binary stream, as the formatter writes bytes. CPython buffers print()'s text ahead of it, so that goes first
+        if not logging.IS_MICROPYTHON:
+            sys.stdout.flush()
+        return sys.stdout.buffer
+
+    def __log_readings(self, allowed, excluded, include_modules):
+        if logging.readings_mode == logging.READINGS_FRAME:
+            self.write_readings_frame(None, allowed, excluded, include_modules)
+        else:
+            self.print_readings(allowed, excluded, include_modules)
 
     def process_readings(self):
-        if self.__count_avg > 0:
-            self.__avg_voltage_in /= self.__count_avg
-            self.__avg_voltage_out /= self.__count_avg
-            self.__avg_current /= self.__count_avg
-            self.__avg_temperature /= self.__count_avg
-            self.__count_avg = 0    # Clear the count to prevent process readings acting more than once
+        # Each channel's readings are kept up to date with every sample. A channel that was not
+        # due during the readings reports its last sample instead
+        self.__fill_from_last(self.__voltage_in_stats, self.__last_voltage_in)
+        self.__fill_from_last(self.__voltage_out_stats, self.__last_voltage_out)
+        self.__fill_from_last(self.__current_stats, self.__last_current)
+        self.__fill_from_last(self.__temperature_stats, self.__last_temperature)
 
         for module in self.__slot_assignments.values():
             if module is not None:
                 module.process_readings()
 
+    @staticmethod
+    def __fill_from_last(stats, last):
+        if stats.count() == 0 and last is not None:
+            stats.add(last)
+
     def __clear_counts_and_readings(self):
         self.__undervoltage_count = 0
 
-        self.__max_voltage_in = float('-inf')
-        self.__min_voltage_in = float('inf')
-        self.__avg_voltage_in = 0
-
-        self.__max_voltage_out = float('-inf')
-        self.__min_voltage_out = float('inf')
-        self.__avg_voltage_out = 0
-
-        self.__max_current = float('-inf')
-        self.__min_current = float('inf')
-        self.__avg_current = 0
-
-        self.__max_temperature = float('-inf')
-        self.__min_temperature = float('inf')
-        self.__avg_temperature = 0
-
-        self.__count_avg = 0
+        for stats in self.__stats:
+            stats.clear()
 
     def clear_readings(self):
         self.__clear_counts_and_readings()
@@ -0,0 +1,142 @@
+# SPDX-License-Identifier: MIT
+
+import math
+from array import array
+
+"""
+Step interval profiles for accelerated stepper moves.
+Only the acceleration ramp is stored, as the cruise is a single interval and the deceleration is the ramp in reverse.
+Nothing here depends on machine, so profiles can be generated and checked on a host computer.
+"""
+
+TRAPEZOID = 0
+S_CURVE = 1
+
+US_PER_S = 1000000
+
+
+class MotionProfile:
+    DEFAULT_CAPACITY = 512
+    NEWTON_ITERATIONS = 4
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        if capacity < 1:
+            raise ValueError("capacity out of range. Expected 1 or greater")
+
+        self.capacity = capacity
+        self.ramp = array('L', [0] * capacity)  # Interval in microseconds before each step of the ramp
+        self.ramp_steps = 0
+        self.cruise_interval = 0
+        self.steps = 0
+        self.peak_rate = 0.0
+
+    def plan(self, steps, max_rate, acceleration, start_rate=0.0, curve=TRAPEZOID):
+        # Plan a move of the given number of steps. Rates are in steps per second, and acceleration
+        # in steps per second squared. If the move is too short to reach max_rate then the peak rate
+        # is lowered to suit. Raises ValueError if the ramp would not fit in the profile, rather than
+        # running the move slower than asked. Returns the peak rate reached
+        steps = abs(int(steps))
+        if max_rate <= 0.0:
+            raise ValueError("max_rate out of range. Expected greater than 0.0")
+        if acceleration <= 0.0:
+            raise ValueError("acceleration out of range. Expected greater than 0.0")
+        if curve not in (TRAPEZOID, S_CURVE):
+            raise ValueError("curve out of range. Expected TRAPEZOID or S_CURVE")
+
+        start_rate = min(max(start_rate, 0.0), max_rate)
+        if steps == 0:
+            self.steps = 0
+            self.ramp_steps = 0
+            self.cruise_interval = 0
+            self.peak_rate = 0.0
+            return 0.0
+
+        # Distance over which the ramp can run, limited by half the move
+        ramp_limit = steps // 2
+        if curve == TRAPEZOID:
+            peak_rate = min(max_rate, math.sqrt(start_rate * start_rate + 2.0 * acceleration * ramp_limit))
+            ramp_length = (peak_rate * peak_rate - start_rate * start_rate) / (2.0 * acceleration)
+        else:
+            # An S-curve ramp covers 1.5x the distance of a trapezoid ramp with the same peak acceleration
+            peak_rate = min(max_rate, math.sqrt(start_rate * start_rate + (acceleration * ramp_limit) / 0.75))
+            ramp_length = 0.75 * (peak_rate * peak_rate - start_rate * start_rate) / acceleration
+        if int(ramp_length) > self.capacity:
+            raise ValueError(f"move needs a ramp of {int(ramp_length)} steps, more than the profile capacity of {self.capacity}. Lower max_rate, raise acceleration, or use a larger capacity")
+        self.steps = steps
+        self.ramp_steps = 0
+        peak_rate = max(peak_rate, start_rate)
+        if peak_rate <= 0.0:
+            # Too short to ramp from standstill, so take the single step at the rate one step of acceleration gives
+            peak_rate = min(max_rate, math.sqrt(2.0 * acceleration))
+
+        if peak_rate > start_rate:
+            if curve == TRAPEZOID:
+                self.__plan_trapezoid_ramp(start_rate, peak_rate, acceleration, ramp_limit)
+            else:
+                self.__plan_s_curve_ramp(start_rate, peak_rate, acceleration, ramp_limit)
+
+        self.cruise_interval = max(int(US_PER_S / peak_rate + 0.5), 1) if peak_rate > 0.0 else 0
+        self.peak_rate = peak_rate
+        return peak_rate
+
+    def __plan_trapezoid_ramp(self, start_rate, peak_rate, acceleration, ramp_limit):
+        # Constant acceleration: the time of step n is t = (sqrt(v0^2 + 2an) - v0) / a
+        ramp_steps = min(int((peak_rate * peak_rate - start_rate * start_rate) / (2.0 * acceleration)), ramp_limit)
+        ramp = self.ramp
+        last_time = 0.0
+        v0_sq = start_rate * start_rate
+        for n in range(ramp_steps):
+            time = (math.sqrt(v0_sq + 2.0 * acceleration * (n + 1)) - start_rate) / acceleration
+            ramp[n] = max(int((time - last_time) * US_PER_S + 0.5), 1)
+            last_time = time
+        self.ramp_steps = ramp_steps
+
+    def __plan_s_curve_ramp(self, start_rate, peak_rate, acceleration, ramp_limit):
+        # The rate follows a smoothstep from start_rate to peak_rate over time T, chosen so the
+        # acceleration peaks at the given value mid-ramp. Step times are found with Newton's method
+        rate_diff = peak_rate - start_rate
+        ramp_time = (1.5 * rate_diff) / acceleration
+        ramp_length = 0.5 * (start_rate + peak_rate) * ramp_time
+        ramp_steps = min(int(ramp_length), ramp_limit)
+
+        def position(t):
+            u = t / ramp_time
+            return start_rate * t + rate_diff * ramp_time * (u * u * u - 0.5 * u * u * u * u)
+
+        def rate(t):
+            u = t / ramp_time
+            return start_rate + rate_diff * (3.0 * u * u - 2.0 * u * u * u)
+
+        ramp = self.ramp
+        last_time = 0.0
+        for n in range(ramp_steps):
+            target = n + 1
+            if last_time == 0.0 and start_rate == 0.0:
+                # Near the start the position is close to cubic in time, which gives a good first guess
+                time = ramp_time * math.pow(target / (rate_diff * ramp_time), 1.0 / 3.0)
+            else:
+                time = last_time + 1.0 / rate(last_time)
+            for _ in range(self.NEWTON_ITERATIONS):
+                v = rate(time)
+                if v <= 0.0:
+                    break
+                time -= (position(time) - target) / v
+                time = min(max(time, last_time), ramp_time)
+            ramp[n] = max(int((time - last_time) * US_PER_S + 0.5), 1)
+            last_time = time
+        self.ramp_steps = ramp_steps
+
+    def interval(self, index):
+        # The interval in microseconds before the step at the given index of the move
+        if index < self.ramp_steps:
+            return self.ramp[index]
+        remaining = self.steps - 1 - index
+        if remaining < self.ramp_steps:
+            return self.ramp[remaining]
+        return self.cruise_interval
+
+    def duration_us(self):
+        ramp_total = 0
+        for i in range(self.ramp_steps):
+            ramp_total += self.ramp[i]
+        return 2 * ramp_total + (self.steps - 2 * self.ramp_steps) * self.cruise_interval
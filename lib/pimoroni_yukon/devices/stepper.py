@@ -3,12 +3,24 @@
 # SPDX-License-Identifier: MIT
 
 import math
-from machine import Timer, Pin
+from array import array
+from asyncio import ThreadSafeFlag
+from time import sleep_ms
+from machine import Timer, Pin, disable_irq, enable_irq
+from pimoroni_yukon.errors import TimeoutError
+from pimoroni_yukon.timing import ticks_ms, ticks_us, ticks_add, ticks_diff
+from pimoroni_yukon.stats import LogHistogram
+from pimoroni_yukon.devices.motion_profile import MotionProfile, TRAPEZOID
 
 """
 A timer-based class for driving a stepper motor.
 There are likely to be many quirks and missing features of this class, that make it just "okay", hence the name.
 The hope is to improve on this based on user feedback, and port it to a C++ module to improve performance.
+
+Whilst enable_timing() is on, each microstep callback records the interval since the one before and how long it took to
+run into LogHistograms, and counts the microsteps that came late against the period they were due after. This shows
+the step rate that holds up whilst the monitor, I2C traffic and garbage collection compete for the processor, without
+a scope on debug_pin. It costs a few microseconds per microstep, so is off by default.
 """
 
 
@@ -19,7 +31,15 @@ class OkayStepper:
     STEP_PHASES = 4
     DEFAULT_MICROSTEPS = 8
 
-    def __init__(self, motor_a, motor_b, alt_motor_a=None, alt_motor_b=None, steps_per_unit=1.0, current_scale=DEFAULT_CURRENT_SCALE, microsteps=DEFAULT_MICROSTEPS, debug_pin=None):
+    WAIT_POLL_MS = 1
+
+    DEFAULT_QUEUE_CAPACITY = 16
+    MAX_QUEUE_RATE = 32767      # Microsteps per second, so the rate squared stays a small int and never allocates
+
+    LATE_SHIFT = 2              # A microstep is late if it comes over a quarter (1 >> 2) of its period after it was due
+
+    def __init__(self, motor_a, motor_b, alt_motor_a=None, alt_motor_b=None, steps_per_unit=1.0, current_scale=DEFAULT_CURRENT_SCALE, microsteps=DEFAULT_MICROSTEPS, debug_pin=None,
+                 profile_capacity=MotionProfile.DEFAULT_CAPACITY, queue_capacity=DEFAULT_QUEUE_CAPACITY):
         self.__motor_a = motor_a
         self.__motor_b = motor_b
         self.__alt_motor_a = alt_motor_a
@@ -30,10 +50,67 @@ class OkayStepper:
             self.__debug_pin.init(Pin.OUT)
 
         self.__moving = False
+        self.__continuous = False
         self.__current_microstep = 0
         self.__end_microstep = 0
 
         self.__step_timer = Timer()
+        self.__step_rate = None     # (period, tick_hz, forward) of the periodic stepping, whilst it is running
+
+        # Set from the timer callbacks whenever a move ends, so waiters can sleep or await rather than spin
+        self.__move_done = ThreadSafeFlag()
+
+        # Accelerated moves walk a preallocated profile, so the callback is bound once here to avoid allocating per step
+        self.__profile = MotionProfile(profile_capacity)
+        self.__profile_index = 0
+        self.__profile_direction = 1
+        self.__profile_callback = self.__profile_microstep
+
+        # Queued moves are held in a ring of preallocated arrays. Only the queueing methods advance the pushed
+        # count and only the timer callback advances the popped count. The callback can still pop the last segment and
+        # stop between queue_by_steps() checking the queue is running and pushing onto it, so that check and push are
+        # made with interrupts disabled
+        if queue_capacity < 1:
+            raise ValueError("queue_capacity out of range. Expected 1 or greater")
+        self.__queue_capacity = queue_capacity
+        self.__queue_steps = array('l', [0] * queue_capacity)      # Signed microsteps of each segment
+        self.__queue_cruise = array('l', [0] * queue_capacity)     # Max rate of each segment, squared
+        self.__queue_two_a = array('l', [0] * queue_capacity)      # Twice the acceleration of each segment
+        self.__queue_pushed = 0
+        self.__queue_popped = 0
+        self.__queue_running = False
+        self.__queue_callback = self.__queue_microstep
+        self.__segment_left = 0         # Microsteps left in the segment being stepped
+        self.__segment_direction = 1
+        self.__segment_cruise = 0
+        self.__segment_two_a = 0
+        self.__exit_rate_sq = 0         # The fastest the segment can end, and still slow for those after it
+        self.__exit_open = False        # True if the segment ends the queue, rather than a change of direction
+        self.__reach = 0                # Microsteps from the segment end beyond which the exit does not limit the rate
+        self.__replan = False           # Set when a segment is queued, so the exit is worked out again
+        self.__rate_sq = 0              # The step rate in microsteps per second, squared
+        self.__rate = 0
+        self.__draining = False         # True whilst slowing down only because the queue is running out
+        self.underruns = 0              # Segments queued too late to carry on at speed from the one before
+
+        # An input (such as an endstop) latched by a hard interrupt. The interrupt only notes the microstep and
+        # asks for a halt, which the next timer callback carries out. Accelerated and queued moves then slow to a stop
+        # at their own acceleration, and other moves stop within a microstep of the edge
+        self.__latch_pin = None
+        self.__latch_callback = self.__latch_edge
+        self.__latched = False
+        self.__latch_microstep = 0
+        self.__halt = False
+
+        # The timing of the microstep callbacks, for enable_timing(). Preallocated, as the callbacks must not allocate
+        self.__timing = False
+        self.__interval_us = LogHistogram()
+        self.__callback_us = LogHistogram()
+        self.__expected_us = 1          # The period the next microstep is due after
+        self.__last_step_us = 0
+        self.late_steps = 0             # Microsteps that came over a quarter of a period late
+        self.missed_steps = 0           # Whole periods that went by without a microstep, as a callback came so late
+        self.overruns = 0               # Callbacks that took longer to run than the period to the next microstep
 
         current_scale = max(min(current_scale, 1.0), 0.0)
 
@@ -64,6 +141,8 @@ class OkayStepper:
 
     def release(self):
         self.__step_timer.deinit()
+        self.__step_rate = None
+        self.__clear_queue()
         self.__motor_a.disable()
         self.__motor_b.disable()
         if self.__alt_motor_a is not None:
@@ -73,43 +152,94 @@ class OkayStepper:
             
     def stop(self):
         self.__step_timer.deinit()
+        self.__step_rate = None
+        self.__clear_queue()
+        self.__halt = False
         self.hold()
         self.__moving = False
+        self.__move_done.set()
+        self.__continuous = False
+
+    def slow_to_stop(self):
+        # Ask the next microstep to slow the move to a stop, rather than stopping dead as stop() does. Accelerated and
+        # queued moves slow at their own acceleration, dropping any moves queued after. Others stop within a microstep
+        if self.__moving:
+            self.__halt = True
 
     def is_moving(self):
         return self.__moving
 
-    def wait_for_move(self):
+    def wait_for_move(self, timeout=None, monitor=None):
+        # Wait for the current move to finish, sleeping between polls. If a monitor (such as a Yukon) is given,
+        # its monitor() is called at each poll, sampling whichever channels are due. Should the timeout (in seconds)
+        # elapse, or the monitor raise, the stepper is stopped before the error is passed on
+        if timeout is not None:
+            end_ms = ticks_add(ticks_ms(), int(timeout * 1000))
+
         while self.__moving:
-            pass
+            if timeout is not None and ticks_diff(end_ms, ticks_ms()) <= 0:
+                self.stop()
+                raise TimeoutError(f"Move did not complete within {timeout}s")
+
+            if monitor is not None:
+                try:
+                    monitor.monitor()
+                except Exception:
+                    self.stop()
+                    raise
+            sleep_ms(self.WAIT_POLL_MS)
+
+    async def wait_for_move_async(self):
+        while self.__moving:
+            await self.__move_done.wait()
 
     def __increase_microstep(self, timer):
+        if self.__halt:
+            self.__halt_stepping(timer)
+            return
+
         if self.__debug_pin is not None:
             self.__debug_pin.on()
+        timing = self.__timing
+        if timing:
+            start_us = self.__time_step()
 
         self.__current_microstep += 1
-        if self.__current_microstep < self.__end_microstep:
+        if self.__continuous or self.__current_microstep < self.__end_microstep:
             self.__set_duties(self.__step_table)
         else:
             timer.deinit()
             self.hold()
             self.__moving = False
+            self.__move_done.set()
 
+        if timing:
+            self.__time_callback(start_us)
         if self.__debug_pin is not None:
             self.__debug_pin.off()
 
     def __decrease_microstep(self, timer):
+        if self.__halt:
+            self.__halt_stepping(timer)
+            return
+
         if self.__debug_pin is not None:
             self.__debug_pin.on()
+        timing = self.__timing
+        if timing:
+            start_us = self.__time_step()
 
         self.__current_microstep -= 1
-        if self.__current_microstep > self.__end_microstep:
+        if self.__continuous or self.__current_microstep > self.__end_microstep:
             self.__set_duties(self.__step_table)
         else:
             timer.deinit()
             self.hold()
             self.__moving = False
+            self.__move_done.set()
 
+        if timing:
+            self.__time_callback(start_us)
         if self.__debug_pin is not None:
             self.__debug_pin.off()
 
@@ -120,39 +250,266 @@ class OkayStepper:
         timer.deinit()
         self.hold()
         self.__moving = False
+        self.__move_done.set()
+
+        if self.__debug_pin is not None:
+            self.__debug_pin.off()
+
+    def __profile_microstep(self, timer):
+        if self.__halt:
+            self.__halt = False
+            self.__slow_profile()
+
+        if self.__debug_pin is not None:
+            self.__debug_pin.on()
+        timing = self.__timing
+        if timing:
+            start_us = self.__time_step()
+
+        self.__current_microstep += self.__profile_direction
+        self.__profile_index += 1
+        if self.__profile_index < self.__profile.steps:
+            self.__set_duties(self.__step_table)
+            interval = self.__profile.interval(self.__profile_index)
+            self.__expected_us = interval
+            timer.init(mode=Timer.ONE_SHOT, period=interval, tick_hz=1000000, callback=self.__profile_callback)
+        else:
+            self.hold()
+            self.__moving = False
+            self.__move_done.set()
 
+        if timing:
+            self.__time_callback(start_us)
         if self.__debug_pin is not None:
             self.__debug_pin.off()
 
+    def __queue_microstep(self, timer):
+        if self.__halt:
+            self.__halt = False
+            self.__slow_queue()
+
+        if self.__debug_pin is not None:
+            self.__debug_pin.on()
+        timing = self.__timing
+        if timing:
+            start_us = self.__time_step()
+
+        self.__current_microstep += self.__segment_direction
+        self.__segment_left -= 1
+        if self.__segment_left <= 0:
+            self.__queue_popped += 1
+            self.__load_segment()
+
+        if self.__queue_running:
+            if self.__replan:
+                self.__plan_exit()
+            self.__set_duties(self.__step_table)
+            interval = self.__queue_interval()
+            self.__expected_us = interval
+            timer.init(mode=Timer.ONE_SHOT, period=interval, tick_hz=1000000, callback=self.__queue_callback)
+        else:
+            self.hold()
+            self.__moving = False
+            self.__move_done.set()
+
+        if timing:
+            self.__time_callback(start_us)
+        if self.__debug_pin is not None:
+            self.__debug_pin.off()
+
+    def __time_step(self):
+        # Called from the microstep callbacks whilst timing, so must not allocate. Records the interval since the last
+        # microstep against the period it was due after, and returns when this one started
+        now = ticks_us()
+        interval = ticks_diff(now, self.__last_step_us)
+        self.__last_step_us = now
+        self.__interval_us.add(interval)
+
+        expected = self.__expected_us
+        if interval > expected + (expected >> self.LATE_SHIFT):
+            self.late_steps += 1
+            if interval >= expected << 1:
+                self.missed_steps += interval // expected - 1
+        return now
+
+    def __time_callback(self, start_us):
+        # As __time_step(), at the end of the callback
+        duration = ticks_diff(ticks_us(), start_us)
+        self.__callback_us.add(duration)
+        if duration > self.__expected_us:
+            self.overruns += 1
+
+    def __start_timing(self, expected_us):
+        # Called as stepping starts, so the first microstep is timed from then rather than from the last move
+        self.__expected_us = max(int(expected_us), 1)
+        self.__last_step_us = ticks_us()
+
+    def __halt_stepping(self, timer):
+        # Stop where a latched input fired, called in place of taking the next microstep
+        timer.deinit()
+        self.__halt = False
+        self.__step_rate = None
+        self.__clear_queue()
+        self.hold()
+        self.__moving = False
+        self.__move_done.set()
+
+    def __slow_profile(self):
+        # Skip ahead to where the deceleration is at the rate being stepped now, so the move slows to a stop from here.
+        # One already decelerating carries on as it was
+        profile = self.__profile
+        index = profile.steps - 1 - min(self.__profile_index, profile.ramp_steps)
+        if index > self.__profile_index:
+            self.__profile_index = index
+
+    def __slow_queue(self):
+        # Drop the segments queued after the one being stepped, which is already loaded, and shorten that one to end
+        # as soon as it can slow to a stop. Only the popped count is moved, so the queueing methods are undisturbed
+        self.__queue_popped = self.__queue_pushed - 1
+        stopping = self.__rate_sq // self.__segment_two_a + 1
+        if self.__segment_left > stopping:
+            self.__segment_left = stopping
+        self.__replan = True
+
+    def __latch_edge(self, pin):
+        # Runs in a hard interrupt, so must not allocate. Only the first edge counts, and only whilst moving is it a halt
+        if not self.__latched:
+            self.__latch_microstep = self.__current_microstep
+            self.__latched = True
+            self.__halt = self.__moving
+
+    def __load_segment(self):
+        # Start stepping the segment at the head of the queue, if there is one
+        if self.__queue_pushed == self.__queue_popped:
+            self.__queue_running = False
+            self.__draining = False
+            return
+
+        i = self.__queue_popped % self.__queue_capacity
+        steps = self.__queue_steps[i]
+        self.__segment_direction = 1 if steps > 0 else -1
+        self.__segment_left = steps if steps > 0 else -steps
+        self.__segment_cruise = self.__queue_cruise[i]
+        self.__segment_two_a = self.__queue_two_a[i]
+        self.__replan = True
+
+    def __plan_exit(self):
+        # Look ahead through the segments queued after this one that carry on in the same direction. Working back
+        # from the last, each can be entered no faster than its max rate, nor faster than it can slow from in its
+        # length to the rate the one after it is entered at. A change of direction, or the end of the queue, is a stop
+        self.__replan = False
+        capacity = self.__queue_capacity
+        first = self.__queue_popped + 1
+        last = first
+        pushed = self.__queue_pushed
+        while last < pushed and (self.__queue_steps[last % capacity] > 0) == (self.__segment_direction > 0):
+            last += 1
+        self.__exit_open = last == pushed
+
+        exit_rate_sq = 0
+        while last > first:
+            last -= 1
+            i = last % capacity
+            steps = self.__queue_steps[i]
+            steps = steps if steps > 0 else -steps
+            cruise = self.__queue_cruise[i]
+            two_a = self.__queue_two_a[i]
+            if steps >= (cruise - exit_rate_sq) // two_a:     # Compared first, as the product could be a big int
+                exit_rate_sq = cruise
+            else:
+                exit_rate_sq += two_a * steps
+
+        exit_rate_sq = min(exit_rate_sq, self.__segment_cruise)
+        self.__exit_rate_sq = exit_rate_sq
+        self.__reach = (self.__segment_cruise - exit_rate_sq) // self.__segment_two_a + 1
+
+    def __queue_interval(self):
+        # Step the rate on by one microstep of constant acceleration (v^2 = u^2 + 2as), limited by the segment's max
+        # rate and by the rate it can still slow from to its exit. Returns the microseconds until the next microstep
+        two_a = self.__segment_two_a
+        rate_sq = self.__rate_sq + two_a
+        if rate_sq > self.__segment_cruise:
+            rate_sq = self.__segment_cruise
+
+        self.__draining = False
+        left = self.__segment_left - 1
+        if left < self.__reach:
+            limit = self.__exit_rate_sq + two_a * left
+            if rate_sq > limit:
+                rate_sq = limit
+                self.__draining = self.__exit_open
+        if rate_sq < two_a:
+            rate_sq = two_a
+        self.__rate_sq = rate_sq
+
+        # An integer square root, by Newton's method from the last rate, which is never far off. The first
+        # iteration lands at or above the root, and the rest come down to it
+        rate = self.__rate if self.__rate > 0 else rate_sq
+        rate = (rate + rate_sq // rate) >> 1
+        while True:
+            next_rate = (rate + rate_sq // rate) >> 1
+            if next_rate >= rate:
+                break
+            rate = next_rate
+        self.__rate = rate if rate > 0 else 1
+        return 1000000 // self.__rate
+
+    def __clear_queue(self):
+        self.__queue_popped = self.__queue_pushed
+        self.__queue_running = False
+        self.__draining = False
+        self.__rate_sq = 0
+        self.__rate = 0
+
+    def __start_stepping(self, period_per_step, tick_hz, forward):
+        while (period_per_step // 10) * 10 == period_per_step and tick_hz > 1000:
+            period_per_step //= 10
+            tick_hz //= 10
+
+        # Re-issuing a move at the rate already being stepped (e.g. extrude_while() called in a polling loop) leaves
+        # the timer running. Restarting it would delay the next microstep by a whole period, every time
+        rate = (period_per_step, tick_hz, forward)
+        self.__halt = False
+        if self.__moving and self.__step_rate == rate:
+            return
+
+        self.__step_rate = rate
+        self.__clear_queue()
+        self.__moving = True
+        self.__move_done.clear()
+        self.__start_timing((period_per_step * 1000000) // tick_hz)
+        self.__step_timer.init(mode=Timer.PERIODIC, period=period_per_step, tick_hz=tick_hz,
+                               callback=self.__increase_microstep if forward else self.__decrease_microstep)
+
     def __move_by(self, microstep_diff, duration, debug=False):
+        self.__continuous = False
         if microstep_diff != 0:
             self.__end_microstep = self.__current_microstep + microstep_diff
 
             tick_hz = 1000000
             period_per_step = int((duration * tick_hz) / abs(microstep_diff))
-            while (period_per_step // 10) * 10 == period_per_step and tick_hz > 1000:
-                period_per_step //= 10
-                tick_hz //= 10
 
             if debug:
                 print(f"> Moving from {self.__current_microstep / self.__microsteps} to {self.__end_microstep / self.__microsteps}, in {duration}s")
 
-            self.__moving = True
-            self.__step_timer.init(mode=Timer.PERIODIC, period=period_per_step, tick_hz=tick_hz,
-                                   callback=self.__increase_microstep if microstep_diff > 0 else self.__decrease_microstep)
+            self.__start_stepping(period_per_step, tick_hz, microstep_diff > 0)
         else:
             if debug:
                 print(f"> Idling at {self.__current_microstep / self.__microsteps} for {duration}s")
 
+            self.__step_timer.deinit()
+            self.__step_rate = None
+            self.__clear_queue()
+            self.__halt = False
             self.hold()
             self.__moving = True
+            self.__move_done.clear()
             self.__step_timer.init(mode=Timer.ONE_SHOT,
                                    period=int(duration * 1000),
                                    tick_hz=1000,
                                    callback=self.__hold_microstep)
 
     def move_to_step(self, step, duration, debug=False):
-        self.__step_timer.deinit()
         if duration <= 0.0:
             raise ValueError("duration out of range. Expected greater than 0.0")
 
@@ -160,13 +517,138 @@ class OkayStepper:
         self.__move_by(microstep_diff, duration, debug)
 
     def move_by_steps(self, steps, duration, debug=False):
-        self.__step_timer.deinit()
         if duration <= 0.0:
             raise ValueError("duration out of range. Expected greater than 0.0")
 
         microstep_diff = int(steps * self.__microsteps)
         self.__move_by(microstep_diff, duration, debug)
 
+    def __move_by_accel(self, microstep_diff, max_speed, acceleration, curve, debug=False):
+        # The timer is stopped before planning, as the profile may be the one it is stepping through. A move of nothing,
+        # or one that fails to plan, then stops the stepper, so nothing is left waiting on a timer that will not fire
+        self.__step_timer.deinit()
+        self.__continuous = False
+        if microstep_diff == 0:
+            self.stop()
+            return
+
+        try:
+            peak_rate = self.__profile.plan(microstep_diff, max_speed * self.__microsteps, acceleration * self.__microsteps, curve=curve)
+        except ValueError:
+            self.stop()
+            raise
+        self.__end_microstep = self.__current_microstep + microstep_diff
+        self.__profile_direction = 1 if microstep_diff > 0 else -1
+        self.__profile_index = 0
+
+        if debug:
+            print(f"> Moving from {self.__current_microstep / self.__microsteps} to {self.__end_microstep / self.__microsteps}, peaking at {peak_rate / self.__microsteps} steps/s, in {self.__profile.duration_us() / 1000000}s")
+
+        self.__step_rate = None
+        self.__clear_queue()
+        self.__halt = False
+        self.__moving = True
+        self.__move_done.clear()
+        interval = self.__profile.interval(0)
+        self.__start_timing(interval)
+        self.__step_timer.init(mode=Timer.ONE_SHOT, period=interval, tick_hz=1000000, callback=self.__profile_callback)
+
+    def move_to_step_accel(self, step, max_speed, acceleration, curve=TRAPEZOID, debug=False):
+        # Speeds are in steps per second, and acceleration in steps per second squared
+        microstep_diff = int(step * self.__microsteps) - self.__current_microstep
+        self.__move_by_accel(microstep_diff, max_speed, acceleration, curve, debug)
+
+    def move_by_steps_accel(self, steps, max_speed, acceleration, curve=TRAPEZOID, debug=False):
+        microstep_diff = int(steps * self.__microsteps)
+        self.__move_by_accel(microstep_diff, max_speed, acceleration, curve, debug)
+
+    def move_to_accel(self, unit, max_speed, acceleration, curve=TRAPEZOID, debug=False):
+        # Speeds are in units per second, and acceleration in units per second squared
+        self.move_to_step_accel(unit * self.__steps_per_unit, max_speed * self.__steps_per_unit, acceleration * self.__steps_per_unit, curve, debug)
+
+    def move_by_accel(self, units, max_speed, acceleration, curve=TRAPEZOID, debug=False):
+        self.move_by_steps_accel(units * self.__steps_per_unit, max_speed * self.__steps_per_unit, acceleration * self.__steps_per_unit, curve, debug)
+
+    def queue_by_steps(self, steps, max_speed, acceleration, debug=False):
+        # Queue a move to follow those already queued, without waiting. Speeds are in steps per second, and
+        # acceleration in steps per second squared. Consecutive moves in the same direction run on into each other at
+        # speed, slowing only as much as the moves queued after them need. Starts stepping if not already doing so,
+        # replacing any other kind of move. Returns False, queueing nothing, if the queue is full
+        microstep_diff = int(steps * self.__microsteps)
+        rate = max_speed * self.__microsteps
+        two_a = int(2 * acceleration * self.__microsteps)
+        if rate <= 0.0 or rate > self.MAX_QUEUE_RATE:
+            raise ValueError(f"max_speed out of range. Expected greater than 0.0 and up to {self.MAX_QUEUE_RATE / self.__microsteps}")
+        if two_a < 1:
+            raise ValueError("acceleration out of range. Expected greater than 0.0")
+        if microstep_diff == 0:
+            return True
+        if self.queue_space() == 0:
+            return False
+
+        i = self.__queue_pushed % self.__queue_capacity
+        self.__queue_steps[i] = microstep_diff
+        self.__queue_cruise[i] = int(rate * rate)
+        self.__queue_two_a[i] = two_a
+
+        irq_state = disable_irq()
+        running = self.__queue_running
+        if running:
+            if self.__draining:
+                # Already slowing to stop at the end of the queue, so this move starts from slower than it could have
+                self.underruns += 1
+            self.__queue_pushed += 1
+            self.__replan = True
+        enable_irq(irq_state)
+
+        if not running:
+            # The timer callback has stopped re-arming itself, so the queue can be restarted without locking it out
+            self.__step_timer.deinit()
+            self.__step_rate = None
+            self.__continuous = False
+            self.__clear_queue()
+            self.__halt = False
+            self.__queue_pushed += 1
+            self.__queue_running = True
+            self.__load_segment()
+            self.__plan_exit()
+            self.__moving = True
+            self.__move_done.clear()
+            interval = self.__queue_interval()
+            self.__start_timing(interval)
+            self.__step_timer.init(mode=Timer.ONE_SHOT, period=interval, tick_hz=1000000, callback=self.__queue_callback)
+
+        if debug:
+            print(f"> Queued {microstep_diff / self.__microsteps} steps at up to {max_speed} steps/s, {self.queue_depth()} queued")
+        return True
+
+    def queue_by(self, units, max_speed, acceleration, debug=False):
+        return self.queue_by_steps(units * self.__steps_per_unit, max_speed * self.__steps_per_unit, acceleration * self.__steps_per_unit, debug)
+
+    def queue_depth(self):
+        # The number of queued moves not yet finished, including the one being stepped
+        return self.__queue_pushed - self.__queue_popped
+
+    def queue_space(self):
+        return self.__queue_capacity - self.queue_depth()
+
+    def run_at_steps(self, steps_per_second, debug=False):
+        # Step continuously at the given rate until stopped. Calling this again whilst
+        # running changes the rate without stopping, so the position stays continuous
+        microsteps_per_second = steps_per_second * self.__microsteps
+        if abs(microsteps_per_second) < 1.0:
+            self.stop()
+            return
+
+        if debug:
+            print(f"> Running from {self.__current_microstep / self.__microsteps} at {steps_per_second} steps/s")
+
+        self.__continuous = True
+        self.__start_stepping(int(1000000 / abs(microsteps_per_second)), 1000000, microsteps_per_second > 0)
+
+    def run_at(self, units_per_second, debug=False):
+        self.run_at_steps(units_per_second * self.__steps_per_unit, debug)
+
     def move_to(self, unit, duration, debug=False):
         self.move_to_step(unit * self.__steps_per_unit, duration, debug)
 
@@ -187,6 +669,93 @@ class OkayStepper:
         step = unit * self.__steps_per_unit
         return self.step_diff(step) / self.__steps_per_unit
 
+    def latch_on(self, pin, trigger=Pin.IRQ_RISING):
+        # Stop stepping the moment pin sees the trigger edge, from a hard interrupt, rather than when a poll between
+        # moves next notices, slowing to a stop as slow_to_stop() does. The position of the edge is kept for
+        # latched_steps(). Fires once, then stays attached until clear_latch(), so the edges of a bouncing switch are
+        # ignored
+        self.clear_latch()
+        self.__latched = False
+        self.__halt = False
+        self.__latch_pin = pin
+        pin.irq(trigger=trigger, handler=self.__latch_callback, hard=True)
+
+    def clear_latch(self):
+        if self.__latch_pin is not None:
+            self.__latch_pin.irq(handler=None)
+            self.__latch_pin = None
+        self.__halt = False
+
+    def latched_steps(self):
+        # The position the latch fired at, or None if it has not fired since latch_on()
+        if not self.__latched:
+            return None
+        return self.__latch_microstep / self.__microsteps
+
     def zero_position(self):
         self.__current_microstep = 0
 
+    def enable_timing(self, clear=True):
+        # Start timing the microstep callbacks, from the next microstep
+        if clear:
+            self.clear_timing()
+        self.__last_step_us = ticks_us()
+        self.__timing = True
+
+    def disable_timing(self):
+        self.__timing = False
+
+    def is_timing(self):
+        return self.__timing
+
+    def clear_timing(self):
+        timing = self.__timing
+        self.__timing = False
+        self.__interval_us.clear()
+        self.__callback_us.clear()
+        self.late_steps = 0
+        self.missed_steps = 0
+        self.overruns = 0
+        self.__timing = timing
+
+    def get_interval_histogram(self):
+        # Microseconds between consecutive microsteps, including the first of each move from when it started
+        return self.__interval_us
+
+    def get_callback_histogram(self):
+        # Microseconds each microstep callback took to run
+        return self.__callback_us
+
+    def get_timing(self):
+        # A summary of the microstep timing since it was enabled or cleared. The max step rates are the fastest the
+        # callback could be called, at its mean and 99th percentile run time, were it to have the processor to itself
+        interval = self.__interval_us
+        callback = self.__callback_us
+        timing = {
+            "microsteps": interval.count(),
+            "late_steps": self.late_steps,
+            "missed_steps": self.missed_steps,
+            "overruns": self.overruns,
+            "interval_min_us": interval.min(),
+            "interval_mean_us": interval.mean(),
+            "interval_p99_us": interval.percentile(0.99),
+            "interval_max_us": interval.max(),
+            "callback_mean_us": callback.mean(),
+            "callback_p99_us": callback.percentile(0.99),
+            "callback_max_us": callback.max(),
+            "max_step_rate": None,
+            "max_step_rate_p99": None,
+        }
+        if callback.count() > 0:
+            timing["max_step_rate"] = 1000000 / max(callback.mean(), 1) / self.__microsteps
+            timing["max_step_rate_p99"] = 1000000 / max(callback.percentile(0.99), 1) / self.__microsteps
+        return timing
+
+    def print_timing(self):
+        timing = self.get_timing()
+        print(f"Microsteps: {timing['microsteps']}, late: {timing['late_steps']}, missed: {timing['missed_steps']}, overruns: {timing['overruns']}")
+        if timing["microsteps"] > 0:
+            print(f"Interval (us): min {timing['interval_min_us']}, mean {timing['interval_mean_us']:.1f}, p99 {timing['interval_p99_us']}, max {timing['interval_max_us']}")
+            print(f"Callback (us): mean {timing['callback_mean_us']:.1f}, p99 {timing['callback_p99_us']}, max {timing['callback_max_us']}")
+            print(f"Max step rate: {timing['max_step_rate']:.0f} steps/s ({timing['max_step_rate_p99']:.0f} at p99)")
+
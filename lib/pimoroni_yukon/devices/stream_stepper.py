@@ -0,0 +1,455 @@
+# SPDX-License-Identifier: MIT
+
+import math
+import asyncio
+from time import sleep
+from pimoroni_yukon.errors import TimeoutError
+
+"""
+A stepper class that streams precomputed microstep duties to the motor outputs, rather than
+setting them from a Python timer callback for every microstep. It offers the same move API as OkayStepper.
+The output is handled by a backend:
+  * PWMDMABackend writes the PWM compare registers with DMA channels paced by a DMA timer, so stepping
+    costs no CPU time once a move has started and is unaffected by what the main loop is doing
+  * SimBackend records the microsteps and duties that would be output, so moves can be checked on a host computer
+"""
+
+SLOW_DECAY = 1
+FAST_DECAY = 0
+MOTOR_DEFAULT_DEADZONE = 0.05
+
+
+def create_step_table(total_microsteps, current_scale):
+    # The same sine/cosine table OkayStepper uses, as a tuple of (duty_a, duty_b)
+    table = [0] * total_microsteps
+    for i in range(total_microsteps):
+        angle = (i / total_microsteps) * math.pi * 2.0
+        table[i] = (math.cos(angle) * current_scale,
+                    0 - math.sin(angle) * current_scale)
+    return tuple(table)
+
+
+def duty_to_levels(duty, top, decay=SLOW_DECAY, deadzone=MOTOR_DEFAULT_DEADZONE):
+    # Convert a motor duty into (positive, negative) PWM levels, the way the Motor class does
+    if abs(duty) < deadzone:
+        duty = 0.0
+    level = int(max(min(duty, 1.0), -1.0) * top)
+    if decay == SLOW_DECAY:
+        if level >= 0:
+            return (top, top - level)
+        return (top + level, top)
+    if level >= 0:
+        return (level, 0)
+    return (0, -level)
+
+
+def pack_compare(pins, levels):
+    # Pack the levels of a motor's (positive, negative) GPIOs into the value of their shared PWM slice's CC register
+    value = 0
+    for gpio, level in zip(pins, levels):
+        value |= level << (16 * (gpio & 1))
+    return value
+
+
+def gpio_of(pin):
+    # Get the GPIO number of a Pin object, from its text form: Pin(GPIO4, ...) or Pin(4, ...)
+    text = str(pin)
+    start = text.index("(") + 1
+    if text.startswith("GPIO", start):
+        start += 4
+    end = start
+    while end < len(text) and text[end].isdigit():
+        end += 1
+    return int(text[start:end])
+
+
+class StreamStepper:
+    DEFAULT_CURRENT_SCALE = 0.5
+    HOLD_CURRENT_PERCENT = 0.2
+
+    STEP_PHASES = 4
+    DEFAULT_MICROSTEPS = 8
+
+    RUN_MICROSTEPS = 1 << 24    # The length of a run_at() stream, long enough to be endless in practice
+
+    WAIT_POLL_MS = 1
+
+    def __init__(self, backend, steps_per_unit=1.0, current_scale=DEFAULT_CURRENT_SCALE, microsteps=DEFAULT_MICROSTEPS):
+        self.__backend = backend
+        self.__steps_per_unit = steps_per_unit
+
+        self.__current_microstep = 0
+        self.__end_microstep = 0
+        self.__moving = False
+
+        current_scale = max(min(current_scale, 1.0), 0.0)
+
+        self.__microsteps = microsteps
+        self.__total_microsteps = self.STEP_PHASES * microsteps
+        backend.load(create_step_table(self.__total_microsteps, current_scale),
+                     create_step_table(self.__total_microsteps, current_scale * self.HOLD_CURRENT_PERCENT))
+
+    def hold(self):
+        self.__backend.hold(self.__current_microstep)
+
+    def release(self):
+        self.__update()
+        self.__backend.stop()
+        self.__backend.release()
+
+    def stop(self):
+        if self.__moving:
+            completed = self.__backend.stop()
+            self.__current_microstep += completed if self.__end_microstep > self.__current_microstep else -completed
+            self.__moving = False
+        self.hold()
+
+    def __update(self):
+        # Finish off a move that the backend has completed
+        if self.__moving and not self.__backend.is_running():
+            self.__current_microstep = self.__end_microstep
+            self.__moving = False
+            self.hold()
+
+    def is_moving(self):
+        self.__update()
+        return self.__moving
+
+    def wait_for_move(self, timeout=None, monitor=None):
+        # As OkayStepper.wait_for_move(). The backends do not signal completion, so this polls between sleeps
+        from pimoroni_yukon.timing import ticks_ms, ticks_add, ticks_diff
+        if timeout is not None:
+            end_ms = ticks_add(ticks_ms(), int(timeout * 1000))
+
+        while self.is_moving():
+            if timeout is not None and ticks_diff(end_ms, ticks_ms()) <= 0:
+                self.stop()
+                raise TimeoutError(f"Move did not complete within {timeout}s")
+
+            if monitor is not None:
+                try:
+                    monitor.monitor()
+                except Exception:
+                    self.stop()
+                    raise
+            sleep(self.WAIT_POLL_MS / 1000)
+
+    async def wait_for_move_async(self):
+        while self.is_moving():
+            await asyncio.sleep(self.WAIT_POLL_MS / 1000)
+
+    def __move_by(self, microstep_diff, microsteps_per_second, debug=False):
+        if self.__moving:
+            self.stop()
+
+        if microstep_diff == 0:
+            self.hold()
+            return
+
+        self.__end_microstep = self.__current_microstep + microstep_diff
+
+        if debug:
+            print(f"> Streaming from {self.__current_microstep / self.__microsteps} to {self.__end_microstep / self.__microsteps}, at {microsteps_per_second / self.__microsteps} steps/s")
+
+        self.__backend.start(self.__current_microstep, microstep_diff, microsteps_per_second)
+        self.__moving = True
+
+    def move_to_step(self, step, duration, debug=False):
+        if duration <= 0.0:
+            raise ValueError("duration out of range. Expected greater than 0.0")
+
+        microstep_diff = int(step * self.__microsteps) - self.step_position()
+        self.__move_by(microstep_diff, abs(microstep_diff) / duration, debug)
+
+    def move_by_steps(self, steps, duration, debug=False):
+        if duration <= 0.0:
+            raise ValueError("duration out of range. Expected greater than 0.0")
+
+        microstep_diff = int(steps * self.__microsteps)
+        self.__move_by(microstep_diff, abs(microstep_diff) / duration, debug)
+
+    def move_to(self, unit, duration, debug=False):
+        self.move_to_step(unit * self.__steps_per_unit, duration, debug)
+
+    def move_by(self, units, duration, debug=False):
+        self.move_by_steps(units * self.__steps_per_unit, duration, debug)
+
+    def run_at_steps(self, steps_per_second, debug=False):
+        # Stream continuously at the given rate until stopped
+        microsteps_per_second = steps_per_second * self.__microsteps
+        if abs(microsteps_per_second) < 1.0:
+            self.stop()
+            return
+        direction = 1 if microsteps_per_second > 0 else -1
+        self.__move_by(direction * self.RUN_MICROSTEPS, abs(microsteps_per_second), debug)
+
+    def run_at(self, units_per_second, debug=False):
+        self.run_at_steps(units_per_second * self.__steps_per_unit, debug)
+
+    def step_position(self):
+        # The current microstep, including progress through any move in flight
+        if self.__moving:
+            completed = self.__backend.completed()
+            return self.__current_microstep + (completed if self.__end_microstep > self.__current_microstep else -completed)
+        return self.__current_microstep
+
+    def steps(self):
+        return self.step_position() / self.__microsteps
+
+    def units(self):
+        return self.steps() / self.__steps_per_unit
+
+    def step_diff(self, step):
+        microstep_diff = int(step * self.__microsteps) - self.step_position()
+        return microstep_diff / self.__microsteps
+
+    def unit_diff(self, unit):
+        step = unit * self.__steps_per_unit
+        return self.step_diff(step) / self.__steps_per_unit
+
+    def zero_position(self):
+        self.__current_microstep = 0
+
+
+class SimBackend:
+    # Records what a real backend would output. Time only moves when advance() is called,
+    # unless a clock function returning microseconds is given
+
+    def __init__(self, clock=None):
+        self.__clock = clock
+        self.__now = 0
+        self.step_table = ()
+        self.hold_table = ()
+        self.outputs = []       # (time_us, microstep, duty_a, duty_b) for every step and hold output
+        self.__start_time = 0
+        self.__start_microstep = 0
+        self.__direction = 1
+        self.__count = 0
+        self.__rate = 0.0
+        self.__emitted = 0
+        self.__running = False
+
+    def now(self):
+        return self.__clock() if self.__clock is not None else self.__now
+
+    def advance(self, us):
+        self.__now += int(us)
+        self.__emit()
+
+    def load(self, step_table, hold_table):
+        self.step_table = step_table
+        self.hold_table = hold_table
+
+    def __due(self):
+        elapsed = self.now() - self.__start_time
+        return min(int((elapsed * self.__rate) / 1000000), self.__count)
+
+    def __emit(self):
+        if not self.__running:
+            return
+        due = self.__due()
+        total = len(self.step_table)
+        while self.__emitted < due:
+            self.__emitted += 1
+            microstep = self.__start_microstep + self.__direction * self.__emitted
+            duty_a, duty_b = self.step_table[microstep % total]
+            self.outputs.append((self.__start_time + int((self.__emitted * 1000000) / self.__rate), microstep, duty_a, duty_b))
+        if self.__emitted >= self.__count:
+            self.__running = False
+
+    def start(self, start_microstep, microstep_diff, microsteps_per_second):
+        self.__start_time = self.now()
+        self.__start_microstep = start_microstep
+        self.__direction = 1 if microstep_diff > 0 else -1
+        self.__count = abs(microstep_diff)
+        self.__rate = microsteps_per_second
+        self.__emitted = 0
+        self.__running = True
+
+    def is_running(self):
+        self.__emit()
+        return self.__running
+
+    def completed(self):
+        self.__emit()
+        return self.__emitted
+
+    def stop(self):
+        self.__emit()
+        self.__running = False
+        return self.__emitted
+
+    def hold(self, microstep):
+        duty_a, duty_b = self.hold_table[microstep % len(self.hold_table)]
+        self.outputs.append((self.now(), microstep, duty_a, duty_b))
+
+    def release(self):
+        self.outputs.append((self.now(), None, 0.0, 0.0))
+
+
+class PWMDMABackend:
+    # Streams PWM compare values for both motors of a stepper with two DMA channels, paced by a DMA timer.
+    # Each motor's positive and negative pins must share a PWM slice, as they do on the Dual Motor module.
+    # DMA timers cannot tick slower than clk_sys / 65535, so slow rates repeat each microstep in the stream
+
+    DMA_BASE = 0x50000000
+    DMA_TIMER0 = DMA_BASE + 0x420
+    DMA_MULTI_CHAN_TRIGGER = DMA_BASE + 0x430
+    TREQ_TIMER0 = 0x3B
+
+    PWM_BASE = 0x40050000
+    PWM_SLICE_STRIDE = 0x14
+    PWM_CC_OFFSET = 0x0C
+    PWM_TOP_OFFSET = 0x10
+
+    DEFAULT_MAX_REPEAT = 16
+
+    def __init__(self, motor_a, motor_b, pins_a, pins_b, dma_timer=0, max_repeat=DEFAULT_MAX_REPEAT):
+        # pins_a and pins_b are the (positive, negative) GPIO numbers of each motor
+        import machine
+        import rp2
+        import uctypes
+        self.__mem32 = machine.mem32
+        self.__freq = machine.freq
+        self.__addressof = uctypes.addressof
+
+        if (max_repeat & (max_repeat - 1)) != 0:
+            raise ValueError("max_repeat must be a power of two")
+
+        self.__motors = (motor_a, motor_b)
+        self.__pins = (tuple(pins_a), tuple(pins_b))
+        for pins in self.__pins:
+            if (pins[0] >> 1) != (pins[1] >> 1):
+                raise ValueError("a motor's positive and negative pins must share a PWM slice")
+
+        self.__dma_timer = dma_timer
+        self.__max_repeat = max_repeat
+        self.__channels = (rp2.DMA(), rp2.DMA())
+        self.__repeat = 1
+        self.__count = 0
+        self.__rings = None
+        self.__hold_words = None
+        self.__running = False
+
+    @staticmethod
+    def from_dual_motor(module, dma_timer=0, max_repeat=DEFAULT_MAX_REPEAT):
+        # Create a backend for the stepper attached to a Dual Motor module
+        slot = module.slot
+        return PWMDMABackend(module.motor1, module.motor2,
+                             (gpio_of(slot.FAST2), gpio_of(slot.FAST1)),
+                             (gpio_of(slot.FAST4), gpio_of(slot.FAST3)),
+                             dma_timer, max_repeat)
+
+    def __cc_address(self, pins):
+        return self.PWM_BASE + (((pins[0] >> 1) & 7) * self.PWM_SLICE_STRIDE) + self.PWM_CC_OFFSET
+
+    def __compare_words(self, table, motor_index):
+        motor = self.__motors[motor_index]
+        pins = self.__pins[motor_index]
+        if motor.direction() != 0:  # Reversed motors swap their pins
+            pins = (pins[1], pins[0])
+        top = self.__mem32[self.PWM_BASE + ((pins[0] >> 1) & 7) * self.PWM_SLICE_STRIDE + self.PWM_TOP_OFFSET] & 0xFFFF
+        return [pack_compare(pins, duty_to_levels(entry[motor_index], top, motor.decay_mode(), motor.deadzone())) for entry in table]
+
+    def __aligned_ring(self, words):
+        # DMA read rings wrap on an address boundary equal to their size, so allocate double and align within it
+        size = len(words) * 4
+        buffer = bytearray(size * 2)
+        address = self.__addressof(buffer)
+        offset = ((address + size - 1) & ~(size - 1)) - address
+        view = memoryview(buffer)[offset:offset + size]
+        for i, word in enumerate(words):
+            view[i * 4:i * 4 + 4] = word.to_bytes(4, 'little')
+        return (buffer, self.__addressof(view), size)
+
+    def load(self, step_table, hold_table):
+        total = len(step_table)
+        if (total & (total - 1)) != 0:
+            raise ValueError("microsteps per cycle must be a power of two to stream")
+
+        self.__total = total
+        self.__step_words = (self.__compare_words(step_table, 0), self.__compare_words(step_table, 1))
+        self.__hold_words = (self.__compare_words(hold_table, 0), self.__compare_words(hold_table, 1))
+        self.__rings = {}
+
+    def __ring(self, motor_index, direction, repeat):
+        key = (motor_index, direction, repeat)
+        if key not in self.__rings:
+            words = self.__step_words[motor_index]
+            if direction < 0:
+                words = [words[(self.__total - i) % self.__total] for i in range(self.__total)]
+            self.__rings[key] = self.__aligned_ring([w for w in words for _ in range(repeat)])
+        return self.__rings[key]
+
+    def __set_timer(self, rate):
+        # Rate = clk_sys * X / Y, with X and Y being 16 bit
+        clk = self.__freq()
+        y = 0xFFFF
+        x = max(int((rate * y) / clk + 0.5), 1)
+        if x > 0xFFFF:
+            raise ValueError("step rate too high to stream")
+        self.__mem32[self.DMA_TIMER0 + 4 * self.__dma_timer] = (x << 16) | y
+
+    def start(self, start_microstep, microstep_diff, microsteps_per_second):
+        self.stop()
+
+        # Repeat each microstep enough times to bring the DMA timer into its range
+        min_rate = self.__freq() / 0xFFFF
+        repeat = 1
+        while microsteps_per_second * repeat < min_rate:
+            repeat <<= 1
+            if repeat > self.__max_repeat:
+                raise ValueError("step rate too low to stream, increase max_repeat")
+
+        direction = 1 if microstep_diff > 0 else -1
+        self.__repeat = repeat
+        self.__count = abs(microstep_diff) * repeat
+        self.__set_timer(microsteps_per_second * repeat)
+
+        # The stream starts at the microstep after the current one
+        first = (start_microstep + direction) % self.__total
+        index = first if direction > 0 else (self.__total - first) % self.__total
+        trigger = 0
+        for motor_index in range(2):
+            buffer, address, size = self.__ring(motor_index, direction, repeat)
+            channel = self.__channels[motor_index]
+            ctrl = channel.pack_ctrl(size=2, inc_read=True, inc_write=False,
+                                     ring_size=size.bit_length() - 1, ring_sel=False,
+                                     treq_sel=self.TREQ_TIMER0 + self.__dma_timer)
+            channel.config(read=address + index * repeat * 4, write=self.__cc_address(self.__pins[motor_index]),
+                           count=self.__count, ctrl=ctrl, trigger=False)
+            trigger |= 1 << channel.channel
+
+        for motor in self.__motors:
+            motor.enable()
+
+        # Start both channels together so the two coils stay in step
+        self.__mem32[self.DMA_MULTI_CHAN_TRIGGER] = trigger
+        self.__running = True
+
+    def is_running(self):
+        if self.__running and not self.__channels[0].active():
+            self.__running = False
+        return self.__running
+
+    def completed(self):
+        if not self.__running:
+            return self.__count // self.__repeat
+        return (self.__count - self.__channels[0].count) // self.__repeat
+
+    def stop(self):
+        if self.__running:
+            for channel in self.__channels:
+                channel.active(False)
+            self.__running = False
+            self.__count -= self.__channels[0].count
+        return self.__count // self.__repeat
+
+    def hold(self, microstep):
+        for motor_index in range(2):
+            words = self.__hold_words[motor_index]
+            self.__mem32[self.__cc_address(self.__pins[motor_index])] = words[microstep % len(words)]
+
+    def release(self):
+        for motor in self.__motors:
+            motor.disable()
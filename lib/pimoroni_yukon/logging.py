@@ -2,6 +2,8 @@
 #
 # SPDX-License-Identifier: MIT
 
+import sys
+
 LOG_NONE = 0
 LOG_WARN = 1
 LOG_INFO = 2
@@ -36,3 +38,244 @@ def format_dict(section_name, readings, allowed, excluded):
                 else:
                     text += f"{name} = {value}, "
     return text
+
+
+# How the Yukon logs its readings at LOG_DEBUG: as text, or as binary frames for a computer to decode
+READINGS_TEXT = 0
+READINGS_FRAME = 1
+
+readings_mode = READINGS_TEXT
+
+# Frames are SYNC | TYPE | LENGTH (2 bytes) | PAYLOAD | CHECKSUM (2 bytes), little endian, with the checksum the 16 bit sum
+# of the bytes from TYPE to the end of the PAYLOAD. A names frame, of the comma separated "[Section]Name" of each value,
+# comes before the first values frame and every FRAME_NAMES_EVERY after, so a computer can start listening at any time.
+# A values frame's payload is ticks_ms() (4 bytes) then each value as a 4 byte float
+FRAME_SYNC = 0x5A
+FRAME_NAMES = 0
+FRAME_VALUES = 1
+FRAME_HEADER_SIZE = 4
+FRAME_CHECKSUM_SIZE = 2
+FRAME_NAMES_EVERY = 50
+
+IS_MICROPYTHON = sys.implementation.name == "micropython"
+
+
+class ReadingsFormatter:
+    """
+    Formats readings as format_dict() does, or packs them into binary frames, without allocating. The text and frame
+    buffers are allocated once, and sized for every reading, so the formatter is made once per set of sections and filters.
+    Readings are written by each section's readings_into() as 4 byte floats, and turned into text with integer maths.
+    Flags such as Fault and PGood are written as 0 or 1, as format_dict() writes them, so they can appear on plotter charts.
+    Values too large for a small int are written as an overflow marker, ">=1073741824" or "<=-1073741824", not their digits.
+    """
+
+    DEFAULT_DECIMALS = 3
+    MAX_VALUE_CHARS = 15        # A sign, up to 10 whole digits, a point and 3 decimals, or "<=-1073741824" or "nan"
+
+    def __init__(self, sections, allowed=None, excluded=None, decimals=DEFAULT_DECIMALS):
+        # sections is a list of (section_name, source) where source has READING_NAMES and readings_into(buffer, index)
+        if decimals < 0 or decimals > 3:
+            raise ValueError("decimals out of range. Expected 0 to 3")
+        self.decimals = decimals
+        self.__scale = 10 ** decimals
+        self.__fives = 5 ** decimals
+
+        self.__sources = []
+        self.__headers = []         # Per section, its name and a space as bytes, or None if it has no readings
+        self.__labels = []          # Per reading, b"name = " if it passes the filters, otherwise None
+        self.__ends = []            # Per section, the index its readings end at
+        names = []
+        count = 0
+        text_size = 1
+        for section_name, source in sections:
+            reading_names = source.READING_NAMES
+            self.__sources.append(source)
+            self.__headers.append(f"{section_name} ".encode() if len(reading_names) > 0 else None)
+            text_size += len(section_name) + 1
+            for name in reading_names:
+                shown = (allowed is None or name in allowed) and (excluded is None or name not in excluded)
+                self.__labels.append(f"{name} = ".encode() if shown else None)
+                if shown:
+                    names.append(section_name + name)
+                    text_size += len(name) + 3 + self.MAX_VALUE_CHARS + 2
+            count += len(reading_names)
+            self.__ends.append(count)
+
+        self.names = names
+        self.__values = bytearray(4 * max(count, 1))
+        self.__text = bytearray(text_size)
+        self.__digits = bytearray(16)
+        self.__frame = bytearray(FRAME_HEADER_SIZE + 4 + 4 * len(names) + FRAME_CHECKSUM_SIZE)
+        self.__names_frame = self.__build_frame(FRAME_NAMES, ",".join(names).encode())
+        self.__frames_until_names = 0
+
+    def __build_frame(self, frame_type, payload):
+        frame = bytearray(FRAME_HEADER_SIZE + len(payload) + FRAME_CHECKSUM_SIZE)
+        frame[FRAME_HEADER_SIZE:FRAME_HEADER_SIZE + len(payload)] = payload
+        self.__seal(frame, frame_type, len(payload))
+        return frame
+
+    @staticmethod
+    def __seal(frame, frame_type, length):
+        frame[0] = FRAME_SYNC
+        frame[1] = frame_type
+        frame[2] = length & 0xFF
+        frame[3] = length >> 8
+        checksum = 0
+        for i in range(1, FRAME_HEADER_SIZE + length):
+            checksum += frame[i]
+        frame[FRAME_HEADER_SIZE + length] = checksum & 0xFF
+        frame[FRAME_HEADER_SIZE + length + 1] = (checksum >> 8) & 0xFF
+
+    def collect(self):
+        # Have each section write its readings into the values buffer
+        index = 0
+        for source in self.__sources:
+            index = source.readings_into(self.__values, index)
+
+    def __put(self, pos, chunk):
+        text = self.__text
+        for i in range(len(chunk)):
+            text[pos + i] = chunk[i]
+        return pos + len(chunk)
+
+    def __put_value(self, pos, index):
+        # Write the float at index in the values buffer as text, with up to the decimals needed and no trailing zeros.
+        # The float is taken apart from its bytes, as reading it as a float would allocate
+        values = self.__values
+        offset = index * 4
+        low = values[offset] | (values[offset + 1] << 8)
+        high = values[offset + 2] | (values[offset + 3] << 8)
+        exponent = (high >> 7) & 0xFF
+        mantissa = ((high & 0x7F) << 16) | low
+        negative = (high & 0x8000) != 0
+
+        if exponent == 0xFF:
+            if mantissa != 0:
+                return self.__put(pos, b"nan")
+            if negative:
+                self.__text[pos] = 45   # -
+                pos += 1
+            return self.__put(pos, b"inf")
+
+        # The value is mantissa * 2^(exponent - 150), split into whole and fractional parts that each stay small ints.
+        # Values of 2^30 and above would not, so are written as an overflow marker
+        whole = 0
+        fraction = 0
+        if exponent > 0:
+            mantissa |= 0x800000
+            shift = exponent - 150
+            if shift > 6:
+                return self.__put(pos, b"<=-1073741824" if negative else b">=1073741824")
+            elif shift >= 0:
+                whole = mantissa << shift
+            elif shift > -48:
+                shift = -shift
+                whole = mantissa >> shift
+                fraction = mantissa - (whole << shift)
+                if shift > 20:
+                    # Scaling a fraction of more than 20 bits could overflow, so it is scaled by 5^decimals rather than
+                    # 10^decimals, with the twos taken off the shift, in 12 bit halves. The low 12 bits this drops are
+                    # below the half added for rounding, so it still rounds exactly and 0.0005 gives 0.001, not 0
+                    shift -= self.decimals + 12
+                    fraction = (fraction >> 12) * self.__fives + (((fraction & 0xFFF) * self.__fives) >> 12)
+                    fraction = (fraction + (1 << (shift - 1))) >> shift if shift <= 21 else 0
+                else:
+                    fraction = (fraction * self.__scale + (1 << (shift - 1))) >> shift
+                if fraction >= self.__scale:
+                    whole += 1
+                    fraction -= self.__scale
+
+        text = self.__text
+        if negative and (whole > 0 or fraction > 0):
+            text[pos] = 45  # -
+            pos += 1
+
+        # Digits least significant first, the decimals then at least one before the point
+        decimals = self.decimals
+        digits = self.__digits
+        count = 0
+        while count < decimals:
+            digits[count] = 48 + fraction % 10
+            fraction //= 10
+            count += 1
+        while count == decimals or whole > 0:
+            digits[count] = 48 + whole % 10
+            whole //= 10
+            count += 1
+
+        first = 0
+        while first < decimals and digits[first] == 48:
+            first += 1
+
+        for i in range(count - 1, decimals - 1, -1):
+            text[pos] = digits[i]
+            pos += 1
+        if first < decimals:
+            text[pos] = 46  # .
+            pos += 1
+            for i in range(decimals - 1, first - 1, -1):
+                text[pos] = digits[i]
+                pos += 1
+        return pos
+
+    def format(self):
+        # Format the collected readings as text, ending with a newline. Returns the length written to the text buffer
+        pos = 0
+        index = 0
+        for section in range(len(self.__headers)):
+            header = self.__headers[section]
+            end = self.__ends[section]
+            if header is not None:
+                pos = self.__put(pos, header)
+                while index < end:
+                    label = self.__labels[index]
+                    if label is not None:
+                        pos = self.__put(pos, label)
+                        pos = self.__put_value(pos, index)
+                        pos = self.__put(pos, b", ")
+                    index += 1
+            index = end
+        self.__text[pos] = 10   # \n
+        return pos + 1
+
+    def frame(self, ticks):
+        # Pack the collected readings that pass the filters into a values frame. Returns the length of the frame
+        frame = self.__frame
+        ticks &= 0xFFFFFFFF
+        for i in range(4):
+            frame[FRAME_HEADER_SIZE + i] = (ticks >> (8 * i)) & 0xFF
+        pos = FRAME_HEADER_SIZE + 4
+        values = self.__values
+        labels = self.__labels
+        for index in range(len(labels)):
+            if labels[index] is not None:
+                offset = index * 4
+                for i in range(4):
+                    frame[pos + i] = values[offset + i]
+                pos += 4
+        self.__seal(frame, FRAME_VALUES, pos - FRAME_HEADER_SIZE)
+        return pos + FRAME_CHECKSUM_SIZE
+
+    def text(self):
+        # The formatted text as a str, which allocates
+        return bytes(self.__text[:self.format() - 1]).decode()
+
+    def write(self, stream):
+        # Format the collected readings and write them to stream, such as sys.stdout
+        self.__write(stream, self.__text, self.format())
+
+    def write_frame(self, stream, ticks):
+        # Write the collected readings to stream as a values frame, preceded by the names frame when it is due
+        if self.__frames_until_names <= 0:
+            stream.write(self.__names_frame)
+            self.__frames_until_names = FRAME_NAMES_EVERY
+        self.__frames_until_names -= 1
+        self.__write(stream, self.__frame, self.frame(ticks))
+
+    @staticmethod
+    def __write(stream, buffer, length):
+        if IS_MICROPYTHON:
+            stream.write(buffer, length)    # MicroPython streams take a length, which saves slicing the buffer
+        else:
+            stream.write(memoryview(buffer)[:length])
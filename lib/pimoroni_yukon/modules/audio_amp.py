@@ -4,7 +4,9 @@
 
 import tca
 from machine import Pin
+import struct
 from ucollections import OrderedDict
+from pimoroni_yukon.stats import RunningStats, TEMPERATURE_LOW, TEMPERATURE_HIGH
 from .common import YukonModule, ADC_FLOAT, IO_LOW, IO_HIGH
 from pimoroni_yukon.errors import OverTemperatureError
 from pimoroni_yukon.devices.audio import WavPlayer
@@ -126,6 +128,7 @@ TG_EN = 0x47            # Thermal Detection Enable Section 8.9.117
 
 class AudioAmpModule(YukonModule):
     NAME = "Audio Amp"
+    READING_NAMES = ("T_max", "T_min", "T_avg")
     AMP_I2C_ADDRESS = 0x38
     TEMPERATURE_THRESHOLD = 50.0
 
@@ -137,6 +140,8 @@ class AudioAmpModule(YukonModule):
         return adc1_level == ADC_FLOAT and slow1 is IO_LOW and slow2 is IO_HIGH and slow3 is IO_HIGH
 
     def __init__(self, i2s_id):
+        # Made before YukonModule's __init__, as that clears the readings
+        self.__temperature_stats = RunningStats(low=TEMPERATURE_LOW, high=TEMPERATURE_HIGH)
         super().__init__()
         self.__i2s_id = i2s_id
         self.player = None
@@ -272,28 +277,26 @@ class AudioAmpModule(YukonModule):
         if self.__monitor_action_callback is not None:
             self.__monitor_action_callback(temperature)
 
-        self.__max_temperature = max(temperature, self.__max_temperature)
-        self.__min_temperature = min(temperature, self.__min_temperature)
-        self.__avg_temperature += temperature
-        self.__count_avg += 1
+        self.__temperature_stats.add(temperature)
 
     def get_readings(self):
         return OrderedDict({
-            "T_max": self.__max_temperature,
-            "T_min": self.__min_temperature,
-            "T_avg": self.__avg_temperature
+            "T_max": self.__temperature_stats.max(),
+            "T_min": self.__temperature_stats.min(),
+            "T_avg": self.__temperature_stats.mean()
         })
 
-    def process_readings(self):
-        if self.__count_avg > 0:
-            self.__avg_temperature /= self.__count_avg
-            self.__count_avg = 0    # Clear the count to prevent process readings acting more than once
+    def readings_into(self, buffer, index):
+        temperature = self.__temperature_stats
+        struct.pack_into("<fff", buffer, index * 4, temperature.max(), temperature.min(), temperature.mean())
+        return index + 3
+
+    def get_temperature_stats(self):
+        # The RunningStats of the temperature readings, for their variance, moving average or percentiles
+        return self.__temperature_stats
 
     def clear_readings(self):
-        self.__max_temperature = float('-inf')
-        self.__min_temperature = float('inf')
-        self.__avg_temperature = 0
-        self.__count_avg = 0
+        self.__temperature_stats.clear()
 
     def __start_i2c(self):
         tca.change_output_mask(self.__chip, self.__sda_bit, 0)  # Data to low
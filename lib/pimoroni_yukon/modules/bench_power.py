@@ -4,13 +4,16 @@
 
 from .common import YukonModule, ADC_HIGH, IO_LOW, IO_HIGH
 from machine import Pin, PWM
+import struct
 from ucollections import OrderedDict
+from pimoroni_yukon.stats import RunningStats, TEMPERATURE_LOW, TEMPERATURE_HIGH
 from pimoroni_yukon.errors import FaultError, OverTemperatureError
 import pimoroni_yukon.logging as logging
 
 
 class BenchPowerModule(YukonModule):
     NAME = "Bench Power"
+    READING_NAMES = ("PGood", "Vo_max", "Vo_min", "Vo_avg", "T_max", "T_min", "T_avg")
 
     PWM_MIN = 0.3
     PWM_MAX = 0.0
@@ -32,6 +35,9 @@ class BenchPowerModule(YukonModule):
         return adc1_level is not ADC_HIGH and slow1 is IO_HIGH and slow2 is IO_LOW and slow3 is IO_LOW
 
     def __init__(self, halt_on_not_pgood=False):
+        # Made before YukonModule's __init__, as that clears the readings
+        self.__voltage_out_stats = RunningStats()
+        self.__temperature_stats = RunningStats(low=TEMPERATURE_LOW, high=TEMPERATURE_HIGH)
         super().__init__()
 
         self.halt_on_not_pgood = halt_on_not_pgood
@@ -122,41 +128,36 @@ class BenchPowerModule(YukonModule):
         self.__last_pgood = pgood
         self.__power_good_throughout = self.__power_good_throughout and pgood
 
-        self.__max_voltage_out = max(voltage_out, self.__max_voltage_out)
-        self.__min_voltage_out = min(voltage_out, self.__min_voltage_out)
-        self.__avg_voltage_out += voltage_out
-
-        self.__max_temperature = max(temperature, self.__max_temperature)
-        self.__min_temperature = min(temperature, self.__min_temperature)
-        self.__avg_temperature += temperature
-
-        self.__count_avg += 1
+        self.__voltage_out_stats.add(voltage_out)
+        self.__temperature_stats.add(temperature)
 
     def get_readings(self):
         return OrderedDict({
             "PGood": self.__power_good_throughout,
-            "Vo_max": self.__max_voltage_out,
-            "Vo_min": self.__min_voltage_out,
-            "Vo_avg": self.__avg_voltage_out,
-            "T_max": self.__max_temperature,
-            "T_min": self.__min_temperature,
-            "T_avg": self.__avg_temperature
+            "Vo_max": self.__voltage_out_stats.max(),
+            "Vo_min": self.__voltage_out_stats.min(),
+            "Vo_avg": self.__voltage_out_stats.mean(),
+            "T_max": self.__temperature_stats.max(),
+            "T_min": self.__temperature_stats.min(),
+            "T_avg": self.__temperature_stats.mean()
         })
 
-    def process_readings(self):
-        if self.__count_avg > 0:
-            self.__avg_voltage_out /= self.__count_avg
-            self.__avg_temperature /= self.__count_avg
-            self.__count_avg = 0    # Clear the count to prevent process readings acting more than once
+    def readings_into(self, buffer, index):
+        voltage_out, temperature = self.__voltage_out_stats, self.__temperature_stats
+        struct.pack_into("<fffffff", buffer, index * 4, self.__power_good_throughout, voltage_out.max(),
+                         voltage_out.min(), voltage_out.mean(), temperature.max(), temperature.min(),
+                         temperature.mean())
+        return index + 7
 
-    def clear_readings(self):
-        self.__power_good_throughout = True
-        self.__max_voltage_out = float('-inf')
-        self.__min_voltage_out = float('inf')
-        self.__avg_voltage_out = 0
+    def get_voltage_out_stats(self):
+        # The RunningStats of the output voltage readings, for their variance, moving average or percentiles
+        return self.__voltage_out_stats
 
-        self.__max_temperature = float('-inf')
-        self.__min_temperature = float('inf')
-        self.__avg_temperature = 0
+    def get_temperature_stats(self):
+        # The RunningStats of the temperature readings, for their variance, moving average or percentiles
+        return self.__temperature_stats
 
-        self.__count_avg = 0
+    def clear_readings(self):
+        self.__power_good_throughout = True
+        self.__voltage_out_stats.clear()
+        self.__temperature_stats.clear()
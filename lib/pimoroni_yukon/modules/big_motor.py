@@ -6,12 +6,16 @@ from .common import YukonModule, ADC_LOW, IO_LOW, IO_HIGH
 from machine import Pin
 from motor import Motor, SLOW_DECAY
 from encoder import Encoder, MMME_CPR
+import struct
 from ucollections import OrderedDict
+from pimoroni_yukon.stats import RunningStats, TEMPERATURE_LOW, TEMPERATURE_HIGH
 from pimoroni_yukon.errors import FaultError, OverCurrentError, OverTemperatureError
 
 
 class BigMotorModule(YukonModule):
     NAME = "Big Motor + Encoder"
+    RECORD_NAMES = ("Fault", "C", "T")
+    READING_NAMES = ("Fault", "C_max", "C_min", "C_avg", "T_max", "T_min", "T_avg")
     NUM_MOTORS = 1
     DEFAULT_FREQUENCY = 25000
     DEFAULT_COUNTS_PER_REV = MMME_CPR
@@ -31,6 +35,9 @@ class BigMotorModule(YukonModule):
     def __init__(self, frequency=DEFAULT_FREQUENCY,
                  encoder_pio=0, encoder_sm=0, counts_per_rev=DEFAULT_COUNTS_PER_REV,
                  init_motor=True, init_encoder=True):
+        # Made before YukonModule's __init__, as that clears the readings
+        self.__current_stats = RunningStats(low=-self.CURRENT_THRESHOLD, high=self.CURRENT_THRESHOLD)
+        self.__temperature_stats = RunningStats(low=TEMPERATURE_LOW, high=TEMPERATURE_HIGH)
         super().__init__()
 
         if init_encoder:
@@ -108,14 +115,20 @@ class BigMotorModule(YukonModule):
 
     def monitor(self):
         fault = self.read_fault()
+        if self.__recorder is not None:
+            self.__recorder.record(self.__record_channel, fault)
         if fault is True:
             raise FaultError(self.__message_header() + "Fault detected on motor driver! Turning off output")
 
         current = self.read_current()
+        if self.__recorder is not None:
+            self.__recorder.record(self.__record_channel + 1, current)
         if abs(current) > self.CURRENT_THRESHOLD:
             raise OverCurrentError(self.__message_header() + f"Current of {current}A exceeded the limit of {self.CURRENT_THRESHOLD}A! Turning off output")
 
         temperature = self.read_temperature()
+        if self.__recorder is not None:
+            self.__recorder.record(self.__record_channel + 2, temperature)
         if temperature > self.TEMPERATURE_THRESHOLD:
             raise OverTemperatureError(self.__message_header() + f"Temperature of {temperature}°C exceeded the limit of {self.TEMPERATURE_THRESHOLD}°C! Turning off output")
 
@@ -125,42 +138,36 @@ class BigMotorModule(YukonModule):
 
         self.__fault_triggered = self.__fault_triggered or fault
 
-        self.__max_current = max(current, self.__max_current)
-        self.__min_current = min(current, self.__min_current)
-        self.__avg_current += current
-
-        self.__max_temperature = max(temperature, self.__max_temperature)
-        self.__min_temperature = min(temperature, self.__min_temperature)
-        self.__avg_temperature += temperature
-
-        self.__count_avg += 1
+        self.__current_stats.add(current)
+        self.__temperature_stats.add(temperature)
 
     def get_readings(self):
         return OrderedDict({
             "Fault": self.__fault_triggered,
-            "C_max": self.__max_current,
-            "C_min": self.__min_current,
-            "C_avg": self.__avg_current,
-            "T_max": self.__max_temperature,
-            "T_min": self.__min_temperature,
-            "T_avg": self.__avg_temperature
+            "C_max": self.__current_stats.max(),
+            "C_min": self.__current_stats.min(),
+            "C_avg": self.__current_stats.mean(),
+            "T_max": self.__temperature_stats.max(),
+            "T_min": self.__temperature_stats.min(),
+            "T_avg": self.__temperature_stats.mean()
         })
 
-    def process_readings(self):
-        if self.__count_avg > 0:
-            self.__avg_current /= self.__count_avg
-            self.__avg_temperature /= self.__count_avg
-            self.__count_avg = 0    # Clear the count to prevent process readings acting more than once
+    def readings_into(self, buffer, index):
+        current, temperature = self.__current_stats, self.__temperature_stats
+        struct.pack_into("<fffffff", buffer, index * 4, self.__fault_triggered, current.max(), current.min(),
+                         current.mean(), temperature.max(), temperature.min(), temperature.mean())
+        return index + 7
 
-    def clear_readings(self):
-        self.__fault_triggered = False
+    def get_current_stats(self):
+        # The RunningStats of the current readings, for their variance, moving average or percentiles
+        return self.__current_stats
 
-        self.__max_current = float('-inf')
-        self.__min_current = float('inf')
-        self.__avg_current = 0
+    def get_temperature_stats(self):
+        # The RunningStats of the temperature readings, for their variance, moving average or percentiles
+        return self.__temperature_stats
 
-        self.__max_temperature = float('-inf')
-        self.__min_temperature = float('inf')
-        self.__avg_temperature = 0
+    def clear_readings(self):
+        self.__fault_triggered = False
 
-        self.__count_avg = 0
+        self.__current_stats.clear()
+        self.__temperature_stats.clear()
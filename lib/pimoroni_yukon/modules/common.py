@@ -15,6 +15,8 @@ IO_HIGH = True
 
 class YukonModule:
     NAME = "Unknown"
+    RECORD_NAMES = ()   # The channels the module records into a TelemetryRecorder, if any
+    READING_NAMES = ()  # The names of get_readings(), in order, for readings_into() to write
 
     # | ADC1  | ADC2  | SLOW1 | SLOW2 | SLOW3 | Module               | Condition (if any)          |
     # |-------|-------|-------|-------|-------|----------------------|-----------------------------|
@@ -33,6 +35,9 @@ class YukonModule:
 
         self.__monitor_action_callback = None
 
+        self.__recorder = None
+        self.__record_channel = 0
+
     def initialise(self, slot, adc1_func, adc2_func):
         # Record the slot we are in, and the ADC functions to call
         self.slot = slot
@@ -69,6 +74,15 @@ class YukonModule:
 
         self.__monitor_action_callback = callback_function
 
+    def attach_recorder(self, recorder):
+        # Add the module's RECORD_NAMES to a TelemetryRecorder, for monitor() to record its samples into
+        if len(self.RECORD_NAMES) > 0:
+            self.__record_channel = recorder.add_channels(f"Slot{self.slot.ID}_", self.RECORD_NAMES)
+            self.__recorder = recorder
+
+    def detach_recorder(self):
+        self.__recorder = None
+
     def monitor(self):
         # Override this to perform any module specific monitoring
         pass
@@ -77,6 +91,11 @@ class YukonModule:
         # Override this to return any readings obtained during monitoring
         return OrderedDict()
 
+    def readings_into(self, buffer, index):
+        # Override this, along with READING_NAMES, to pack the readings into buffer as 4 byte floats from index onwards,
+        # without allocating. Returns the index after the last reading
+        return index
+
     def get_formatted_readings(self, allowed=None, excluded=None):
         return logging.format_dict(f"[Slot{self.slot.ID}]", self.get_readings(), allowed, excluded)
 
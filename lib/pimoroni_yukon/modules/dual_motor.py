@@ -4,13 +4,17 @@
 
 from .common import YukonModule, ADC_HIGH, IO_LOW, IO_HIGH
 from machine import Pin
+import struct
 from ucollections import OrderedDict
+from pimoroni_yukon.stats import RunningStats, TEMPERATURE_LOW, TEMPERATURE_HIGH
 from pimoroni_yukon.errors import FaultError, OverTemperatureError
 import pimoroni_yukon.logging as logging
 
 
 class DualMotorModule(YukonModule):
     NAME = "Dual Motor"
+    RECORD_NAMES = ("Fault", "T")
+    READING_NAMES = ("Fault", "T_max", "T_min", "T_avg")
     NUM_MOTORS = 2
     MOTOR_1 = 0
     MOTOR_2 = 1
@@ -40,6 +44,8 @@ class DualMotorModule(YukonModule):
         return adc1_level == ADC_HIGH and slow1 is IO_LOW and slow2 is IO_LOW and slow3 is IO_HIGH
 
     def __init__(self, frequency=DEFAULT_FREQUENCY, current_limit=DEFAULT_CURRENT_LIMIT, init_motors=True):
+        # Made before YukonModule's __init__, as that clears the readings
+        self.__temperature_stats = RunningStats(low=TEMPERATURE_LOW, high=TEMPERATURE_HIGH)
         super().__init__()
         self.__frequency = frequency
         self.__current_limit = current_limit
@@ -153,10 +159,14 @@ class DualMotorModule(YukonModule):
 
     def monitor(self):
         fault = self.read_fault()
+        if self.__recorder is not None:
+            self.__recorder.record(self.__record_channel, fault)
         if fault is True:
             raise FaultError(self.__message_header() + "Fault detected on motor driver! Turning off output")
 
         temperature = self.read_temperature()
+        if self.__recorder is not None:
+            self.__recorder.record(self.__record_channel + 1, temperature)
         if temperature > self.TEMPERATURE_THRESHOLD:
             raise OverTemperatureError(self.__message_header() + f"Temperature of {temperature}°C exceeded the limit of {self.TEMPERATURE_THRESHOLD}°C! Turning off output")
 
@@ -165,27 +175,26 @@ class DualMotorModule(YukonModule):
             self.__monitor_action_callback(fault, temperature)
 
         self.__fault_triggered = self.__fault_triggered or fault
-        self.__max_temperature = max(temperature, self.__max_temperature)
-        self.__min_temperature = min(temperature, self.__min_temperature)
-        self.__avg_temperature += temperature
-        self.__count_avg += 1
+        self.__temperature_stats.add(temperature)
 
     def get_readings(self):
         return OrderedDict({
             "Fault": self.__fault_triggered,
-            "T_max": self.__max_temperature,
-            "T_min": self.__min_temperature,
-            "T_avg": self.__avg_temperature,
+            "T_max": self.__temperature_stats.max(),
+            "T_min": self.__temperature_stats.min(),
+            "T_avg": self.__temperature_stats.mean(),
         })
 
-    def process_readings(self):
-        if self.__count_avg > 0:
-            self.__avg_temperature /= self.__count_avg
-            self.__count_avg = 0    # Clear the count to prevent process readings acting more than once
+    def readings_into(self, buffer, index):
+        temperature = self.__temperature_stats
+        struct.pack_into("<ffff", buffer, index * 4, self.__fault_triggered, temperature.max(), temperature.min(),
+                         temperature.mean())
+        return index + 4
+
+    def get_temperature_stats(self):
+        # The RunningStats of the temperature readings, for their variance, moving average or percentiles
+        return self.__temperature_stats
 
     def clear_readings(self):
         self.__fault_triggered = False
-        self.__max_temperature = float('-inf')
-        self.__min_temperature = float('inf')
-        self.__avg_temperature = 0
-        self.__count_avg = 0
+        self.__temperature_stats.clear()
@@ -4,13 +4,16 @@
 
 from .common import YukonModule, ADC_FLOAT, IO_LOW, IO_HIGH
 from machine import Pin
+import struct
 from ucollections import OrderedDict
+from pimoroni_yukon.stats import RunningStats, TEMPERATURE_LOW, TEMPERATURE_HIGH
 from pimoroni_yukon.errors import FaultError, OverTemperatureError
 import pimoroni_yukon.logging as logging
 
 
 class DualOutputModule(YukonModule):
     NAME = "Dual Switched Output"
+    READING_NAMES = ("PGood1", "PGood2", "T_max", "T_min", "T_avg")
     OUTPUT_1 = 0
     OUTPUT_2 = 1
     NUM_OUTPUTS = 2
@@ -24,6 +27,8 @@ class DualOutputModule(YukonModule):
         return adc1_level == ADC_FLOAT and slow1 is IO_HIGH and slow2 is IO_LOW and slow3 is IO_HIGH
 
     def __init__(self, halt_on_not_pgood=False):
+        # Made before YukonModule's __init__, as that clears the readings
+        self.__temperature_stats = RunningStats(low=TEMPERATURE_LOW, high=TEMPERATURE_HIGH)
         super().__init__()
         self.halt_on_not_pgood = halt_on_not_pgood
 
@@ -130,29 +135,28 @@ class DualOutputModule(YukonModule):
         self.__power_good_throughout1 = self.__power_good_throughout1 and pgood1
         self.__power_good_throughout2 = self.__power_good_throughout2 and pgood2
 
-        self.__max_temperature = max(temperature, self.__max_temperature)
-        self.__min_temperature = min(temperature, self.__min_temperature)
-        self.__avg_temperature += temperature
-        self.__count_avg += 1
+        self.__temperature_stats.add(temperature)
 
     def get_readings(self):
         return OrderedDict({
             "PGood1": self.__power_good_throughout1,
             "PGood2": self.__power_good_throughout2,
-            "T_max": self.__max_temperature,
-            "T_min": self.__min_temperature,
-            "T_avg": self.__avg_temperature
+            "T_max": self.__temperature_stats.max(),
+            "T_min": self.__temperature_stats.min(),
+            "T_avg": self.__temperature_stats.mean()
         })
 
-    def process_readings(self):
-        if self.__count_avg > 0:
-            self.__avg_temperature /= self.__count_avg
-            self.__count_avg = 0    # Clear the count to prevent process readings acting more than once
+    def readings_into(self, buffer, index):
+        temperature = self.__temperature_stats
+        struct.pack_into("<fffff", buffer, index * 4, self.__power_good_throughout1, self.__power_good_throughout2,
+                         temperature.max(), temperature.min(), temperature.mean())
+        return index + 5
+
+    def get_temperature_stats(self):
+        # The RunningStats of the temperature readings, for their variance, moving average or percentiles
+        return self.__temperature_stats
 
     def clear_readings(self):
         self.__power_good_throughout1 = True
         self.__power_good_throughout2 = True
-        self.__max_temperature = float('-inf')
-        self.__min_temperature = float('inf')
-        self.__avg_temperature = 0
-        self.__count_avg = 0
+        self.__temperature_stats.clear()
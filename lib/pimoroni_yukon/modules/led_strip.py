@@ -4,13 +4,16 @@
 
 from .common import YukonModule, ADC_LOW, IO_HIGH
 from machine import Pin
+import struct
 from ucollections import OrderedDict
+from pimoroni_yukon.stats import RunningStats, TEMPERATURE_LOW, TEMPERATURE_HIGH
 from pimoroni_yukon.errors import FaultError, OverTemperatureError
 import pimoroni_yukon.logging as logging
 
 
 class LEDStripModule(YukonModule):
     NAME = "LED Strip"
+    READING_NAMES = ("PGood", "T_max", "T_min", "T_avg")
     NEOPIXEL = 0
     DUAL_NEOPIXEL = 1
     DOTSTAR = 2
@@ -27,6 +30,8 @@ class LEDStripModule(YukonModule):
         return adc1_level == ADC_LOW and slow1 is IO_HIGH and slow2 is IO_HIGH and slow3 is IO_HIGH
 
     def __init__(self, strip_type, pio, sm, num_leds, brightness=1.0, halt_on_not_pgood=False):
+        # Made before YukonModule's __init__, as that clears the readings
+        self.__temperature_stats = RunningStats(low=TEMPERATURE_LOW, high=TEMPERATURE_HIGH)
         super().__init__()
 
         if strip_type < 0 or strip_type > 2:
@@ -149,27 +154,26 @@ class LEDStripModule(YukonModule):
         self.__last_pgood = pgood
         self.__power_good_throughout = self.__power_good_throughout and pgood
 
-        self.__max_temperature = max(temperature, self.__max_temperature)
-        self.__min_temperature = min(temperature, self.__min_temperature)
-        self.__avg_temperature += temperature
-        self.__count_avg += 1
+        self.__temperature_stats.add(temperature)
 
     def get_readings(self):
         return OrderedDict({
             "PGood": self.__power_good_throughout,
-            "T_max": self.__max_temperature,
-            "T_min": self.__min_temperature,
-            "T_avg": self.__avg_temperature
+            "T_max": self.__temperature_stats.max(),
+            "T_min": self.__temperature_stats.min(),
+            "T_avg": self.__temperature_stats.mean()
         })
 
-    def process_readings(self):
-        if self.__count_avg > 0:
-            self.__avg_temperature /= self.__count_avg
-            self.__count_avg = 0    # Clear the count to prevent process readings acting more than once
+    def readings_into(self, buffer, index):
+        temperature = self.__temperature_stats
+        struct.pack_into("<ffff", buffer, index * 4, self.__power_good_throughout, temperature.max(),
+                         temperature.min(), temperature.mean())
+        return index + 4
+
+    def get_temperature_stats(self):
+        # The RunningStats of the temperature readings, for their variance, moving average or percentiles
+        return self.__temperature_stats
 
     def clear_readings(self):
         self.__power_good_throughout = True
-        self.__max_temperature = float('-inf')
-        self.__min_temperature = float('inf')
-        self.__avg_temperature = 0
-        self.__count_avg = 0
+        self.__temperature_stats.clear()
@@ -0,0 +1,174 @@
+# SPDX-FileCopyrightText: 2023 Christopher Parrott for Pimoroni Ltd
+#
+# SPDX-License-Identifier: MIT
+
+import json
+from pimoroni_yukon.timing import ticks_ms, ticks_us, ticks_diff
+from pimoroni_yukon.stats import LogHistogram
+
+"""
+Timing of the controllers' actions, to see how long each takes and where that time goes. An action, such as
+intake_filament(), is timed as an operation with timed() or operation(), and the waits within it as steps of that
+operation with step(), by category: "servo" for servo moves settling, "stepper" for stepper motion, "sensor" for waiting
+on a sensor, "spool" for spool motor ramps, and "sleep" for monitored sleeps. Each operation, and each step of each
+operation, counts its durations in microseconds into a LogHistogram, so the memory used stays fixed however long the
+board runs. export() gives their counts, totals and percentiles, and how much of each operation no step accounts for.
+
+Only one operation is timed at a time, and a step within a step is not timed separately, so nested time goes to the
+outermost. Steps that overlap, as in the *_async actions, count towards whichever began first. Steps outside an
+operation, such as the main loop's sleeps, are not timed.
+
+Timing is off until enabled is set True. Whilst off, operation() and step() return a shared span that does nothing.
+"""
+
+enabled = False
+
+# Above this, a span is timed with ticks_ms() instead, as ticks_diff() of ticks_us() wraps after about 9 minutes
+LONG_SPAN_MS = 500000
+
+
+class Span:
+    def __init__(self, name, operation=None):
+        self.name = name
+        self.operation = operation      # The operation this is a step of, or None if it is an operation
+        self.histogram = LogHistogram()
+        self.errors = 0                 # How many times it was left by an exception
+        self.steps = {}
+        self.__start_us = 0
+        self.__start_ms = 0
+
+    def __enter__(self):
+        global _operation, _step
+        if self.operation is None:
+            _operation = self
+        else:
+            _step = self
+        self.__start_ms = ticks_ms()
+        self.__start_us = ticks_us()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _operation, _step
+        duration = ticks_diff(ticks_us(), self.__start_us)
+        elapsed_ms = ticks_diff(ticks_ms(), self.__start_ms)
+        if elapsed_ms >= LONG_SPAN_MS:
+            duration = elapsed_ms * 1000
+        self.histogram.add(duration)
+        if exc_type is not None:
+            self.errors += 1
+
+        if self.operation is None:
+            _operation = None
+        _step = None
+        return False
+
+
+class NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NO_SPAN = NoSpan()
+
+_operations = {}
+_operation = None       # The operation being timed, if any
+_step = None            # The step of it being timed, if any
+
+
+def operation(name):
+    # Use as "with spans.operation(name):". Whilst another operation is being timed, this time counts towards that
+    if not enabled or _operation is not None:
+        return NO_SPAN
+    span = _operations.get(name)
+    if span is None:
+        span = Span(name)
+        _operations[name] = span
+    return span
+
+
+def step(name):
+    # Use as "with spans.step(name):". Only timed within an operation, and not within another step
+    operation = _operation
+    if not enabled or operation is None or _step is not None:
+        return NO_SPAN
+    span = operation.steps.get(name)
+    if span is None:
+        span = Span(name, operation)
+        operation.steps[name] = span
+    return span
+
+
+def timed(name):
+    # A decorator timing each call of a function as the operation name
+    def decorator(function):
+        def wrapper(*args, **kwargs):
+            with operation(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_async(name):
+    # As timed(), for a coroutine function
+    def decorator(function):
+        async def wrapper(*args, **kwargs):
+            with operation(name):
+                return await function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def clear():
+    for span in _operations.values():
+        span.histogram.clear()
+        span.errors = 0
+        for step_span in span.steps.values():
+            step_span.histogram.clear()
+            step_span.errors = 0
+
+
+def summarise(span):
+    histogram = span.histogram
+    return {
+        "count": histogram.count(),
+        "errors": span.errors,
+        "total_us": histogram.total(),
+        "min_us": histogram.min(),
+        "mean_us": histogram.mean(),
+        "p50_us": histogram.percentile(0.5),
+        "p90_us": histogram.percentile(0.9),
+        "p99_us": histogram.percentile(0.99),
+        "max_us": histogram.max(),
+        "buckets": histogram.buckets(),
+    }
+
+
+def export():
+    # Each operation's summary, with a summary of each of its steps, and unattributed_us, the time no step accounts for
+    results = {}
+    for name, span in _operations.items():
+        result = summarise(span)
+        result["steps"] = {step_name: summarise(step_span) for step_name, step_span in span.steps.items()}
+        result["unattributed_us"] = result["total_us"] - sum(step_span.histogram.total() for step_span in span.steps.values())
+        results[name] = result
+    return results
+
+
+def save(path):
+    # Write export() as JSON, such as to the board's flash, to be copied off with mpremote
+    with open(path, "w") as file:
+        file.write(json.dumps(export()))
+
+
+def print_summary():
+    print("Operation / step         count  total(ms)  mean(ms)   p90(ms)   max(ms)")
+    for name, result in export().items():
+        rows = [(name, result)] + [("  " + step_name, step_result) for step_name, step_result in result["steps"].items()]
+        for label, row in rows:
+            if row["count"] > 0:
+                print(f"{label:<22} {row['count']:>7} {row['total_us'] / 1000:>10.1f} {row['mean_us'] / 1000:>9.1f} {row['p90_us'] / 1000:>9.1f} {row['max_us'] / 1000:>9.1f}")
+        if result["count"] > 0:
+            print(f"{'  (unattributed)':<22} {'':>7} {result['unattributed_us'] / 1000:>10.1f}")
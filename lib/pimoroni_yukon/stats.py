@@ -0,0 +1,239 @@
+# SPDX-FileCopyrightText: 2023 Christopher Parrott for Pimoroni Ltd
+#
+# SPDX-License-Identifier: MIT
+
+from array import array
+
+"""
+A streaming accumulator for the readings monitor() takes, shared by the Yukon and its modules. Each sample updates it in
+O(1) without a post-processing step: the min and max, the mean and variance by Welford's method, and an exponential
+moving average. Optionally, a fixed set of buckets over a known range gives approximate percentiles, such as a p99
+temperature, to alarm on rather than a bare maximum.
+
+The values are kept as plain attributes rather than in an array('f'), as on MicroPython reading an array('f') boxes a
+new float, whereas each sample's result is a new float anyway. The bucket counts are integers, so are held in an array.
+
+LogHistogram is its counterpart for durations, such as microseconds from ticks_us(), whose range is not known up front.
+It counts whole numbers into power of two buckets, and adding to it uses only small integers, so never allocates.
+"""
+
+# The range temperatures are bucketed over for their percentiles, which spans every temperature limit in use
+TEMPERATURE_LOW = 0.0
+TEMPERATURE_HIGH = 100.0
+
+
+class RunningStats:
+    DEFAULT_EMA_ALPHA = 0.1
+    DEFAULT_BUCKETS = 50
+
+    def __init__(self, ema_alpha=DEFAULT_EMA_ALPHA, low=None, high=None, buckets=DEFAULT_BUCKETS):
+        if ema_alpha <= 0.0 or ema_alpha > 1.0:
+            raise ValueError("ema_alpha out of range. Expected greater than 0.0 and up to 1.0")
+        self.__ema_alpha = ema_alpha
+
+        # The percentile buckets, if a range to spread them over is given. Samples outside it go in the end buckets
+        self.__counts = None
+        if low is not None and high is not None:
+            if high <= low:
+                raise ValueError("high must be greater than low")
+            if buckets < 1:
+                raise ValueError("buckets out of range. Expected 1 or greater")
+            self.__low = low
+            self.__bucket_width = (high - low) / buckets
+            self.__bucket_scale = buckets / (high - low)
+            self.__last_bucket = buckets - 1
+            self.__counts = array('L', [0] * buckets)
+
+        # The moving average and last sample follow the signal across clear(), so are only wiped by reset()
+        self.__ema = None
+        self.__last = None
+        self.clear()
+
+    def clear(self):
+        # Start a new set of readings
+        self.__count = 0
+        self.__min = float('inf')
+        self.__max = float('-inf')
+        self.__mean = 0.0
+        self.__m2 = 0.0
+        counts = self.__counts
+        if counts is not None:
+            for i in range(len(counts)):
+                counts[i] = 0
+
+    def reset(self):
+        self.clear()
+        self.__ema = None
+        self.__last = None
+
+    def add(self, value):
+        # Called by monitor() for every sample, so kept to simple arithmetic
+        count = self.__count + 1
+        self.__count = count
+        if value < self.__min:
+            self.__min = value
+        if value > self.__max:
+            self.__max = value
+
+        delta = value - self.__mean
+        mean = self.__mean + delta / count
+        self.__m2 += delta * (value - mean)
+        self.__mean = mean
+
+        ema = self.__ema
+        self.__ema = value if ema is None else ema + self.__ema_alpha * (value - ema)
+        self.__last = value
+
+        counts = self.__counts
+        if counts is not None:
+            i = int((value - self.__low) * self.__bucket_scale)
+            if i < 0:
+                i = 0
+            elif i > self.__last_bucket:
+                i = self.__last_bucket
+            counts[i] += 1
+
+    def count(self):
+        return self.__count
+
+    def min(self):
+        return self.__min
+
+    def max(self):
+        return self.__max
+
+    def mean(self):
+        return self.__mean
+
+    def variance(self):
+        # The sample variance, or 0.0 until there are two samples
+        return self.__m2 / (self.__count - 1) if self.__count > 1 else 0.0
+
+    def stddev(self):
+        return self.variance() ** 0.5
+
+    def ema(self):
+        # The exponential moving average, or None if nothing has been added since the last reset()
+        return self.__ema
+
+    def last(self):
+        return self.__last
+
+    def percentile(self, fraction):
+        # The value below which fraction (0.0 to 1.0) of the samples fell, to within a bucket's width. This is the top of
+        # the bucket it lands in, held within the min and max seen. None if there are no buckets or no samples
+        counts = self.__counts
+        if counts is None or self.__count == 0:
+            return None
+        if fraction < 0.0 or fraction > 1.0:
+            raise ValueError("fraction out of range. Expected 0.0 to 1.0")
+
+        target = fraction * self.__count
+        total = 0
+        i = 0
+        while i < self.__last_bucket:
+            total += counts[i]
+            if total >= target:
+                break
+            i += 1
+        value = self.__low + (i + 1) * self.__bucket_width
+        return max(min(value, self.__max), self.__min)
+
+
+class LogHistogram:
+    DEFAULT_BUCKETS = 32
+    TOTAL_SPLIT = 1000000       # The total is kept as a count of these plus a remainder, so it stays a small integer
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        if buckets < 1 or buckets > 32:
+            raise ValueError("buckets out of range. Expected 1 to 32")
+        # Bucket 0 holds 0 and 1, and bucket i holds 2^i up to 2^(i + 1) - 1. The last also holds anything larger
+        self.__last_bucket = buckets - 1
+        self.__counts = array('L', [0] * buckets)
+        self.clear()
+
+    def clear(self):
+        self.__count = 0
+        self.__min = 0
+        self.__max = 0
+        self.__total_high = 0
+        self.__total_low = 0
+        counts = self.__counts
+        for i in range(len(counts)):
+            counts[i] = 0
+
+    def add(self, value):
+        # Safe to call from an interrupt, provided value is a small integer. Negative values count as 0
+        if value < 0:
+            value = 0
+        if self.__count == 0 or value < self.__min:
+            self.__min = value
+        if value > self.__max:
+            self.__max = value
+        self.__count += 1
+
+        low = self.__total_low + value
+        if low >= self.TOTAL_SPLIT:
+            high = low // self.TOTAL_SPLIT
+            self.__total_high += high
+            low -= high * self.TOTAL_SPLIT
+        self.__total_low = low
+
+        # The bucket is the position of the highest set bit, found by halving rather than a bit at a time
+        i = 0
+        if value >= 0x10000:
+            value >>= 16
+            i = 16
+        if value >= 0x100:
+            value >>= 8
+            i += 8
+        if value >= 0x10:
+            value >>= 4
+            i += 4
+        if value >= 0x4:
+            value >>= 2
+            i += 2
+        if value >= 0x2:
+            i += 1
+        if i > self.__last_bucket:
+            i = self.__last_bucket
+        self.__counts[i] += 1
+
+    def count(self):
+        return self.__count
+
+    def min(self):
+        return self.__min
+
+    def max(self):
+        return self.__max
+
+    def total(self):
+        return self.__total_high * self.TOTAL_SPLIT + self.__total_low
+
+    def mean(self):
+        return self.total() / self.__count if self.__count > 0 else 0.0
+
+    def buckets(self):
+        # (lowest value, count) for each bucket that has anything in it, lowest first
+        return [(0 if i == 0 else 1 << i, self.__counts[i]) for i in range(len(self.__counts)) if self.__counts[i] > 0]
+
+    def percentile(self, fraction):
+        # The value below which fraction (0.0 to 1.0) of the values fell, to within a factor of two. This is the top of
+        # the bucket it lands in, held within the min and max seen. None if there are no values
+        if self.__count == 0:
+            return None
+        if fraction < 0.0 or fraction > 1.0:
+            raise ValueError("fraction out of range. Expected 0.0 to 1.0")
+
+        counts = self.__counts
+        target = fraction * self.__count
+        total = 0
+        i = 0
+        while i < self.__last_bucket:
+            total += counts[i]
+            if total >= target:
+                break
+            i += 1
+        value = (1 << (i + 1)) - 1
+        return max(min(value, self.__max), self.__min)
@@ -0,0 +1,180 @@
+# SPDX-FileCopyrightText: 2023 Christopher Parrott for Pimoroni Ltd
+#
+# SPDX-License-Identifier: MIT
+
+import json
+from array import array
+from pimoroni_yukon.timing import ticks_ms, ticks_diff
+
+"""
+A fixed-memory recorder of the samples Yukon.monitor() and its modules take, so the history leading up to a trip can
+be pulled off the board afterwards. Samples are (ticks_ms, channel, value) held in a ring of preallocated arrays, so
+recording never allocates, and the oldest are overwritten once it is full.
+
+Each channel is kept at most twice per interval_ms, by its lowest and highest samples in that interval, which replace
+those before them. This stretches the history over more time without losing a spike or dip that did not trip a limit,
+or the sample that did, as that is beyond the others in one direction. A channel that holds steady, such as a fault
+flag, takes one sample per interval. The history covers roughly capacity * interval_ms / (2 * number of channels).
+"""
+
+
+EXPORT_MAGIC = "yukon-telemetry"
+EXPORT_VERSION = 1
+
+
+class TelemetryRecorder:
+    DEFAULT_CAPACITY = 4096         # Samples, at 9 bytes each
+    DEFAULT_INTERVAL_MS = 200
+    MAX_CHANNELS = 255
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, interval_ms=DEFAULT_INTERVAL_MS):
+        if capacity < 1:
+            raise ValueError("capacity out of range. Expected 1 or greater")
+        if interval_ms < 0:
+            raise ValueError("interval_ms out of range. Expected 0 or greater")
+
+        self.capacity = capacity
+        self.interval_ms = int(interval_ms)
+        self.names = []
+
+        # 'I' rather than 'L', as it is 4 bytes on CPython as well, so exports read back the same on a computer
+        self.__ticks = array('I', [0] * capacity)
+        self.__channels = array('B', [0] * capacity)
+        self.__values = array('f', [0] * capacity)
+        self.__head = 0             # Where the next sample goes
+        self.__count = 0            # Samples held, up to the capacity
+
+        # Per channel, where its lowest and highest samples of the current interval are, and when the interval started.
+        # Until the interval has two different values, both are the same sample
+        self.__min_index = array('h')
+        self.__max_index = array('h')
+        self.__interval_start = array('I')
+
+        self.__recording = True
+        self.tripped_ms = None      # ticks_ms() of the fault that stopped recording, if one has
+
+    def add_channels(self, prefix, names):
+        # Add a channel for each name, as prefix + name. Returns the number of the first, with the rest following on.
+        # Channels added before are reused, so reattaching a Yukon records into the same ones
+        names = [prefix + name for name in names]
+        if len(names) > 0 and names[0] in self.names:
+            first = self.names.index(names[0])
+            if self.names[first:first + len(names)] == names:
+                return first
+        first = len(self.names)
+        if first + len(names) > self.MAX_CHANNELS:
+            raise ValueError(f"too many channels. Expected up to {self.MAX_CHANNELS}")
+        for name in names:
+            self.names.append(name)
+            self.__min_index.append(-1)
+            self.__max_index.append(-1)
+            self.__interval_start.append(0)
+        return first
+
+    def record(self, channel, value):
+        # Called from the monitor, so must not allocate
+        if not self.__recording:
+            return
+        now = ticks_ms()
+
+        lowest = self.__min_index[channel]
+        highest = self.__max_index[channel]
+        if lowest >= 0 and self.__channels[lowest] == channel and self.__channels[highest] == channel \
+                and ticks_diff(now, self.__interval_start[channel]) < self.interval_ms:
+            values = self.__values
+            if value < values[lowest]:
+                if lowest == highest:
+                    self.__min_index[channel] = self.__append(now, channel, value)
+                else:
+                    self.__ticks[lowest] = now
+                    values[lowest] = value
+            elif value > values[highest]:
+                if lowest == highest:
+                    self.__max_index[channel] = self.__append(now, channel, value)
+                else:
+                    self.__ticks[highest] = now
+                    values[highest] = value
+            return
+
+        i = self.__append(now, channel, value)
+        self.__min_index[channel] = i
+        self.__max_index[channel] = i
+        self.__interval_start[channel] = now
+
+    def __append(self, now, channel, value):
+        # Write a sample at the head of the ring, returning where it went
+        i = self.__head
+        self.__ticks[i] = now
+        self.__channels[i] = channel
+        self.__values[i] = value
+
+        head = i + 1
+        self.__head = head if head < self.capacity else 0
+        if self.__count < self.capacity:
+            self.__count += 1
+        return i
+
+    def trip(self):
+        # Stop recording, keeping the history that led up to a fault until it has been exported. Only the first counts
+        if self.__recording:
+            self.__recording = False
+            self.tripped_ms = ticks_ms()
+
+    def resume(self):
+        self.__recording = True
+        self.tripped_ms = None
+
+    def is_recording(self):
+        return self.__recording
+
+    def clear(self):
+        self.__head = 0
+        self.__count = 0
+        for channel in range(len(self.names)):
+            self.__min_index[channel] = -1
+            self.__max_index[channel] = -1
+
+    def __len__(self):
+        return self.__count
+
+    def __spans(self):
+        # The (start, end) index ranges holding the samples, oldest first
+        if self.__count < self.capacity:
+            return ((0, self.__count),)
+        return ((self.__head, self.capacity), (0, self.__head))
+
+    def rows(self):
+        # Yields (ticks_ms, name, value) for each sample, oldest first. Allocates, so not for use whilst monitoring
+        for start, end in self.__spans():
+            for i in range(start, end):
+                yield self.__ticks[i], self.names[self.__channels[i]], self.__values[i]
+
+    def export(self, stream):
+        # Write every sample to stream in bulk: a line of JSON describing them, then the ticks, channels and values as
+        # little endian arrays of 4, 1 and 4 byte items, oldest first. Recording is paused whilst they are written
+        header = {
+            "format": EXPORT_MAGIC,
+            "version": EXPORT_VERSION,
+            "names": self.names,
+            "count": self.__count,
+            "interval_ms": self.interval_ms,
+            "now_ms": ticks_ms(),
+            "tripped_ms": self.tripped_ms,
+        }
+        recording = self.__recording
+        self.__recording = False
+        try:
+            stream.write(json.dumps(header).encode())
+            stream.write(b"\n")
+            for samples in (self.__ticks, self.__channels, self.__values):
+                view = memoryview(samples)
+                for start, end in self.__spans():
+                    stream.write(view[start:end])
+        finally:
+            self.__recording = recording
+        return self.__count
+
+    def save(self, path):
+        # Export to a file, such as on the board's flash, to be copied off with mpremote. Returns the samples saved
+        with open(path, "wb") as file:
+            return self.export(file)
@@ -2,7 +2,7 @@
 #
 # SPDX-License-Identifier: MIT
 
-from time import ticks_ms, ticks_add, ticks_diff
+from time import ticks_ms, ticks_us, ticks_add, ticks_diff
 
 
 # Handy class for performing consistent time intervals
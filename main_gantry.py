@@ -4,14 +4,19 @@
 ## GANTRY ##
 
 import time
+import asyncio
 import machine
-import uselect
-import sys
 from utime import ticks_ms, ticks_add
 from pimoroni_yukon import Yukon
+from pimoroni_yukon.telemetry import TelemetryRecorder
+from pimoroni_yukon import spans
 from breakout_ioexpander import BreakoutIOExpander
 
 from mods.motors import GantryMotor, FilamentDriveServo, FilamentLockServo, FilamentBlindDriveMotor
+from mods.sensors import SensorBank
+from mods.runtime import Runtime, wait_until, ramp
+from mods.commands import CommandReader
+from mods import protocol
 
 from pimoroni_yukon import SLOT1 as SLOT_STEPPER1
 from pimoroni_yukon import SLOT2 as SLOT_STEPPER2
@@ -41,6 +46,19 @@ yukon.register_with_slot(module5, SLOT_DC5)      # Register the BigMotorModule o
 yukon.verify_and_initialise()               # Verify that a DualMotorModule is attached to Yukon, and initialise it
 yukon.enable_main_output()                  # Turn on power to the module slots
 
+# Sample current most often, the voltages less so, temperature at 1Hz and one module at a time,
+# leaving more time between monitor checks for motion. yukon.print_monitor_stats() shows the throughput
+yukon.set_monitor_intervals(voltage_in=10, voltage_out=10, current=2, temperature=1000, modules=10, round_robin=True)
+
+# Keep the last minute or so of monitored readings, which a fault stops overwriting. telemetry.save("telemetry.bin")
+# writes them to flash, to be copied off with mpremote and read with "python -m host.telemetry telemetry.bin"
+telemetry = TelemetryRecorder()
+yukon.attach_recorder(telemetry)
+
+# Set to True to time each action, and the servo, stepper, sensor, spool and sleep steps within it.
+# spans.print_summary() shows where the time goes, and spans.save("spans.json") writes it to flash
+spans.enabled = False
+
 ADDRESS = 0x18
 io = BreakoutIOExpander(yukon.i2c, ADDRESS)
 halleffect = 3
@@ -50,49 +68,59 @@ guide_sensor = 6
 filament_input_sensor = 7
 filament_lock_sensor = 8
 
-io.set_mode(halleffect, io.PIN_IN_PU)
-io.set_mode(home_right, io.PIN_IN_PU)
-io.set_mode(home_left, io.PIN_IN_PU)
-io.set_mode(guide_sensor, io.PIN_IN_PU)
-io.set_mode(filament_input_sensor, io.PIN_IN_PU)
-io.set_mode(filament_lock_sensor, io.PIN_IN_PU)
+# All sensors are read together, one I2C read per IO expander port, and reused for up to 2ms
+sensors = SensorBank(io, yukon.i2c, ADDRESS, max_age_ms=2)
+sensors.add("halleffect", halleffect)
+sensors.add("home_right", home_right)
+sensors.add("home_left", home_left)
+sensors.add("guide_sensor", guide_sensor)
+sensors.add("filament_input_sensor", filament_input_sensor, invert=True)
+sensors.add("filament_lock_sensor", filament_lock_sensor, invert=True)
+sensors.initialise()
 
 
-gantryStepper1 = GantryMotor(module1)
+gantryStepper1 = GantryMotor(module1, monitor=yukon)
 gantryStepper1.initialise()
 
-gantryFilamentStepper = FilamentBlindDriveMotor(module2)
+# Homing finds the endstop's edge to within a microstep if the endstop can interrupt the RP2040. Wire the endstop
+# to a spare RP2040 pin (e.g. GP26), or wire the IO expander's INT output instead. Otherwise it is polled over I2C
+home_irq_pin = None
+home_io_int_pin = None
+if home_irq_pin is not None:
+    gantryStepper1.attach_endstop_pin(home_irq_pin)
+elif home_io_int_pin is not None:
+    gantryStepper1.attach_endstop_interrupt(io, home_right, home_io_int_pin)
+
+gantryFilamentStepper = FilamentBlindDriveMotor(module2, monitor=yukon)
 gantryFilamentStepper.initialise()
 
 gantrydriveStepperEngage = -42
 gantrydriveStepperDisengage = -15
 gantrydriveServo_slot = "servo2"
-gantrydriveServo = FilamentDriveServo(module3, gantrydriveServo_slot)
+gantrydriveServo = FilamentDriveServo(module3, gantrydriveServo_slot, monitor=yukon)
 gantrydriveServo.initialise()
 
 lockEngage = 17.5
 lockDisengage = 30
 lockServo_slot = "servo4"
-lockServo = FilamentLockServo(module3, lockServo_slot)
+lockServo = FilamentLockServo(module3, lockServo_slot, monitor=yukon)
 lockServo.initialise()
 
 #module5.enable()   
 
+# Runs the *_async functions below, e.g. runtime.run(intake_filament_async()), with the Yukon monitored alongside
+runtime = Runtime(yukon)
+INTAKE_TIMEOUT = 30     # seconds to feed for before giving up on reaching the lock sensor
+
+# Reads "stop" for the operations that run until told to
+commands = CommandReader()
+
 
 def check_inputs():
-    inputs_state = {
-        "halleffect": io.input(halleffect),
-        "home_right": io.input(home_right),
-        "home_left": io.input(home_left),
-        "guide_sensor": io.input(guide_sensor),
-        "filament_input_sensor": 1 - io.input(filament_input_sensor),
-        "filament_lock_sensor": 1 - io.input(filament_lock_sensor),
-    }
-    return inputs_state
+    return sensors.to_dict()
 
 def get_input_state(input_name):
-    input_states = check_inputs()  # Get the current states
-    return input_states.get(input_name, None)#
+    return sensors.get(input_name)
 
 def check_intake():
     input_states = check_inputs()  # Get the current states
@@ -104,60 +132,72 @@ def check_output():
     if not input_states.get("filament_input_sensor", None):
         print("Slow down!")
 
+@spans.timed("home")
 def home():
-    lockServo.disengage(lockDisengage)
-    gantrydriveServo.disengage(gantrydriveStepperDisengage)
-    yukon.monitored_sleep(1)
-    gantryStepper1.home("right", lambda: io.input(home_right))
+    lock_move = lockServo.disengage(lockDisengage)
+    gantrydriveServo.disengage(gantrydriveStepperDisengage, fallback_s=1).wait(yukon)
+    lock_move.wait(yukon)
+    gantryStepper1.home("right", lambda: sensors.get("home_right"))
     yukon.monitored_sleep(0.5)
     print("Home Success")
     
 def move_left(steps):
-    gantryStepper1.move_to_position(gantryStepper1.current_position + steps, lambda: io.input(halleffect), lambda: io.input(home_right), lambda: io.input(home_left))
+    gantryStepper1.move_to_position(gantryStepper1.current_position + steps, lambda: sensors.get("halleffect"), lambda: sensors.get("home_right"), lambda: sensors.get("home_left"))
     print("Movement Successful")
 
 def move_right(steps):
-    gantryStepper1.move_to_position(gantryStepper1.current_position - steps, lambda: io.input(halleffect), lambda: io.input(home_right), lambda: io.input(home_left))
+    gantryStepper1.move_to_position(gantryStepper1.current_position - steps, lambda: sensors.get("halleffect"), lambda: sensors.get("home_right"), lambda: sensors.get("home_left"))
+    print("Movement Successful")
+
+def move_to(station):
+    gantryStepper1.move_to_position(station, lambda: sensors.get("halleffect"), lambda: sensors.get("home_right"), lambda: sensors.get("home_left"))
     print("Movement Successful")
 
+def calibrate():
+    # Records each station's position so move_to() can make one long move. Run again if the stations move
+    stations = gantryStepper1.calibrate(lambda: sensors.get("halleffect"), lambda: sensors.get("home_right"), lambda: sensors.get("home_left"))
+    print(f"Calibrated {stations} stations")
+    return stations
+
 def starting_state():
-    lockServo.disengage(lockDisengage)
-    yukon.monitored_sleep(1)
-    gantrydriveServo.disengage(gantrydriveStepperDisengage)
-    yukon.monitored_sleep(1)
+    lock_move = lockServo.disengage(lockDisengage, fallback_s=1)
+    gantrydriveServo.disengage(gantrydriveStepperDisengage, fallback_s=1).wait(yukon)
+    lock_move.wait(yukon)
     lockstate = 0
 
-    gantryStepper1.home("right", lambda: io.input(home_right))
+    gantryStepper1.home("right", lambda: sensors.get("home_right"))
     yukon.monitored_sleep(0.5)
     
     yukon.monitored_sleep(1)
 
+@spans.timed("intake_filament")
 def intake_filament():
     if get_input_state("halleffect") and get_input_state("filament_input_sensor") and get_input_state("guide_sensor"):
-        gantrydriveServo.engage(gantrydriveStepperEngage)
-        yukon.monitored_sleep(0.1)
+        gantrydriveServo.engage(gantrydriveStepperEngage, fallback_s=0.1).wait(yukon)
         lockServo.disengage(lockDisengage)
-        while not get_input_state("filament_lock_sensor"):
-            gantryFilamentStepper.extrude_while()
+        with spans.step("sensor"):
+            while not get_input_state("filament_lock_sensor"):
+                gantryFilamentStepper.extrude_while()
         yukon.monitored_sleep(0.1)
         if get_input_state("filament_lock_sensor"):
             gantryFilamentStepper.stop()
             print("Creep a bit more into the lock")
             yukon.monitored_sleep(1)
             gantryFilamentStepper.extrude_filament_blind(25, 5)
-            lockServo.engage(lockEngage)
-            yukon.monitored_sleep(1)
-            gantrydriveServo.disengage(gantrydriveStepperDisengage)
-            yukon.monitored_sleep(0.1)
+            lockServo.engage(lockEngage, fallback_s=1).wait(yukon)
+            gantrydriveServo.disengage(gantrydriveStepperDisengage, fallback_s=0.1).wait(yukon)
             print("Intake successful.")
+            return True
         else:
             print("Loading failed")
             gantrydriveServo.disengage(gantrydriveStepperDisengage)
+            return False
     else:
         print("Conditions not met to intake filament")
         print(get_input_state("home_right"))
         print(get_input_state("filament_input_sensor"))
         print(get_input_state("guide_sensor"))
+        return False
         
         
 def initial_spool(load_time):
@@ -175,16 +215,17 @@ def initial_spool(load_time):
     
     elapsed_time = (ticks_ms() - start_time) / 1000.0
     
-    while elapsed_time < load_time:
-        elapsed_time = (ticks_ms() - start_time) / 1000.0
-        yukon.monitored_sleep(0.1)
-        print(elapsed_time)
+    with spans.step("spool"):
+        while elapsed_time < load_time:
+            elapsed_time = (ticks_ms() - start_time) / 1000.0
+            yukon.monitored_sleep(0.1)
+            print(elapsed_time)
     module5.motor.speed(0)
     gantryFilamentStepper.stop()
-    gantrydriveServo.disengage(gantrydriveStepperDisengage)        
-    yukon.monitored_sleep(0.1)
+    gantrydriveServo.disengage(gantrydriveStepperDisengage, fallback_s=0.1).wait(yukon)
     
         
+@spans.timed("spool_up")
 def spool_up(time, speed):
     # Divide the total time equally among the three phases
     RAMP_UP_TIME = 5
@@ -232,8 +273,7 @@ def spool_up(time, speed):
             module5.disable()
             yukon.monitored_sleep(0.1)
             lockServo.disengage(lockDisengage)
-            gantrydriveServo.engage(gantrydriveStepperEngage)
-            yukon.monitored_sleep(0.1)
+            gantrydriveServo.engage(gantrydriveStepperEngage, fallback_s=0.1).wait(yukon)
             print("Spool successful.")
             break  # Exit the loop
 
@@ -244,9 +284,10 @@ def spool_up(time, speed):
         current_time = ticks_add(current_time, int(1000 / UPDATES))
 
         # Monitor sensors until the current time is reached
-        yukon.monitor_until_ms(current_time)
+        with spans.step("spool"):
+            yukon.monitor_until_ms(current_time)
         
-def spool_up_until(speed):
+def spool_up_until(speed, load_time=30):
     # Constants
     RAMP_UP_TIME = 5
     RAMP_DOWN_TIME = 5
@@ -256,17 +297,14 @@ def spool_up_until(speed):
     lockServo.engage(lockEngage)
     module5.enable()
     
-    initial_spool()  # Load up spool
+    initial_spool(load_time)  # Load up spool
     
     # Initialize variables
     start_time = ticks_ms()  # Start time in milliseconds
     current_time = start_time
     unlock = False           # Status flag for unlocking
     lockDisengage = True     # Placeholder for lock disengage action
-
-    # Set up input polling
-    poller = uselect.poll()
-    poller.register(sys.stdin, uselect.POLLIN)
+    commands.clear_stop()
 
     # Ramp-up phase
     while (ticks_ms() - start_time) / 1000.0 <= RAMP_UP_TIME:
@@ -274,23 +312,25 @@ def spool_up_until(speed):
         speed = (elapsed_time / RAMP_UP_TIME) * SPEED_EXTENT
         module5.motor.speed(speed)
 
+        # Monitor until the next update time
+        current_time = ticks_add(current_time, int(1000 / UPDATES))
+        yukon.monitor_until_ms(current_time)
+
     # Maintain full speed until stop command is received
     print("**Full Speed Phase**")
     module5.motor.speed(SPEED_EXTENT)
 
     try:
-        while True:
-            # Check for input without blocking
-            events = poller.poll(0)
-            if events:
-                command = sys.stdin.readline().strip()
-                if command.lower() == "stop":
-                    break  # Exit to start the ramp-down
+        # Monitor whilst waiting for the stop command
+        commands.wait_for_stop(yukon)
 
     finally:
+        commands.acknowledge_stop()
+
         # Ramp-down phase
         print("**Ramp Down Phase**")
         start_time = ticks_ms()
+        current_time = start_time
         while (ticks_ms() - start_time) / 1000.0 <= RAMP_DOWN_TIME:
             if not unlock:
                 lockServo.disengage(lockDisengage)  # Disengage the lock
@@ -300,12 +340,14 @@ def spool_up_until(speed):
             speed = (remaining_time / RAMP_DOWN_TIME) * SPEED_EXTENT
             module5.motor.speed(speed)
 
+            current_time = ticks_add(current_time, int(1000 / UPDATES))
+            yukon.monitor_until_ms(current_time)
+
         # Stop the motor and disable
         module5.motor.speed(0)
         module5.disable()
         yukon.monitored_sleep(0.1)
-        gantrydriveServo.engage(gantrydriveStepperEngage)
-        yukon.monitored_sleep(0.1)
+        gantrydriveServo.engage(gantrydriveStepperEngage, fallback_s=0.1).wait(yukon)
         print("Spool successful.")
 
 
@@ -321,6 +363,7 @@ def retreiveFilament():
     print("Filament retrieved.")
 
 
+@spans.timed("deliverFilament")
 def deliverFilament(length=25):
     gantrydriveServo.engage(gantrydriveStepperEngage)
     module5.enable() 
@@ -333,26 +376,18 @@ def deliverFilament(length=25):
 def deliverFilamentUntil():
     #print("Prime to begin output")
     yukon.monitored_sleep(0.5)
-    gantrydriveServo.engage(gantrydriveStepperEngage)
-    yukon.monitored_sleep(0.5)
+    gantrydriveServo.engage(gantrydriveStepperEngage, fallback_s=0.5).wait(yukon)
     print("Filament delivery started")
 
-    poller = uselect.poll()
-    poller.register(sys.stdin, uselect.POLLIN)
+    commands.clear_stop()
     gantryFilamentStepper.extrude_while(-1)  
 
     try:
-        while True:
-            # This is where the stepper continuously extrudes
-            # Check for input without blocking
-            events = poller.poll(0)
-            if events:
-                command = sys.stdin.readline().strip()
-                if command.lower() == "stop":
-                    gantryFilamentStepper.stop()
-                    #print("Delivery interrupted by REPL command")
-                    break
+        # The stepper continuously extrudes, whilst monitoring and waiting for the stop command
+        commands.wait_for_stop(yukon)
     finally:
+        gantryFilamentStepper.stop()
+        commands.acknowledge_stop()
         gantrydriveServo.disengage(gantrydriveStepperDisengage)
         print("Filament delivery stopped")
 
@@ -368,11 +403,9 @@ def unspoolTension():
     module5.enable()
     gantrydriveServo.disengage(gantrydriveStepperDisengage)
     print("Tension off.")
-    input_states = check_inputs()
-    print(input_states.get("filament_input_sensor", None))
-    while input_states.get("filament_input_sensor", None):
+    print(get_input_state("filament_input_sensor"))
+    while get_input_state("filament_input_sensor"):
         module5.motor.speed(-0.2)
-        input_states = check_inputs()
     print("Filament off spool.")
     speed = 0  # Stop the motor
     module5.motor.speed(speed)  # Apply the stop command
@@ -380,14 +413,95 @@ def unspoolTension():
     yukon.monitored_sleep(0.5)
 
 
+@spans.timed_async("intake_filament_async")
+async def intake_filament_async():
+    if not (get_input_state("halleffect") and get_input_state("filament_input_sensor") and get_input_state("guide_sensor")):
+        print("Conditions not met to intake filament")
+        return False
+
+    # The drive servo engages whilst the lock opens, rather than one after the other
+    await asyncio.gather(gantrydriveServo.engage_async(gantrydriveStepperEngage, fallback_s=0.1),
+                         lockServo.disengage_async(lockDisengage))
+
+    gantryFilamentStepper.extrude_while()
+    try:
+        locked = await wait_until(lambda: get_input_state("filament_lock_sensor"), INTAKE_TIMEOUT)
+    finally:
+        gantryFilamentStepper.stop()
 
+    if not locked:
+        print("Loading failed")
+        await gantrydriveServo.disengage_async(gantrydriveStepperDisengage)
+        return False
 
+    print("Creep a bit more into the lock")
+    await gantryFilamentStepper.extrude_filament_blind_async(25, 5)
+    await lockServo.engage_async(lockEngage, fallback_s=1)
+    await gantrydriveServo.disengage_async(gantrydriveStepperDisengage, fallback_s=0.1)
+    print("Intake successful.")
+    return True
 
 
+async def initial_spool_async(load_time):
+    # The lock closes whilst the drive servo engages
+    await asyncio.gather(gantrydriveServo.engage_async(gantrydriveStepperEngage + 10),
+                         lockServo.engage_async(lockEngage - 1))
 
+    gantryFilamentStepper.extrude_while_fast()
+    module5.enable()
+    module5.motor.speed(0.05)
+    try:
+        with spans.step("spool"):
+            await asyncio.sleep(load_time)
+    finally:
+        module5.motor.speed(0)
+        gantryFilamentStepper.stop()
+    await gantrydriveServo.disengage_async(gantrydriveStepperDisengage, fallback_s=0.1)
 
 
+@spans.timed_async("spool_up_async")
+async def spool_up_async(time, speed, load_time=30):
+    RAMP_UP_TIME = 5
+    RAMP_DOWN_TIME = 5
 
+    await initial_spool_async(load_time)
+    await lockServo.engage_async(lockEngage)
 
+    print("**Ramp Up Phase**")
+    await ramp(module5.motor, 0, speed, RAMP_UP_TIME)
+    print("**Full Speed Phase**")
+    with spans.step("spool"):
+        await asyncio.sleep(time)
 
+    # The lock opens as the ramp down begins, rather than holding it up
+    print("**Ramp Down Phase**")
+    await asyncio.gather(lockServo.disengage_async(lockDisengage),
+                         ramp(module5.motor, speed, 0, RAMP_DOWN_TIME))
 
+    module5.motor.speed(0)
+    module5.disable()
+    await gantrydriveServo.engage_async(gantrydriveStepperEngage, fallback_s=0.1)
+    print("Spool successful.")
+
+
+# The functions a host can call over the binary protocol (mods/protocol.py). serve() hands the
+# USB serial port over to the protocol until the host sends OP_EXIT, returning to the REPL
+handlers = {
+    protocol.OP_GANTRY_HOME: home,
+    protocol.OP_GANTRY_MOVE_LEFT: move_left,
+    protocol.OP_GANTRY_MOVE_RIGHT: move_right,
+    protocol.OP_GANTRY_MOVE_TO: move_to,
+    protocol.OP_GANTRY_INTAKE: intake_filament,
+    protocol.OP_GANTRY_SPOOL_UP: spool_up,
+    protocol.OP_GANTRY_SPOOL_UP_UNTIL: spool_up_until,
+    protocol.OP_GANTRY_RETRIEVE: retreiveFilament,
+    protocol.OP_GANTRY_DELIVER: deliverFilament,
+    protocol.OP_GANTRY_DELIVER_UNTIL: deliverFilamentUntil,
+    protocol.OP_GANTRY_HOME_FILAMENT: homeFilament,
+    protocol.OP_GANTRY_UNSPOOL_TENSION: unspoolTension,
+    protocol.OP_GANTRY_CALIBRATE: calibrate,
+}
+server = protocol.Server(handlers, monitor=yukon, commands=commands)
+
+def serve():
+    server.serve()
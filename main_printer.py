@@ -4,13 +4,18 @@
 ## PRINTER ##
 
 import time
-import uselect
-import sys
-from utime import ticks_ms, ticks_add
+import asyncio
+from utime import ticks_ms, ticks_add, ticks_diff
 from pimoroni_yukon import Yukon
+from pimoroni_yukon.telemetry import TelemetryRecorder
+from pimoroni_yukon import spans
 from breakout_ioexpander import BreakoutIOExpander
 
 from mods.motors import FilamentDriveServo, FilamentLockServo, FilamentBlindDriveMotor, dockingServo
+from mods.sensors import SensorBank
+from mods.runtime import Runtime, wait_until, ramp
+from mods.commands import CommandReader
+from mods import protocol
 
 from pimoroni_yukon import SLOT1 as SLOT_DC1
 from pimoroni_yukon import SLOT2 as SLOT_STEPPER1
@@ -35,6 +40,19 @@ yukon.register_with_slot(module3, SLOT_SERVO1)      # Register the DualMotorModu
 yukon.verify_and_initialise()               # Verify that a DualMotorModule is attached to Yukon, and initialise it
 yukon.enable_main_output()                  # Turn on power to the module slots
 
+# Sample current most often, the voltages less so, temperature at 1Hz and one module at a time,
+# leaving more time between monitor checks for motion. yukon.print_monitor_stats() shows the throughput
+yukon.set_monitor_intervals(voltage_in=10, voltage_out=10, current=2, temperature=1000, modules=10, round_robin=True)
+
+# Keep the last minute or so of monitored readings, which a fault stops overwriting. telemetry.save("telemetry.bin")
+# writes them to flash, to be copied off with mpremote and read with "python -m host.telemetry telemetry.bin"
+telemetry = TelemetryRecorder()
+yukon.attach_recorder(telemetry)
+
+# Set to True to time each action, and the servo, stepper, sensor, spool and sleep steps within it.
+# spans.print_summary() shows where the time goes, and spans.save("spans.json") writes it to flash
+spans.enabled = False
+
 module1.enable()  
 
 ADDRESS = 0x18
@@ -46,47 +64,52 @@ filament_lock_sensor = 5
 
 power_fls_sensor = 1
 
-io.set_mode(intake_sensor, io.PIN_IN_PU)
-io.set_mode(guide_sensor, io.PIN_IN_PU)
-io.set_mode(filament_lock_sensor, io.PIN_IN_PU)
+# All sensors are read together, one I2C read per IO expander port, and reused for up to 2ms
+sensors = SensorBank(io, yukon.i2c, ADDRESS, max_age_ms=2)
+sensors.add("intake_sensor", intake_sensor, invert=True)
+sensors.add("guide_sensor", guide_sensor)
+sensors.add("filament_lock_sensor", filament_lock_sensor, invert=True)
+sensors.initialise()
+
 io.set_mode(power_fls_sensor, io.PIN_OUT)
 
 io.output(power_fls_sensor, 1)
 
-printerFilamentStepper = FilamentBlindDriveMotor(module2)
+printerFilamentStepper = FilamentBlindDriveMotor(module2, monitor=yukon)
 printerFilamentStepper.initialise()
  
 inputEngage = -9
 inputDisengage = -37
 inputServo_slot = "servo1"
-inputServo = dockingServo(module3, inputServo_slot)
+inputServo = dockingServo(module3, inputServo_slot, monitor=yukon)
 inputServo.initialise()
 
 printerdriveStepperEngage = 5
 printerdriveStepperDisengage = 37
 printerdriveServo_slot = "servo2"
-printerdriveServo = FilamentDriveServo(module3, printerdriveServo_slot)
+printerdriveServo = FilamentDriveServo(module3, printerdriveServo_slot, monitor=yukon)
 printerdriveServo.initialise()
 
 lockEngage = 12
 lockEngage_strong = 5
 lockDisengage = 28
 lockServo_slot = "servo3"
-lockServo = FilamentLockServo(module3, lockServo_slot)
+lockServo = FilamentLockServo(module3, lockServo_slot, monitor=yukon)
 lockServo.initialise()
 
+# Runs the *_async functions below, e.g. runtime.run(intake_filament_async()), with the Yukon monitored alongside
+runtime = Runtime(yukon)
+INTAKE_TIMEOUT = 30     # seconds to feed for before giving up on reaching the lock sensor
+
+# Reads "stop" for the operations that run until told to
+commands = CommandReader()
+
 
 def check_inputs():
-    inputs_state = {
-        "intake_sensor": not io.input(intake_sensor),
-        "guide_sensor": bool(io.input(guide_sensor)),
-        "filament_lock_sensor": not io.input(filament_lock_sensor),
-    }
-    return inputs_state
+    return sensors.to_dict()
 
 def get_input_state(input_name):
-    input_states = check_inputs()  # Get the current states
-    return input_states.get(input_name, None)
+    return sensors.get(input_name)
 
 def check_intake():
     input_states = check_inputs()  # Get the current states
@@ -105,17 +128,17 @@ def wait_for_intake(sensor=intake_sensor, timeout=60):
     return False
     
 
+@spans.timed("dock")
 def dock():
-    inputServo.engage(inputEngage)
-    yukon.monitored_sleep(0.5)
+    inputServo.engage(inputEngage, fallback_s=1.5).wait(yukon)
     print("Dock successful.")
     
 def undock():
-    inputServo.disengage(inputDisengage)
-    yukon.monitored_sleep(0.5)
+    inputServo.disengage(inputDisengage, fallback_s=1.5).wait(yukon)
     print("Undock successful.")
 
 
+@spans.timed("spool_up")
 def spool_up(time, max_speed = 1):
     # Divide the total time equally among the three phases
     RAMP_UP_TIME = 10
@@ -130,10 +153,8 @@ def spool_up(time, max_speed = 1):
     # Initialize variables
     start_time = ticks_ms()  # Start time in milliseconds
     current_time = start_time
-    lockServo.engage(lockEngage_strong)
-    time.sleep(0.5)
-    printerdriveServo.disengage(printerdriveStepperDisengage)
-    time.sleep(1)
+    lockServo.engage(lockEngage_strong, fallback_s=0.5).wait(yukon)
+    printerdriveServo.disengage(printerdriveStepperDisengage, fallback_s=1).wait(yukon)
     unlock = False           # Status flag for unlocking
     while True:
         # Check the sensor state and stop if the sensor is low
@@ -170,7 +191,8 @@ def spool_up(time, max_speed = 1):
         current_time = ticks_add(current_time, int(1000 / UPDATES))
 
         # Monitor sensors until the current time is reached
-        yukon.monitor_until_ms(current_time)
+        with spans.step("spool"):
+            yukon.monitor_until_ms(current_time)
         
 def spool_up_until(max_speed = 1):
     # Constants
@@ -181,18 +203,14 @@ def spool_up_until(max_speed = 1):
     SPEED_EXTENT = -max_speed  # Maximum speed to ramp to
     UPDATES = 20       # Updates per second
 
-    lockServo.engage(lockEngage_strong)
-    time.sleep(0.5)
-    printerdriveServo.disengage(printerdriveStepperDisengage)
-    time.sleep(1)
+    lockServo.engage(lockEngage_strong, fallback_s=0.5).wait(yukon)
+    printerdriveServo.disengage(printerdriveStepperDisengage, fallback_s=1).wait(yukon)
 
     # Initialize variables
     start_time = ticks_ms()  # Start time in milliseconds
     current_time = start_time
 
-    # Set up input polling
-    poller = uselect.poll()
-    poller.register(sys.stdin, uselect.POLLIN)
+    commands.clear_stop()
 
     # Ramp-up phase
     while True:
@@ -220,18 +238,12 @@ def spool_up_until(max_speed = 1):
     module1.motor.speed(SPEED_EXTENT)
 
     try:
-        while True:
-            # Check for input without blocking
-            events = poller.poll(0)
-            if events:
-                command = sys.stdin.readline().strip()
-                if command.lower() == "stop":
-                    break  # Exit to start the ramp down
-
-            # Include a small delay to prevent CPU overload
-            time.sleep(0.05)
+        # Monitor whilst waiting for the stop command
+        commands.wait_for_stop(yukon)
 
     finally:
+        commands.acknowledge_stop()
+
         # Ramp-down phase
         print("**RAMP DOWN**")
         start_down_time = ticks_ms()
@@ -258,34 +270,102 @@ def spool_up_until(max_speed = 1):
 
 
         
+@spans.timed("intake_filament")
 def intake_filament():
     if get_input_state("intake_sensor") and get_input_state("guide_sensor"):
-        printerdriveServo.engage(printerdriveStepperEngage)
-        yukon.monitored_sleep(0.1)
-        lockServo.disengage(lockDisengage)
-        yukon.monitored_sleep(0.1)
-        while not get_input_state("filament_lock_sensor"):
-            #printerFilamentStepper.extrude_while()
-            printerFilamentStepper.extrude_filament_blind(5, 1)
+        printerdriveServo.engage(printerdriveStepperEngage, fallback_s=0.1).wait(yukon)
+        lockServo.disengage(lockDisengage, fallback_s=0.1).wait(yukon)
+        with spans.step("sensor"):
+            while not get_input_state("filament_lock_sensor"):
+                #printerFilamentStepper.extrude_while()
+                printerFilamentStepper.extrude_filament_blind(5, 1)
         yukon.monitored_sleep(0.1)
         if get_input_state("filament_lock_sensor"):
             printerFilamentStepper.stop()
             print("Creep a bit more into the lock")
             yukon.monitored_sleep(1)
             printerFilamentStepper.extrude_filament_blind(40, 5)
-            lockServo.engage(lockEngage)
-            yukon.monitored_sleep(1)
+            lockServo.engage(lockEngage, fallback_s=1).wait(yukon)
             printerdriveServo.disengage(printerdriveStepperDisengage)
             print("Intake complete.")
             yukon.monitored_sleep(0.1)
+            return True
         else:
             print("Loading failed")
-            printerdriveServo.disengage(printerdriveStepperDisengage0)
+            printerdriveServo.disengage(printerdriveStepperDisengage)
+            return False
     else:
         print("Conditions not met to intake filament")
         print(get_input_state("filament_input_sensor"))
         print(get_input_state("guide_sensor"))
+        return False
+
+
+@spans.timed_async("intake_filament_async")
+async def intake_filament_async():
+    if not (get_input_state("intake_sensor") and get_input_state("guide_sensor")):
+        print("Conditions not met to intake filament")
+        return False
+
+    # The drive servo engages whilst the lock opens, rather than one after the other
+    await asyncio.gather(printerdriveServo.engage_async(printerdriveStepperEngage, fallback_s=0.1),
+                         lockServo.disengage_async(lockDisengage, fallback_s=0.1))
+
+    feed_end = ticks_add(ticks_ms(), INTAKE_TIMEOUT * 1000)
+    while not get_input_state("filament_lock_sensor"):
+        if ticks_diff(feed_end, ticks_ms()) <= 0:
+            print("Loading failed")
+            await printerdriveServo.disengage_async(printerdriveStepperDisengage)
+            return False
+        await printerFilamentStepper.extrude_filament_blind_async(5, 1)
+
+    print("Creep a bit more into the lock")
+    await printerFilamentStepper.extrude_filament_blind_async(40, 5)
+    await lockServo.engage_async(lockEngage, fallback_s=1)
+    await printerdriveServo.disengage_async(printerdriveStepperDisengage)
+    print("Intake complete.")
+    return True
 
 
+@spans.timed_async("spool_up_async")
+async def spool_up_async(time, max_speed=1):
+    RAMP_UP_TIME = 10
+    RAMP_DOWN_TIME = 5
+
+    SPEED_EXTENT = -min(max_speed, 1)       # The maximum speed to ramp to, reversed
+
+    await lockServo.engage_async(lockEngage_strong, fallback_s=0.5)
+    await printerdriveServo.disengage_async(printerdriveStepperDisengage, fallback_s=1)
+
+    # Spooling stops early if the filament leaves the intake sensor
+    def intake_lost():
+        return get_input_state("intake_sensor") == 0
 
+    completed = False
+    try:
+        completed = (await ramp(module1.motor, 0, SPEED_EXTENT, RAMP_UP_TIME, intake_lost)
+                     and not await wait_until(intake_lost, time)
+                     and await ramp(module1.motor, SPEED_EXTENT, 0, RAMP_DOWN_TIME, intake_lost))
+    finally:
+        module1.motor.speed(0)
+        lockServo.disengage(lockDisengage)
 
+    if completed:
+        print("Spool up complete.")
+    return completed
+
+
+# The functions a host can call over the binary protocol (mods/protocol.py). serve() hands the
+# USB serial port over to the protocol until the host sends OP_EXIT, returning to the REPL
+handlers = {
+    protocol.OP_PRINTER_DOCK: dock,
+    protocol.OP_PRINTER_UNDOCK: undock,
+    protocol.OP_PRINTER_INTAKE: intake_filament,
+    protocol.OP_PRINTER_SPOOL_UP: spool_up,
+    protocol.OP_PRINTER_SPOOL_UP_UNTIL: spool_up_until,
+    protocol.OP_PRINTER_WAIT_FOR_INTAKE: lambda timeout: wait_for_intake(timeout=timeout),
+}
+server = protocol.Server(handlers, monitor=yukon, commands=commands)
+
+def serve():
+    server.serve()
@@ -14,7 +14,7 @@ class StepperServoSet:
         # driveStepperEngage: Default position value to engage the stepper motor.
         # driveStepperDisengage: Default position value to disengage the stepper motor.
         # Initialize the stepper motor
-        self.stepper = FilamentDriveMotor(motor_module, filament_counter, io)
+        self.stepper = FilamentDriveMotor(motor_module, filament_counter, io, monitor=yukon)
         self.stepper.initialise()
 
         # Store engage and disengage positions for driveStepper
@@ -22,50 +22,46 @@ class StepperServoSet:
         self.driveStepperDisengage = driveStepperDisengage
 
         # Initialize the drive servo
-        self.driveServo = FilamentDriveServo(servo_module, servo_slot)
+        self.driveServo = FilamentDriveServo(servo_module, servo_slot, monitor=yukon)
         self.driveServo.initialise()
 
     def engage_drive_servo(self):
-        self.driveServo.engage(self.driveStepperEngage)
+        return self.driveServo.engage(self.driveStepperEngage)
 
     def disengage_drive_servo(self):
-        self.driveServo.disengage(self.driveStepperDisengage)
+        return self.driveServo.disengage(self.driveStepperDisengage)
 
     def extrude_filament(self, amount):
         self.engage_drive_servo()
-        self.stepper.extrude_length(amount)
+        overshoot = self.stepper.extrude_length(amount)
         self.disengage_drive_servo()
+        return overshoot
 
     def extrude_filament_until(self):
         self.engage_drive_servo()
         self.stepper.extrude_while()
 
     def deliver_filament(self, amount):
-        self.engage_drive_servo()
-        self.stepper.extrude_length(amount)
-        self.disengage_drive_servo()
+        with spans.operation("deliver_filament"):
+            self.engage_drive_servo()
+            overshoot = self.stepper.extrude_length(amount)
+            self.disengage_drive_servo()
         print("Filament delivery successful.")
+        print(f"Overshoot: {overshoot:.2f} mm")
+        return overshoot
 
     def deliver_filament_until(self):
         self.engage_drive_servo()
+        commands.clear_stop()
         self.stepper.extrude_while()
         print("Filament delivery started")
 
-        poller = uselect.poll()
-        poller.register(sys.stdin, uselect.POLLIN)
         try:
-            is_running = True
-            while is_running:
-                # Run extrude_while continuously
-                # Check for input without blocking
-                events = poller.poll(0)  # 0 timeout means non-blocking
-                if events:
-                    command = sys.stdin.readline().strip()
-                    if command.lower() == "stop":
-                        self.stepper.stop()
-                        is_running = False
-                        break
+            # Run extrude_while continuously, whilst monitoring and waiting for the stop command
+            commands.wait_for_stop(yukon)
         finally:
+            self.stepper.stop()
+            commands.acknowledge_stop()
             self.disengage_drive_servo()
             print("Filament delivery stopped")
 
@@ -82,34 +78,70 @@ class StepperServoSet:
         self.disengage_drive_servo()
         print("Pull out successful.")
 
+    async def engage_drive_servo_async(self):
+        await self.driveServo.engage_async(self.driveStepperEngage)
+
+    async def disengage_drive_servo_async(self):
+        await self.driveServo.disengage_async(self.driveStepperDisengage)
+
+    async def little_push_async(self):
+        await self.engage_drive_servo_async()
+        await self.stepper.extrude_filament_blind_async(50, 5)
+        await self.stepper.extrude_filament_blind_async(-50, 5)
+        await self.disengage_drive_servo_async()
+        print("Little push successful.")
+
+    async def pull_out_async(self):
+        await self.engage_drive_servo_async()
+        await self.stepper.extrude_filament_blind_async(-500, 50)
+        await self.disengage_drive_servo_async()
+        print("Pull out successful.")
+
 def dock():
-    outputServo.engage(outputEngage)
-    yukon.monitored_sleep(0.5)
+    with spans.operation("dock"):
+        outputServo.engage(outputEngage, fallback_s=0.5).wait(yukon)
     print("Dock successful.")
     
 def undock():
-    outputServo.disengage(outputDisengage)
-    yukon.monitored_sleep(0.5)
+    outputServo.disengage(outputDisengage, fallback_s=0.5).wait(yukon)
     print("Undock successful.")
     
 def cutFilament():
     #print("Cut filament")
-    cutterServo.engage(cutterEngage)
-    yukon.monitored_sleep(0.5) #Let it rest before taking values
-    cutterServo.disengage(cutterDisengage)
-    yukon.monitored_sleep(0.5) #Let it rest before taking values
+    with spans.operation("cutFilament"):
+        cutterServo.engage(cutterEngage, fallback_s=0.5).wait(yukon)
+        cutterServo.disengage(cutterDisengage, fallback_s=0.5).wait(yukon)
+    print("Filament cutting successful.")
+
+async def dock_async():
+    with spans.operation("dock_async"):
+        await outputServo.engage_async(outputEngage, fallback_s=0.5)
+    print("Dock successful.")
+
+async def undock_async():
+    await outputServo.disengage_async(outputDisengage, fallback_s=0.5)
+    print("Undock successful.")
+
+async def cut_and_undock_async():
+    # The cutter returns whilst the output undocks, rather than one after the other
+    await cutterServo.engage_async(cutterEngage, fallback_s=0.5)
+    await asyncio.gather(cutterServo.disengage_async(cutterDisengage, fallback_s=0.5), undock_async())
     print("Filament cutting successful.")
 
 
 import time
+import asyncio
 import machine
-import sys
-import uselect
 from pimoroni_yukon import Yukon
+from pimoroni_yukon.telemetry import TelemetryRecorder
+from pimoroni_yukon import spans
 from breakout_ioexpander import BreakoutIOExpander
 
 from mods.sensors import FilamentCounter 
 from mods.motors import FilamentDriveMotor, FilamentDriveServo
+from mods.runtime import Runtime
+from mods.commands import CommandReader
+from mods import protocol
 
 from pimoroni_yukon import SLOT1 as SLOT_SERVO1
 from pimoroni_yukon import SLOT2 as SLOT_STEPPER1
@@ -131,6 +163,19 @@ yukon.register_with_slot(module3, SLOT_STEPPER2)
 yukon.verify_and_initialise()
 yukon.enable_main_output()
 
+# Sample current most often, the voltages less so, temperature at 1Hz and one module at a time,
+# leaving more time between monitor checks for motion. yukon.print_monitor_stats() shows the throughput
+yukon.set_monitor_intervals(voltage_in=10, voltage_out=10, current=2, temperature=1000, modules=10, round_robin=True)
+
+# Keep the last minute or so of monitored readings, which a fault stops overwriting. telemetry.save("telemetry.bin")
+# writes them to flash, to be copied off with mpremote and read with "python -m host.telemetry telemetry.bin"
+telemetry = TelemetryRecorder()
+yukon.attach_recorder(telemetry)
+
+# Set to True to time each action, and the servo, stepper, sensor, spool and sleep steps within it.
+# spans.print_summary() shows where the time goes, and spans.save("spans.json") writes it to flash
+spans.enabled = False
+
 ADDRESS = 0x18
 io = BreakoutIOExpander(yukon.i2c, ADDRESS)
 
@@ -140,6 +185,15 @@ filament_counter = FilamentCounter(counter_pin_number)
 # Initialize the filament counter
 filament_counter.initialise(io)
 
+# Pulses are missed if the counter is only polled between moves. Wire the counter output to a spare
+# RP2040 pin (e.g. GP26) to count every pulse by interrupt, or wire the IO expander's INT output instead
+counter_irq_pin = None
+counter_io_int_pin = None
+if counter_irq_pin is not None:
+    filament_counter.attach_pin_irq(counter_irq_pin)
+elif counter_io_int_pin is not None:
+    filament_counter.attach_io_interrupt(io, counter_io_int_pin)
+
 # Create multiple StepperServoSet instances
 # motor_module, servo_module, stepper_slot, servo_slot, filament_counter, io, driveStepperEngage=-83, driveStepperDisengage=-20
 stepper_TL = StepperServoSet(module1, module2, SLOT_STEPPER1, "servo4", filament_counter, io, -41, -20)
@@ -148,20 +202,41 @@ stepper_TR = StepperServoSet(module3, module2, SLOT_STEPPER2, "servo2", filament
 cutterEngage = -86
 cutterDisengage = -42
 cutterServo_slot = "servo3"
-cutterServo = FilamentDriveServo(module2, cutterServo_slot)
+cutterServo = FilamentDriveServo(module2, cutterServo_slot, monitor=yukon)
 cutterServo.initialise()
 
 outputEngage = -54
 outputDisengage = -63
 outputServo_slot = "servo1"
-outputServo = FilamentDriveServo(module2, outputServo_slot)
+outputServo = FilamentDriveServo(module2, outputServo_slot, monitor=yukon)
 outputServo.initialise()
 
+# Runs the *_async functions above, e.g. runtime.run(stepper_TL.pull_out_async()), with the Yukon monitored alongside
+runtime = Runtime(yukon)
 
-
-    
+# Reads "stop" for the operations that run until told to
+commands = CommandReader()
 
 
 
+    
 
 
+# Filament sets in the order the protocol numbers them
+stepper_sets = (stepper_TL, stepper_TR)
+
+# The functions a host can call over the binary protocol (mods/protocol.py). serve() hands the
+# USB serial port over to the protocol until the host sends OP_EXIT, returning to the REPL
+handlers = {
+    protocol.OP_STORAGE_DELIVER: lambda index, length: stepper_sets[index].deliver_filament(length),
+    protocol.OP_STORAGE_DELIVER_UNTIL: lambda index: stepper_sets[index].deliver_filament_until(),
+    protocol.OP_STORAGE_LITTLE_PUSH: lambda index: stepper_sets[index].little_push(),
+    protocol.OP_STORAGE_PULL_OUT: lambda index: stepper_sets[index].pull_out(),
+    protocol.OP_STORAGE_CUT: cutFilament,
+    protocol.OP_STORAGE_DOCK: dock,
+    protocol.OP_STORAGE_UNDOCK: undock,
+}
+server = protocol.Server(handlers, monitor=yukon, commands=commands)
+
+def serve():
+    server.serve()
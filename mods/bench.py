@@ -0,0 +1,208 @@
+import gc
+import sys
+import json
+from array import array
+
+from pimoroni_yukon.timing import ticks_us, ticks_diff
+
+# Benchmarks for the code that runs most often: Yukon.monitor(), the stepper's microstep timer callback,
+# the sensor reads behind check_inputs(), and FilamentCounter.check(). Run it on a board from the REPL once
+# its main_*.py has set everything up, passing in whichever of the objects that board has:
+#
+#   import main_gantry as m
+#   from mods import bench
+#   bench.run(m.yukon, stepper=m.gantryStepper1.stepper, check_inputs=m.check_inputs, path="bench.json")
+#
+# or on a computer against the simulated hardware with "python -m sim.bench". Each benchmark reports the
+# distribution of its per call latency in microseconds and the bytes it allocates per call. Results are
+# written as JSON, tagged with the firmware version, so runs can be compared between firmware versions.
+#
+# The stepper benchmark calls the microstep callback directly rather than from its timer, so the stepper's
+# position moves on by that many microsteps. Run it with the stepper's module disabled, or free to move.
+
+DEFAULT_CALLS = 500
+DEFAULT_ALLOC_CALLS = 100     # Fewer, as the garbage collector is off whilst allocations are counted
+DEFAULT_LOOP_MS = 1000
+
+try:
+    mem_alloc = gc.mem_alloc
+    ALLOC_METHOD = "gc.mem_alloc"           # Every byte allocated, as nothing is freed with the collector off
+except AttributeError:
+    mem_alloc = None
+    ALLOC_METHOD = "tracemalloc peak"       # CPython frees as it goes, so only the most held at once is seen
+
+
+def private(obj, name):
+    # A double underscore member of obj's class. MicroPython does not mangle these names, CPython does
+    value = getattr(obj, name, None)
+    if value is None:
+        value = getattr(obj, "_" + type(obj).__name__.lstrip("_") + name)
+    return value
+
+
+def time_calls(function, calls=DEFAULT_CALLS):
+    # The microseconds each of calls calls to function() took. The samples are allocated up front, so
+    # the timing loop itself does not allocate
+    samples = array('L', [0] * calls)
+    for i in range(calls):
+        start = ticks_us()
+        function()
+        samples[i] = ticks_diff(ticks_us(), start)
+    return samples
+
+
+def count_allocations(function, calls=DEFAULT_ALLOC_CALLS):
+    # The average bytes allocated by a call to function()
+    if mem_alloc is not None:
+        gc.collect()
+        gc.disable()
+        try:
+            before = mem_alloc()
+            for _ in range(calls):
+                function()
+            after = mem_alloc()
+        finally:
+            gc.enable()
+        return (after - before) / calls
+
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        total = 0
+        for _ in range(calls):
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            function()
+            total += tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    return total / calls
+
+
+def distribution(samples):
+    ordered = sorted(samples)
+    count = len(ordered)
+
+    def percentile(fraction):
+        return ordered[min(int(fraction * count), count - 1)]
+
+    return {
+        "calls": count,
+        "min_us": ordered[0],
+        "mean_us": sum(ordered) / count,
+        "p50_us": percentile(0.5),
+        "p90_us": percentile(0.9),
+        "p99_us": percentile(0.99),
+        "max_us": ordered[-1],
+    }
+
+
+def bench(function, calls=DEFAULT_CALLS, alloc_calls=DEFAULT_ALLOC_CALLS):
+    result = distribution(time_calls(function, calls))
+    result["alloc_bytes"] = count_allocations(function, alloc_calls)
+    return result
+
+
+def bench_monitor(yukon, calls=DEFAULT_CALLS, alloc_calls=DEFAULT_ALLOC_CALLS):
+    # monitor() as the monitor loop calls it, when most calls find no channel is due, and forced,
+    # when every channel is sampled
+    yukon.clear_readings()
+    results = {
+        "monitor": bench(yukon.monitor, calls, alloc_calls),
+        "monitor_forced": bench(lambda: yukon.monitor(force=True), calls, alloc_calls),
+    }
+    yukon.clear_readings()
+    return results
+
+
+def bench_monitor_loop(yukon, loop_ms=DEFAULT_LOOP_MS):
+    # How many times a monitored sleep calls monitor() per second, and how busy that keeps the processor
+    yukon.reset_monitor_stats()
+    yukon.monitored_sleep_ms(loop_ms)
+    stats = yukon.get_monitor_stats()
+    return {
+        "loop_ms": loop_ms,
+        "iterations_per_s": stats["calls_per_s"],
+        "busy_us_avg": stats["busy_us_avg"],
+        "busy_percent": stats["busy_percent"],
+    }
+
+
+def bench_stepper(stepper, calls=DEFAULT_CALLS, alloc_calls=DEFAULT_ALLOC_CALLS, overhead_us=0):
+    # The OkayStepper's forward microstep callback. The stepper is set running continuously, so each call
+    # takes a step, and its timer is stopped so only the calls made here run the callback
+    stepper.run_at_steps(1)
+    timer = private(stepper, "__step_timer")
+    timer.deinit()
+    callback = private(stepper, "__increase_microstep")
+    try:
+        result = bench(lambda: callback(timer), calls, alloc_calls)
+    finally:
+        stepper.stop()
+
+    # The fastest the callback could be called, were it to have the processor to itself. overhead_us
+    # is the cost of the timing, taken off the latencies
+    microsteps = private(stepper, "__microsteps")
+    result["microsteps"] = microsteps
+    result["max_step_rate"] = 1000000 / max(result["mean_us"] - overhead_us, 1) / microsteps
+    result["max_step_rate_p99"] = 1000000 / max(result["p99_us"] - overhead_us, 1) / microsteps
+    return result
+
+
+def bench_check_inputs(check_inputs, calls=DEFAULT_CALLS, alloc_calls=DEFAULT_ALLOC_CALLS):
+    # Includes the calls answered from a cached SensorBank snapshot, as well as those that read the pins
+    return bench(check_inputs, calls, alloc_calls)
+
+
+def bench_counter(counter, io, calls=DEFAULT_CALLS, alloc_calls=DEFAULT_ALLOC_CALLS):
+    result = bench(lambda: counter.check(io), calls, alloc_calls)
+    result["irq_mode"] = counter.irq_mode       # check() does nothing when counting by interrupt
+    return result
+
+
+def run(yukon=None, stepper=None, check_inputs=None, counter=None, io=None, calls=DEFAULT_CALLS,
+        alloc_calls=DEFAULT_ALLOC_CALLS, loop_ms=DEFAULT_LOOP_MS, path=None, show=True):
+    # Run the benchmarks for whichever objects are given, returning the results. These are written as JSON
+    # to path if given, and printed if show is True
+    results = {
+        "firmware": sys.version,
+        "implementation": sys.implementation.name,
+        "platform": sys.platform,
+        "alloc_method": ALLOC_METHOD,
+        "benchmarks": {},
+    }
+    benchmarks = results["benchmarks"]
+
+    # The cost of the timing itself, which every latency includes
+    benchmarks["baseline"] = bench(lambda: None, calls, alloc_calls)
+
+    if yukon is not None:
+        benchmarks.update(bench_monitor(yukon, calls, alloc_calls))
+        benchmarks["monitor_loop"] = bench_monitor_loop(yukon, loop_ms)
+    if stepper is not None:
+        benchmarks["stepper_microstep"] = bench_stepper(stepper, calls, alloc_calls, benchmarks["baseline"]["min_us"])
+    if check_inputs is not None:
+        benchmarks["check_inputs"] = bench_check_inputs(check_inputs, calls, alloc_calls)
+    if counter is not None and io is not None:
+        benchmarks["counter_check"] = bench_counter(counter, io, calls, alloc_calls)
+
+    if path is not None:
+        with open(path, "w") as file:
+            file.write(json.dumps(results))
+    if show:
+        print_results(results)
+    return results
+
+
+def print_results(results):
+    print(f"Firmware: {results['firmware']}")
+    print("Benchmark            mean     p50     p90     p99     max  alloc(B)")
+    for name, result in results["benchmarks"].items():
+        if "mean_us" in result:
+            print(f"{name:<18} {result['mean_us']:>7.1f} {result['p50_us']:>7} {result['p90_us']:>7} {result['p99_us']:>7} {result['max_us']:>7} {result['alloc_bytes']:>8.1f}")
+    loop = results["benchmarks"].get("monitor_loop")
+    if loop is not None:
+        print(f"Monitor loop: {loop['iterations_per_s']:.0f} iterations/s, {loop['busy_percent']:.1f}% busy")
+    stepper = results["benchmarks"].get("stepper_microstep")
+    if stepper is not None:
+        print(f"Max step rate: {stepper['max_step_rate']:.0f} steps/s ({stepper['max_step_rate_p99']:.0f} at p99)")
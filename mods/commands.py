@@ -0,0 +1,169 @@
+import sys
+import time
+import asyncio
+import uselect
+
+from pimoroni_yukon.timing import ticks_ms, ticks_us, ticks_add, ticks_diff
+
+# A non-blocking reader of commands sent over stdin, for the operations that run until told to stop.
+# Rather than each operation polling stdin itself, the reader is serviced from the Yukon's monitor loop
+# whilst an operation waits. Lines are parsed a character at a time, so a partial line never blocks.
+# "stop" and "abort" raise flags for the active operation. Any other line is queued for next_command().
+#
+# A stop is seen within one poll period (plus one monitor pass) of its line arriving. The latency
+# from the first character of the stop line to the operation calling acknowledge_stop() is measured.
+#
+# Whilst another reader owns stdin (such as the binary protocol's Server), it is set as the source.
+# That is serviced in place of stdin, and raises stops through request_stop().
+
+
+class CommandReader:
+
+    STOP_COMMANDS = ("stop", "abort")
+    DEFAULT_POLL_MS = 10
+    MAX_LINE_LENGTH = 64
+    MAX_QUEUED_COMMANDS = 8
+    MAX_CHARS_PER_SERVICE = 64      # Bounds the time a single service() call can take
+
+    def __init__(self, stream=sys.stdin):
+        self.__stream = stream
+        self.__poller = uselect.poll()
+        self.__poller.register(stream, uselect.POLLIN)
+
+        self.__line = []
+        self.__line_start_us = 0
+        self.__queue = []
+
+        self.__stop = False
+        self.__abort = False
+        self.__stop_start_us = 0
+        self.__source = None
+
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stops = 0
+        self.last_stop_latency_us = 0
+        self.max_stop_latency_us = 0
+        self.dropped_commands = 0
+
+    def service(self, *readings):
+        # Read whatever characters are waiting, without blocking. Accepts and ignores the readings
+        # passed to a Yukon monitor action, so it can be assigned as one directly
+        if self.__source is not None:
+            self.__source()
+            return
+
+        for _ in range(self.MAX_CHARS_PER_SERVICE):
+            if not self.__poller.poll(0):
+                return
+            char = self.__stream.read(1)
+            if not char:
+                return
+
+            if char == "\n" or char == "\r":
+                if len(self.__line) > 0:
+                    self.__process_line("".join(self.__line).strip().lower())
+                    self.__line = []
+            elif len(self.__line) < self.MAX_LINE_LENGTH:
+                if len(self.__line) == 0:
+                    self.__line_start_us = ticks_us()
+                self.__line.append(char)
+
+    def __process_line(self, line):
+        if line in self.STOP_COMMANDS:
+            if not self.__stop:
+                self.__stop_start_us = self.__line_start_us
+            self.__stop = True
+            if line == "abort":
+                self.__abort = True
+        elif len(line) > 0:
+            if len(self.__queue) >= self.MAX_QUEUED_COMMANDS:
+                self.__queue.pop(0)
+                self.dropped_commands += 1
+            self.__queue.append(line)
+
+    def set_source(self, source):
+        # Service source() rather than reading stdin, or go back to stdin if None
+        if source is not None and not callable(source):
+            raise TypeError("source is not callable or None")
+        self.__source = source
+
+    def request_stop(self, abort=False):
+        if not self.__stop:
+            self.__stop_start_us = ticks_us()
+        self.__stop = True
+        if abort:
+            self.__abort = True
+
+    def is_stop_requested(self):
+        return self.__stop
+
+    def is_abort_requested(self):
+        return self.__abort
+
+    def clear_stop(self):
+        # Called as an operation starts, so an old stop does not end it straight away
+        self.__stop = False
+        self.__abort = False
+
+    def acknowledge_stop(self):
+        # Called by an operation once it has stopped moving. Returns the stop latency in microseconds
+        if not self.__stop:
+            return 0
+        latency_us = ticks_diff(ticks_us(), self.__stop_start_us)
+        self.stops += 1
+        self.last_stop_latency_us = latency_us
+        self.max_stop_latency_us = max(latency_us, self.max_stop_latency_us)
+        self.clear_stop()
+        return latency_us
+
+    def next_command(self):
+        if len(self.__queue) > 0:
+            return self.__queue.pop(0)
+        return None
+
+    def wait_for_stop(self, monitor=None, timeout=None, poll_ms=DEFAULT_POLL_MS):
+        # Wait until a stop is requested, returning True, or until the timeout (in seconds) elapses, returning False.
+        # With a monitor (such as a Yukon), the reader is serviced by its monitor loop and checked every poll_ms.
+        # The monitor action is only assigned whilst waiting, so stdin is left to the REPL the rest of the time
+        if timeout is not None:
+            end_ms = ticks_add(ticks_ms(), int(timeout * 1000))
+
+        # A source is expected to already be serviced by the monitor
+        assign = monitor is not None and self.__source is None
+        if assign:
+            monitor.assign_monitor_action(self.service)
+        try:
+            while True:
+                self.service()
+                if self.__stop:
+                    return True
+                if timeout is not None and ticks_diff(end_ms, ticks_ms()) <= 0:
+                    return False
+
+                if monitor is not None:
+                    monitor.monitored_sleep_ms(poll_ms)
+                else:
+                    time.sleep_ms(poll_ms)
+        finally:
+            if assign:
+                monitor.assign_monitor_action(None)
+
+    async def wait_for_stop_async(self, poll_ms=DEFAULT_POLL_MS):
+        while True:
+            self.service()
+            if self.__stop:
+                return True
+            await asyncio.sleep(poll_ms / 1000)
+
+    def get_stats(self):
+        return {
+            "stops": self.stops,
+            "last_stop_latency_ms": self.last_stop_latency_us / 1000,
+            "max_stop_latency_ms": self.max_stop_latency_us / 1000,
+            "dropped_commands": self.dropped_commands
+        }
+
+    def print_stats(self):
+        print(self.get_stats())
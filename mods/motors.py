@@ -1,12 +1,19 @@
 import time
 import math
+import json
+import asyncio
+from time import sleep_ms
+from machine import Pin
 
-from pimoroni_yukon import Yukon
-yukon = Yukon()
+from pimoroni_yukon.errors import TimeoutError
+from pimoroni_yukon.timing import ticks_ms, ticks_add, ticks_diff
+from pimoroni_yukon import spans
 
 from pimoroni_yukon.modules import QuadServoRegModule, QuadServoDirectModule
 from pimoroni_yukon.modules import DualMotorModule
 from pimoroni_yukon.devices.stepper import OkayStepper
+from pimoroni_yukon.devices.motion_profile import TRAPEZOID
+from pimoroni_yukon.devices.stream_stepper import StreamStepper, PWMDMABackend
 #from pimoroni_yukon.modules import BigMotorModule
 
 from mods import sensors
@@ -18,8 +25,9 @@ class StepperMotor():
     DEFAULT_MICROSTEPS = 4
     DEFAULT_STEPS_PER_UNIT = 52
     DEFAULT_MAX_CURRENT_LIMIT = 2
+    MOVE_TIMEOUT_MARGIN = 2.0      # seconds allowed beyond a move's duration before it is treated as stuck
 
-    def __init__(self, module, current_scale=DEFAULT_CURRENT_SCALE, microsteps=DEFAULT_MICROSTEPS, steps_per_unit=DEFAULT_STEPS_PER_UNIT):
+    def __init__(self, module, current_scale=DEFAULT_CURRENT_SCALE, microsteps=DEFAULT_MICROSTEPS, steps_per_unit=DEFAULT_STEPS_PER_UNIT, monitor=None):
 
         self.module = module
         self.current_scale = current_scale
@@ -29,11 +37,20 @@ class StepperMotor():
         self.current_scale = current_scale
         self.microsteps = microsteps
         self.steps_per_unit = steps_per_unit
+
+        # The board's Yukon, monitored whilst waiting on moves. Without one, waits sleep between polls unmonitored
+        self.monitor = monitor
         
 
-    def initialise(self, CUR_LIM=DEFAULT_MAX_CURRENT_LIMIT):
+    def initialise(self, CUR_LIM=DEFAULT_MAX_CURRENT_LIMIT, stream=False):
+        # stream=True hands microstep generation to DMA rather than a Python timer callback,
+        # at the cost of the accelerated moves that only OkayStepper supports
         self.module.set_current_limit(CUR_LIM)
-        self.stepper = OkayStepper(self.module.motor1, self.module.motor2, current_scale=self.current_scale, microsteps=self.microsteps, steps_per_unit=self.steps_per_unit)
+        if stream:
+            backend = PWMDMABackend.from_dual_motor(self.module)
+            self.stepper = StreamStepper(backend, current_scale=self.current_scale, microsteps=self.microsteps, steps_per_unit=self.steps_per_unit)
+        else:
+            self.stepper = OkayStepper(self.module.motor1, self.module.motor2, current_scale=self.current_scale, microsteps=self.microsteps, steps_per_unit=self.steps_per_unit)
         self.module.disable()
         #print("Initialised stepper")
 
@@ -49,25 +66,108 @@ class StepperMotor():
         self.module.enable()
         self.stepper.move_by_steps(step, duration)
 
+    def move_by_accel(self, units, max_speed, acceleration, curve=TRAPEZOID):
+        self.module.enable()
+        self.stepper.move_by_accel(units, max_speed, acceleration, curve)
+
+    def move_by_steps_accel(self, steps, max_speed, acceleration, curve=TRAPEZOID):
+        self.module.enable()
+        self.stepper.move_by_steps_accel(steps, max_speed, acceleration, curve)
+
+    def run_at(self, units_per_second):
+        self.module.enable()
+        self.stepper.run_at(units_per_second)
+
+    def queue_by_steps(self, steps, max_speed, acceleration):
+        # Queue a move behind any already queued, returning False if the queue is full. Only OkayStepper has a queue
+        self.module.enable()
+        return self.stepper.queue_by_steps(steps, max_speed, acceleration)
+
     def enable(self):
         self.module.enable()
 
     def disable(self):
         self.module.disable()
 
-    def wait_for_move(self):
-        self.stepper.wait_for_move()
+    def wait_for_move(self, timeout=None, monitor=None):
+        # Monitors the given Yukon whilst waiting, or this motor's own if none is given
+        with spans.step("stepper"):
+            self.stepper.wait_for_move(timeout, monitor if monitor is not None else self.monitor)
+
+    def sleep_ms(self, ms):
+        if self.monitor is not None:
+            self.monitor.monitored_sleep_ms(ms)
+        else:
+            sleep_ms(ms)
+
+    async def wait_for_move_async(self, timeout=None):
+        # The stepper is stopped if the move times out, or the waiting task is cancelled
+        try:
+            with spans.step("stepper"):
+                if timeout is None:
+                    await self.stepper.wait_for_move_async()
+                else:
+                    await asyncio.wait_for(self.stepper.wait_for_move_async(), timeout)
+        except asyncio.TimeoutError:
+            self.stepper.stop()
+            raise TimeoutError(f"Move did not complete within {timeout}s")
+        except asyncio.CancelledError:
+            self.stepper.stop()
+            raise
         
     def stop(self):
         self.stepper.stop()
 
+class ServoMove:
+    # A handle to a servo move that completes once the servo is expected to be at its target.
+    # There is no position feedback, so this is timed from the servo's calibrated travel time
+
+    def __init__(self, travel_time, monitor=None):
+        self.travel_time = travel_time
+        self.monitor = monitor
+        self.end_ms = ticks_add(ticks_ms(), int(travel_time * 1000 + 0.5))
+
+    def done(self):
+        return ticks_diff(ticks_ms(), self.end_ms) >= 0
+
+    def remaining(self):
+        return max(ticks_diff(self.end_ms, ticks_ms()), 0) / 1000
+
+    def wait(self, monitor=None):
+        # Monitors the given Yukon whilst waiting, or the servo's own if none is given. Waiting on
+        # several handles in turn ends once the last of them is done, as their end times are absolute
+        if monitor is None:
+            monitor = self.monitor
+        if not self.done():
+            with spans.step("servo"):
+                if monitor is not None:
+                    monitor.monitor_until_ms(self.end_ms)
+                else:
+                    sleep_ms(max(ticks_diff(self.end_ms, ticks_ms()), 0))
+        return self
+
+    async def wait_async(self):
+        with spans.step("servo"):
+            await asyncio.sleep(self.remaining())
+        return self
+
+
 class ServoMotor:
 
     SERVO_EXTENT = 80.0 
 
-    def __init__(self, module, pin):
+    # Measure these per servo under load, and pass them into the constructor. Until a servo's speed has been
+    # measured, each move is given the fallback_s its caller passes, which is the sleep that followed the move before
+    DEFAULT_SPEED = None            # degrees per second under load, or None if not yet measured
+    DEFAULT_SETTLE_TIME = 0.15      # seconds added to every move for the servo to come to rest
+
+    def __init__(self, module, pin, speed=DEFAULT_SPEED, settle_time=DEFAULT_SETTLE_TIME, monitor=None):
         self.module = module
         self.pin = pin
+        self.speed = speed
+        self.settle_time = settle_time
+        self.monitor = monitor          # The board's Yukon, monitored whilst waiting on moves
+        self.last_value = None
 
     def initialise(self):
         self.module.enable()
@@ -76,8 +176,18 @@ class ServoMotor:
         self.NUM_SERVOS = 1
         #print(f"Up to {self.NUM_SERVOS} servos available")
 
-    def set_value(self, value):
+    def travel_time(self, value, fallback_s=0.0):
+        # fallback_s is used when the servo's speed or starting position is not known
+        if self.speed is None or self.last_value is None:
+            return fallback_s
+        return abs(value - self.last_value) / self.speed + self.settle_time
+
+    def set_value(self, value, fallback_s=0.0):
+        # Returns a ServoMove for waiting on the servo to reach the value
+        move = ServoMove(self.travel_time(value, fallback_s), self.monitor)
         self.servo.value(value)
+        self.last_value = value
+        return move
 
     def disable(self):
         self.module.disable()
@@ -97,29 +207,78 @@ class FilamentDriveMotor(StepperMotor):
     DEFAULT_STEPS_PER_UNIT = 52
     DEFAULT_MAX_CURRENT_LIMIT = 2
 
-    def __init__(self, module, filament_counter, io, current_scale=DEFAULT_CURRENT_SCALE, microsteps=DEFAULT_MICROSTEPS, steps_per_unit=DEFAULT_STEPS_PER_UNIT):
-        super().__init__(module, current_scale, microsteps, steps_per_unit)
+    DEFAULT_FEED_RATE = 20      # mm/s, the same average rate as the old 2mm per 0.1s chunks
+    DEFAULT_CREEP_RATE = 2      # mm/s, the slowest the feed drops to when approaching the target
+    DEFAULT_SLOW_LENGTH = 5     # mm before the target at which the feed starts to slow down
+    CONTROL_PERIOD_MS = 5       # How often the feed rate is updated when the counter uses interrupts
+    SETTLE_MS = 50              # How long to keep counting after stopping, to measure the overshoot
+
+    def __init__(self, module, filament_counter, io, current_scale=DEFAULT_CURRENT_SCALE, microsteps=DEFAULT_MICROSTEPS, steps_per_unit=DEFAULT_STEPS_PER_UNIT, monitor=None):
+        super().__init__(module, current_scale, microsteps, steps_per_unit, monitor)
         self.filament_counter = filament_counter
         self.io = io
 
-    def initialise(self):
-        super().initialise()
-
-    def extrude_length(self, length_mm):
-        self.filament_counter.reset_count()
-        super().enable()
-        while self.filament_counter.filament_length() < length_mm:
-            self.filament_counter.check(self.io)
-            super().move_by(2, 0.1)
-        final_length = self.filament_counter.filament_length()
+    def initialise(self, stream=False):
+        super().initialise(stream=stream)
+
+    def extrude_length(self, length_mm, feed_rate=DEFAULT_FEED_RATE, creep_rate=DEFAULT_CREEP_RATE, slow_length=DEFAULT_SLOW_LENGTH):
+        """
+        Feed filament continuously until the counter reaches the desired length, slowing
+        down over the last slow_length mm so the stop lands close to the target.
+        :return: Overshoot past the desired length in mm
+        """
+        counter = self.filament_counter
+        counter.reset_count()
+
+        rate = feed_rate
+        with spans.step("stepper"):
+            super().run_at(rate)
+            try:
+                while True:
+                    counter.check(self.io)
+                    remaining = length_mm - counter.filament_length()
+                    if remaining <= 0:
+                        break
+
+                    new_rate = max(creep_rate, min(feed_rate, (feed_rate * remaining) / slow_length))
+                    if new_rate != rate:
+                        rate = new_rate
+                        super().run_at(rate)
+
+                    # A polled counter has to be checked between every pulse, so only wait when using interrupts.
+                    # Otherwise just sample whichever monitor channels are due, which is quick when none are
+                    if counter.irq_mode:
+                        super().sleep_ms(self.CONTROL_PERIOD_MS)
+                    elif self.monitor is not None:
+                        self.monitor.monitor()
+            finally:
+                super().stop()
+
+            # Catch any pulses from filament still moving after the stop
+            settle_end = ticks_add(ticks_ms(), self.SETTLE_MS)
+            while ticks_diff(settle_end, ticks_ms()) > 0:
+                counter.check(self.io)
+
+        final_length = counter.filament_length()
         super().disable()
         #print(f"Desired length of {length_mm} mm of filament has passed through. Final length: {final_length} mm")
+        return final_length - length_mm
 
     def extrude_filament_blind(self, length_mm, speed_s):
         super().enable()
         super().move_by(length_mm, speed_s)
-        super().wait_for_move()
-        super().disable()
+        try:
+            super().wait_for_move(speed_s + self.MOVE_TIMEOUT_MARGIN)
+        finally:
+            super().disable()
+
+    async def extrude_filament_blind_async(self, length_mm, speed_s):
+        super().enable()
+        super().move_by(length_mm, speed_s)
+        try:
+            await super().wait_for_move_async(speed_s + self.MOVE_TIMEOUT_MARGIN)
+        finally:
+            super().disable()
     
     def extrude_while(self, dir=1):
         super().enable()
@@ -138,17 +297,27 @@ class FilamentBlindDriveMotor(StepperMotor):
     DEFAULT_STEPS_PER_UNIT = 52
     DEFAULT_MAX_CURRENT_LIMIT = 2
 
-    def __init__(self, module, current_scale=DEFAULT_CURRENT_SCALE, microsteps=DEFAULT_MICROSTEPS, steps_per_unit=DEFAULT_STEPS_PER_UNIT):
-        super().__init__(module, current_scale, microsteps, steps_per_unit)
+    def __init__(self, module, current_scale=DEFAULT_CURRENT_SCALE, microsteps=DEFAULT_MICROSTEPS, steps_per_unit=DEFAULT_STEPS_PER_UNIT, monitor=None):
+        super().__init__(module, current_scale, microsteps, steps_per_unit, monitor)
 
-    def initialise(self):
-        super().initialise()
+    def initialise(self, stream=False):
+        super().initialise(stream=stream)
 
     def extrude_filament_blind(self, length_mm, speed_s):
         super().enable()
         super().move_by(length_mm, speed_s)
-        super().wait_for_move()
-        super().disable()
+        try:
+            super().wait_for_move(speed_s + self.MOVE_TIMEOUT_MARGIN)
+        finally:
+            super().disable()
+
+    async def extrude_filament_blind_async(self, length_mm, speed_s):
+        super().enable()
+        super().move_by(length_mm, speed_s)
+        try:
+            await super().wait_for_move_async(speed_s + self.MOVE_TIMEOUT_MARGIN)
+        finally:
+            super().disable()
     
     def extrude_while(self, dir=1):
         super().enable()
@@ -167,12 +336,93 @@ class GantryMotor(StepperMotor):
     DEFAULT_STEPS_PER_UNIT = 52
     DEFAULT_MAX_CURRENT_LIMIT = 2
 
-    def __init__(self, module, current_scale=DEFAULT_CURRENT_SCALE, microsteps=DEFAULT_MICROSTEPS, steps_per_unit=DEFAULT_STEPS_PER_UNIT):
-        super().__init__( module, current_scale, microsteps, steps_per_unit)
-
-    def initialise(self):
-        super().initialise()
+    DEFAULT_MAX_SPEED = 400         # steps/s for accelerated moves
+    DEFAULT_ACCELERATION = 800      # steps/s^2 for accelerated moves
+
+    HUNT_STEPS = 20                 # steps per queued segment whilst hunting for a sensor
+    HUNT_SPEED = 200                # steps/s, the same as the old 20 steps per 0.1s
+    HUNT_ACCELERATION = 4000        # steps/s^2, reaching HUNT_SPEED in 5 steps, where the old moves started at speed
+    HUNT_LOOKAHEAD = 3              # segments kept queued, enough to carry on at HUNT_SPEED without slowing
+
+    STATION_TABLE = "stations.json" # where calibrate() saves the station positions, on the board's flash
+    APPROACH_STEPS = 40             # steps short of a calibrated station centre that the long move stops at
+    CONFIRM_SPEED = 100             # steps/s for the hall effect confirm that finishes a calibrated move
+    CONFIRM_LIMIT = 60              # steps the confirm goes looking before the table is treated as wrong. Keep it
+                                    # well short of the next station along, so its magnet is not mistaken for this one
+
+    HOME_FAST_SPEED = 400           # steps/s for the first approach to the endstop
+    HOME_SLOW_SPEED = 50            # steps/s for the second approach, which finds the edge home is measured from
+    HOME_ACCELERATION = 4000        # steps/s^2 for both approaches, raised for a fast one so it can stop in time
+    HOME_STOP_STEPS = 3             # steps past the endstop's edge an approach slows to a stop in, short of the hard stop
+    HOME_BACKOFF_STEPS = 10         # steps backed off the endstop between the approaches
+    HOME_OFFSET_STEPS = 40          # steps left of the endstop's edge that home is
+    HOME_MAX_STEPS = 1500           # steps the first approach goes before giving up, more than the length of the rail
+
+    def __init__(self, module, current_scale=DEFAULT_CURRENT_SCALE, microsteps=DEFAULT_MICROSTEPS, steps_per_unit=DEFAULT_STEPS_PER_UNIT, monitor=None):
+        super().__init__( module, current_scale, microsteps, steps_per_unit, monitor)
+
+    def initialise(self, stream=False):
+        super().initialise(stream=stream)
         self.current_position = None
+        self.stations = None        # Step position of each station's magnet centre, from home at 0
+        self.load_stations()
+        self.endstop_pin = None     # RP2040 pin that latches the home endstop, see attach_endstop_pin()
+        self.sensor_steps = None    # Step position the last hunt() saw its sensor at, before slowing to a stop
+        self.endstop_trigger = Pin.IRQ_RISING
+        self.endstop_io = None
+
+    def attach_endstop_pin(self, pin, trigger=Pin.IRQ_RISING):
+        # Latch the home endstop with a hard interrupt on the RP2040 pin it is wired to, so homing finds the
+        # endstop's edge to within a microstep, rather than polling it over I2C as the carriage moves
+        pin.init(Pin.IN, Pin.PULL_UP)
+        self.endstop_pin = pin
+        self.endstop_trigger = trigger
+        self.endstop_io = None
+
+    def attach_endstop_interrupt(self, io, endstop_pin, int_pin):
+        # Latch the home endstop on the IO expander, by its INT output wired to an RP2040 pin. INT falls on any change
+        # of the endstop, with no I2C read needed to see it, so the endstop must be the only expander pin interrupting
+        io.set_pin_interrupt(endstop_pin, True)
+        io.enable_interrupt_out()
+        io.clear_interrupt_flag()
+        self.attach_endstop_pin(int_pin, Pin.IRQ_FALLING)
+        self.endstop_io = io
+
+    def load_stations(self, path=STATION_TABLE):
+        # Returns True if a station table was loaded
+        try:
+            with open(path) as file:
+                self.stations = json.load(file)["stations"]
+            return True
+        except (OSError, ValueError, KeyError):
+            self.stations = None
+            return False
+
+    def save_stations(self, path=STATION_TABLE):
+        with open(path, "w") as file:
+            file.write(json.dumps({"stations": self.stations}))
+
+    def calibrate(self, he_sensor, right_endstop, left_endstop, path=STATION_TABLE):
+        # Home, then run left along the whole rail to the left endstop, recording the centre of each station's
+        # magnet, midway between where the hall effect sensor comes on and goes off. The table is saved to path,
+        # and move_to_position() uses it from then on. Returns the number of stations found, including home
+        self.home("right", right_endstop)
+        stations = [0]
+
+        self.hunt(-1, lambda: not he_sensor() or left_endstop())
+        while not left_endstop():
+            self.hunt(-1, lambda: he_sensor() or left_endstop())
+            if not he_sensor():
+                break
+            leading = self.sensor_steps
+            self.hunt(-1, lambda: not he_sensor() or left_endstop())
+            stations.append((leading + self.sensor_steps) / 2)
+            print(f"Station {len(stations) - 1} at {stations[-1]} steps")
+
+        self.stations = stations
+        self.save_stations(path)
+        self.home("right", right_endstop)
+        return len(stations)
 
     def move_left_wait(self, units, duration):
         super().move_by(-1*units, duration)
@@ -196,15 +446,101 @@ class GantryMotor(StepperMotor):
         super().move_by_steps(steps, duration)
         super().wait_for_move()
 
+    def move_left_accel(self, steps, max_speed=DEFAULT_MAX_SPEED, acceleration=DEFAULT_ACCELERATION):
+        super().move_by_steps_accel(-1*steps, max_speed, acceleration)
+        super().wait_for_move()
+
+    def move_right_accel(self, steps, max_speed=DEFAULT_MAX_SPEED, acceleration=DEFAULT_ACCELERATION):
+        super().move_by_steps_accel(steps, max_speed, acceleration)
+        super().wait_for_move()
+
+    def hunt(self, direction, sensor, speed=HUNT_SPEED, limit=None, acceleration=HUNT_ACCELERATION):
+        # Step right (direction 1) or left (-1) until sensor() is true. Segments are streamed to the stepper's
+        # queue, so the carriage keeps moving at speed and the sensor is checked whilst it moves, rather than
+        # stopping every 20 steps to look. Once it is seen the carriage slows to a stop a few steps on, with where
+        # it was seen kept in sensor_steps. Returns False if limit steps go by first, otherwise True
+        with spans.step("stepper"):
+            return self.__hunt(direction, sensor, speed, limit, acceleration)
+
+    def __hunt(self, direction, sensor, speed, limit, acceleration):
+        stepper = self.stepper
+        start = stepper.steps()
+        if not hasattr(stepper, "queue_by_steps"):
+            # The streamed backend has no queue, so go a segment at a time
+            while not sensor():
+                if limit is not None and abs(stepper.steps() - start) >= limit:
+                    return False
+                super().move_by_steps(direction * self.HUNT_STEPS, self.HUNT_STEPS / speed)
+                super().wait_for_move()
+            self.sensor_steps = stepper.steps()
+            return True
+
+        try:
+            while not sensor():
+                if limit is not None and abs(stepper.steps() - start) >= limit:
+                    return False
+                if stepper.queue_depth() < self.HUNT_LOOKAHEAD:
+                    super().queue_by_steps(direction * self.HUNT_STEPS, speed, acceleration)
+                if self.monitor is not None:
+                    self.monitor.monitor()
+            self.sensor_steps = stepper.steps()
+            stepper.slow_to_stop()
+            stepper.wait_for_move(None, self.monitor)
+            return True
+        finally:
+            stepper.stop()
+
+    def move_to_station(self, station, he_sensor):
+        # One accelerated move to just short of the station's calibrated centre, then a slow hunt for its magnet.
+        # Returns False if the magnet is not found close to where the table has it
+        centre = self.stations[station]
+        direction = -1 if centre < self.stepper.steps() else 1
+        approach = centre - direction * self.APPROACH_STEPS
+        steps = approach - self.stepper.steps()
+        if steps * direction > 0:
+            super().move_by_steps_accel(steps, self.DEFAULT_MAX_SPEED, self.DEFAULT_ACCELERATION)
+            super().wait_for_move()
+        return self.hunt(direction, he_sensor, self.CONFIRM_SPEED, self.CONFIRM_LIMIT)
+
+    def approach_endstop(self, endstop, speed, limit):
+        # Step right at speed until the endstop triggers, returning the step position of its edge, or None if limit
+        # steps go by first. With a latch attached the stepper notes the edge within a microstep, and otherwise the
+        # endstop is polled whilst the carriage moves, noting it late by however long a poll takes. Either way the
+        # carriage then slows to a stop past the edge, rather than stopping dead at speed
+        stepper = self.stepper
+        acceleration = max(self.HOME_ACCELERATION, speed * speed / (2 * self.HOME_STOP_STEPS))
+        if self.endstop_pin is None or not hasattr(stepper, "latch_on"):
+            if not self.hunt(1, endstop, speed, limit, acceleration):
+                return None
+            return self.sensor_steps
+
+        if self.endstop_io is not None:
+            self.endstop_io.clear_interrupt_flag()
+        stepper.latch_on(self.endstop_pin, self.endstop_trigger)
+        try:
+            super().move_by_steps_accel(limit, speed, acceleration)
+            super().wait_for_move()
+            return stepper.latched_steps()
+        finally:
+            stepper.clear_latch()
+
     def home(self, direction, endstop):
+        # Approach the endstop quickly, back off, then approach again slowly, so the edge is found the same way each
+        # time however fast the carriage arrived. Home is HOME_OFFSET_STEPS left of that edge
         #print(f"Homing {direction}")
         if direction == "right":
-            self.move_left_int(20, 0.1)
-            #print(endstop())
-            while not endstop():
-                self.move_right_int(20, 0.1)
-                #print(endstop())
-            self.move_left_int(40, 0.2)
+            if endstop():
+                self.move_left_accel(self.HOME_BACKOFF_STEPS, self.HOME_FAST_SPEED, self.HOME_ACCELERATION)
+            edge = self.approach_endstop(endstop, self.HOME_FAST_SPEED, self.HOME_MAX_STEPS)
+            if edge is None:
+                raise TimeoutError(f"Endstop not reached within {self.HOME_MAX_STEPS} steps")
+            # Backed off from the edge, as the carriage slowed to a stop past it
+            self.move_left_accel(self.stepper.steps() - edge + self.HOME_BACKOFF_STEPS, self.HOME_FAST_SPEED, self.HOME_ACCELERATION)
+            edge = self.approach_endstop(endstop, self.HOME_SLOW_SPEED, 2 * self.HOME_BACKOFF_STEPS)
+            if edge is None:
+                raise TimeoutError("Endstop not reached again after backing off")
+            self.move_left_accel(self.stepper.steps() - edge + self.HOME_OFFSET_STEPS, self.HOME_FAST_SPEED, self.HOME_ACCELERATION)
+            self.stepper.zero_position()
             self.current_position = 0
         else:
             print("Incorrect direction - must be right")
@@ -255,16 +591,21 @@ class GantryMotor(StepperMotor):
             return
         if position == 0:
             self.home("right", lambda: right_endstop())
+        elif position != self.current_position and self.stations is not None and position < len(self.stations):
+            if self.move_to_station(position, he_sensor):
+                self.current_position = position
+            else:
+                # Lost track of where the carriage is, so start again from home, going a station at a time
+                print(f"Station {position} not found where calibrated, recalibrate. Homing")
+                self.home("right", lambda: right_endstop())
         while self.current_position != position:
             if position > self.current_position:
-                self.move_left_int(80, 1)
-                while not he_sensor():
-                    self.move_left_int(20, 0.1)
+                self.move_left_accel(80)
+                self.hunt(-1, he_sensor)
                 self.current_position += 1
             elif position < self.current_position:
-                self.move_right_int(80, 1)
-                while not he_sensor():
-                    self.move_right_int(20, 0.1)
+                self.move_right_accel(80)
+                self.hunt(1, he_sensor)
                 self.current_position -= 1
 
 
@@ -285,9 +626,10 @@ class FilamentDriveServo(ServoMotor):
     DEFAULT_POS_DISENGAGED = 25
     # DEFAULT_PWM_ENGAGED = 1700
     # DEFAULT_PWN_DISENGAGED = 3200
+    FIRST_MOVE_FALLBACK = 1.0       # seconds the move before backing off was always slept for, until speeds are measured
 
-    def __init__(self, module, pin):
-        super().__init__(module, pin)
+    def __init__(self, module, pin, speed=ServoMotor.DEFAULT_SPEED, settle_time=ServoMotor.DEFAULT_SETTLE_TIME, monitor=None):
+        super().__init__(module, pin, speed, settle_time, monitor)
 
     def initialise(self):
         super().initialise()
@@ -297,18 +639,33 @@ class FilamentDriveServo(ServoMotor):
         super().set_value(angle)
         #print(f"Set engage value to {angle}")
 
-    def engage(self, pos_engage=DEFAULT_POS_ENGAGED):
-        super().set_value(pos_engage)
-        yukon.monitored_sleep(1)
-        super().set_value(pos_engage+10)
+    def engage(self, pos_engage=DEFAULT_POS_ENGAGED, fallback_s=0.0):
+        # Waits for the servo to reach the engage position, then returns the ServoMove of backing off from it.
+        # The back off only eases the servo off its end stop, and the drive is engaged (or disengaged) once the
+        # first move is done, so callers need not wait on it. Callers that slept after it before pass that sleep
+        # as fallback_s and wait on it. As before, a move that follows overrides it
+        super().set_value(pos_engage, self.FIRST_MOVE_FALLBACK).wait()
+        return super().set_value(pos_engage+10, fallback_s)
         #print(f"Set engage value to {pos_engage}")
 
-    def disengage(self, pos_disengage=DEFAULT_POS_DISENGAGED):
-        super().set_value(pos_disengage)
-        yukon.monitored_sleep(1)
-        super().set_value(pos_disengage-10)
+    def disengage(self, pos_disengage=DEFAULT_POS_DISENGAGED, fallback_s=0.0):
+        super().set_value(pos_disengage, self.FIRST_MOVE_FALLBACK).wait()
+        return super().set_value(pos_disengage-10, fallback_s)
         #print(f"Set disengage value to {pos_disengage}")
 
+    async def engage_async(self, pos_engage=DEFAULT_POS_ENGAGED, fallback_s=None):
+        # As engage(), but the back off is only waited on when a fallback_s is given for it
+        await super().set_value(pos_engage, self.FIRST_MOVE_FALLBACK).wait_async()
+        back_off = super().set_value(pos_engage+10, fallback_s or 0.0)
+        if fallback_s is not None:
+            await back_off.wait_async()
+
+    async def disengage_async(self, pos_disengage=DEFAULT_POS_DISENGAGED, fallback_s=None):
+        await super().set_value(pos_disengage, self.FIRST_MOVE_FALLBACK).wait_async()
+        back_off = super().set_value(pos_disengage-10, fallback_s or 0.0)
+        if fallback_s is not None:
+            await back_off.wait_async()
+
     def disable(self):
         super().disable()
         
@@ -317,8 +674,8 @@ class dockingServo(ServoMotor):
     DEFAULT_POS_ENGAGED = 0
     DEFAULT_POS_DISENGAGED = 22
 
-    def __init__(self, module, pin):
-        super().__init__(module, pin)
+    def __init__(self, module, pin, speed=ServoMotor.DEFAULT_SPEED, settle_time=ServoMotor.DEFAULT_SETTLE_TIME, monitor=None):
+        super().__init__(module, pin, speed, settle_time, monitor)
 
     def initialise(self):
         super().initialise()
@@ -328,18 +685,20 @@ class dockingServo(ServoMotor):
         super().set_value(angle)
         #print(f"Set engage value to {angle}")
 
-    def engage(self, pos_engage=DEFAULT_POS_ENGAGED):
-        super().set_value(pos_engage)
-        yukon.monitored_sleep(1)
-        super().set_value(pos_engage)
+    def engage(self, pos_engage=DEFAULT_POS_ENGAGED, fallback_s=0.0):
+        return super().set_value(pos_engage, fallback_s)
         #print(f"Set engage value to {pos_engage}")
 
-    def disengage(self, pos_disengage=DEFAULT_POS_DISENGAGED):
-        super().set_value(pos_disengage)
-        yukon.monitored_sleep(1)
-        super().set_value(pos_disengage)
+    def disengage(self, pos_disengage=DEFAULT_POS_DISENGAGED, fallback_s=0.0):
+        return super().set_value(pos_disengage, fallback_s)
         #print(f"Set disengage value to {pos_disengage}")
 
+    async def engage_async(self, pos_engage=DEFAULT_POS_ENGAGED, fallback_s=0.0):
+        await super().set_value(pos_engage, fallback_s).wait_async()
+
+    async def disengage_async(self, pos_disengage=DEFAULT_POS_DISENGAGED, fallback_s=0.0):
+        await super().set_value(pos_disengage, fallback_s).wait_async()
+
     def disable(self):
         super().disable()
 
@@ -350,8 +709,8 @@ class FilamentLockServo(ServoMotor):
     # DEFAULT_PWM_ENGAGED = 1700
     # DEFAULT_PWN_DISENGAGED = 3200
 
-    def __init__(self, module, pin):
-        super().__init__(module, pin)
+    def __init__(self, module, pin, speed=ServoMotor.DEFAULT_SPEED, settle_time=ServoMotor.DEFAULT_SETTLE_TIME, monitor=None):
+        super().__init__(module, pin, speed, settle_time, monitor)
 
     def initialise(self):
         super().initialise()
@@ -361,15 +720,25 @@ class FilamentLockServo(ServoMotor):
         super().set_value(angle)
         #print(f"Set engage value to {angle}")
 
-    def engage(self, pos_engage=DEFAULT_POS_ENGAGED):
-        yukon.monitored_sleep(0.2)
-        super().set_value(pos_engage)
+    def engage(self, pos_engage=DEFAULT_POS_ENGAGED, fallback_s=0.0):
+        # Pause before moving, monitored as a servo wait is
+        with spans.step("servo"):
+            ServoMove(0.2, self.monitor).wait()
+        return super().set_value(pos_engage, fallback_s)
         #print(f"Set engage value to {pos_engage}")
 
-    def disengage(self, pos_disengage=DEFAULT_POS_DISENGAGED):
-        super().set_value(pos_disengage)
+    def disengage(self, pos_disengage=DEFAULT_POS_DISENGAGED, fallback_s=0.0):
+        return super().set_value(pos_disengage, fallback_s)
         #print(f"Set disengage value to {pos_disengage}")
 
+    async def engage_async(self, pos_engage=DEFAULT_POS_ENGAGED, fallback_s=0.0):
+        with spans.step("servo"):
+            await asyncio.sleep(0.2)
+        await super().set_value(pos_engage, fallback_s).wait_async()
+
+    async def disengage_async(self, pos_disengage=DEFAULT_POS_DISENGAGED, fallback_s=0.0):
+        await super().set_value(pos_disengage, fallback_s).wait_async()
+
     def disable(self):
         super().disable()
 
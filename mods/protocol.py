@@ -0,0 +1,414 @@
+import sys
+import time
+import struct
+from array import array
+
+# A compact binary request/response protocol for controlling a board over USB CDC, in place of typing
+# function calls into the REPL and scraping their printed output. Every frame, in either direction, is:
+#
+#   SYNC (0xA5) | LENGTH | REQUEST ID | OPCODE | PAYLOAD (LENGTH bytes) | CRC16 (big endian)
+#
+# The CRC is CRC16-CCITT (poly 0x1021, init 0xFFFF) over LENGTH, REQUEST ID, OPCODE and PAYLOAD.
+# Request IDs are chosen by the host from 1 to 255. ID 0 is reserved for frames the board sends unprompted.
+#
+# Each accepted request is answered with an ACK as soon as it is received, and a DONE once it has run,
+# carrying the same request ID. A rejected request gets a single ERROR instead. Requests may be pipelined:
+# the host can send the next ones without waiting, and they are queued and run in order on the board.
+#
+# Nothing above the Server class depends on the board, so the codec can be shared with a host computer.
+# Anything the controllers print() still goes to stdout between frames, which the decoder skips over.
+
+
+SYNC = 0xA5
+HEADER_SIZE = 4             # SYNC, LENGTH, REQUEST ID, OPCODE
+CRC_SIZE = 2
+MAX_PAYLOAD = 255
+MAX_FRAME = HEADER_SIZE + MAX_PAYLOAD + CRC_SIZE
+
+# Control opcodes, handled by the server itself as soon as they are received
+OP_PING = 0x01
+OP_STOP = 0x02              # Ends the running operation if it runs until stopped, and cancels any queued
+OP_EXIT = 0x03              # Leaves serve() once the requests queued before it have run, returning to the REPL
+
+# Gantry opcodes
+OP_GANTRY_HOME = 0x10
+OP_GANTRY_MOVE_LEFT = 0x11
+OP_GANTRY_MOVE_RIGHT = 0x12
+OP_GANTRY_MOVE_TO = 0x13
+OP_GANTRY_INTAKE = 0x14
+OP_GANTRY_SPOOL_UP = 0x15
+OP_GANTRY_SPOOL_UP_UNTIL = 0x16
+OP_GANTRY_RETRIEVE = 0x17
+OP_GANTRY_DELIVER = 0x18
+OP_GANTRY_DELIVER_UNTIL = 0x19
+OP_GANTRY_HOME_FILAMENT = 0x1A
+OP_GANTRY_UNSPOOL_TENSION = 0x1B
+OP_GANTRY_CALIBRATE = 0x1C
+
+# Storage opcodes. Filament sets are numbered from 0
+OP_STORAGE_DELIVER = 0x20
+OP_STORAGE_DELIVER_UNTIL = 0x21
+OP_STORAGE_LITTLE_PUSH = 0x22
+OP_STORAGE_PULL_OUT = 0x23
+OP_STORAGE_CUT = 0x24
+OP_STORAGE_DOCK = 0x25
+OP_STORAGE_UNDOCK = 0x26
+
+# Printer opcodes
+OP_PRINTER_DOCK = 0x30
+OP_PRINTER_UNDOCK = 0x31
+OP_PRINTER_INTAKE = 0x32
+OP_PRINTER_SPOOL_UP = 0x33
+OP_PRINTER_SPOOL_UP_UNTIL = 0x34
+OP_PRINTER_WAIT_FOR_INTAKE = 0x35
+
+# Response opcodes
+OP_ACK = 0x80               # Payload: the number of requests queued ahead of this one
+OP_DONE = 0x81              # Payload: status, then an optional float result or error message
+OP_ERROR = 0x82             # Payload: status, then an optional message
+
+STATUS_OK = 0
+STATUS_FAILED = 1           # The operation returned False
+STATUS_EXCEPTION = 2        # The operation raised. The message follows
+STATUS_CANCELLED = 3        # A stop was received before the operation ran
+STATUS_UNKNOWN_OPCODE = 4
+STATUS_BAD_ARGUMENTS = 5
+STATUS_BUSY = 6             # The request queue was full, or an exit is underway
+
+# The struct format of each request's arguments. Opcodes not listed take none
+ARG_FORMATS = {
+    OP_GANTRY_MOVE_LEFT: "<B",          # stations
+    OP_GANTRY_MOVE_RIGHT: "<B",         # stations
+    OP_GANTRY_MOVE_TO: "<B",            # station
+    OP_GANTRY_SPOOL_UP: "<ff",          # time, speed
+    OP_GANTRY_SPOOL_UP_UNTIL: "<f",     # speed
+    OP_GANTRY_DELIVER: "<f",            # length
+    OP_STORAGE_DELIVER: "<Bf",          # set, length in mm
+    OP_STORAGE_DELIVER_UNTIL: "<B",     # set
+    OP_STORAGE_LITTLE_PUSH: "<B",       # set
+    OP_STORAGE_PULL_OUT: "<B",          # set
+    OP_PRINTER_SPOOL_UP: "<ff",         # time, max speed
+    OP_PRINTER_SPOOL_UP_UNTIL: "<f",    # max speed
+    OP_PRINTER_WAIT_FOR_INTAKE: "<f",   # timeout
+}
+
+RESULT_FORMAT = "<f"
+
+
+def create_crc_table():
+    table = array('H', [0] * 256)
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+        table[i] = crc
+    return table
+
+
+CRC_TABLE = create_crc_table()
+
+
+def crc16(data, start=0, end=None, crc=0xFFFF):
+    if end is None:
+        end = len(data)
+    for i in range(start, end):
+        crc = ((crc << 8) & 0xFFFF) ^ CRC_TABLE[((crc >> 8) ^ data[i]) & 0xFF]
+    return crc
+
+
+def encode_frame(request_id, opcode, payload=b""):
+    length = len(payload)
+    if length > MAX_PAYLOAD:
+        raise ValueError(f"payload out of range. Expected {MAX_PAYLOAD} bytes or fewer")
+
+    frame = bytearray(HEADER_SIZE + length + CRC_SIZE)
+    frame[0] = SYNC
+    frame[1] = length
+    frame[2] = request_id & 0xFF
+    frame[3] = opcode & 0xFF
+    frame[HEADER_SIZE:HEADER_SIZE + length] = payload
+    crc = crc16(frame, 1, HEADER_SIZE + length)
+    frame[HEADER_SIZE + length] = crc >> 8
+    frame[HEADER_SIZE + length + 1] = crc & 0xFF
+    return frame
+
+
+def encode_request(request_id, opcode, *args):
+    fmt = ARG_FORMATS.get(opcode)
+    if fmt is None:
+        if len(args) > 0:
+            raise ValueError(f"opcode {opcode:#04x} takes no arguments")
+        return encode_frame(request_id, opcode)
+    return encode_frame(request_id, opcode, struct.pack(fmt, *args))
+
+
+def decode_args(opcode, payload):
+    # Returns the arguments of a request as a tuple, or None if the payload does not suit the opcode
+    fmt = ARG_FORMATS.get(opcode)
+    if fmt is None:
+        return () if len(payload) == 0 else None
+    if len(payload) != struct.calcsize(fmt):
+        return None
+    return struct.unpack(fmt, payload)
+
+
+def encode_status(status, result=None):
+    # A DONE or ERROR payload. The result can be a number, or a message as a string
+    if result is None:
+        return bytes((status,))
+    if isinstance(result, str):
+        return bytes((status,)) + result.encode()[:MAX_PAYLOAD - 1]
+    return bytes((status,)) + struct.pack(RESULT_FORMAT, result)
+
+
+def decode_status(payload):
+    # Returns (status, result), where the result is a float, a message string, or None
+    if len(payload) == 0:
+        return (None, None)
+    status = payload[0]
+    rest = payload[1:]
+    if len(rest) == 0:
+        return (status, None)
+    if status == STATUS_OK and len(rest) == struct.calcsize(RESULT_FORMAT):
+        return (status, struct.unpack(RESULT_FORMAT, rest)[0])
+    return (status, bytes(rest).decode())
+
+
+class FrameDecoder:
+    # Reassembles frames from a byte stream. Bytes outside of frames, and frames that fail
+    # their CRC, are skipped, with the search for the next frame resuming after the bad SYNC
+
+    def __init__(self):
+        self.__buffer = bytearray()
+        self.__frames = []
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.frames = 0
+        self.crc_errors = 0
+        self.skipped_bytes = 0
+
+    def feed(self, data):
+        # Add received bytes, returning how many complete frames are now waiting to be popped
+        self.__buffer += data
+        buffer = self.__buffer
+        start = 0
+        while True:
+            sync = start
+            while sync < len(buffer) and buffer[sync] != SYNC:
+                sync += 1
+            self.skipped_bytes += sync - start
+            start = sync
+
+            if len(buffer) - start < 2:
+                break
+            end = start + HEADER_SIZE + buffer[start + 1] + CRC_SIZE
+            if len(buffer) < end:
+                break
+
+            crc = (buffer[end - 2] << 8) | buffer[end - 1]
+            if crc16(buffer, start + 1, end - CRC_SIZE) != crc:
+                self.crc_errors += 1
+                self.skipped_bytes += 1
+                start += 1
+                continue
+
+            self.__frames.append((buffer[start + 2], buffer[start + 3], bytes(buffer[start + HEADER_SIZE:end - CRC_SIZE])))
+            self.frames += 1
+            start = end
+
+        if start > 0:
+            self.__buffer = buffer[start:]
+        return len(self.__frames)
+
+    def pop(self):
+        # Returns the oldest complete frame as (request_id, opcode, payload), or None
+        if len(self.__frames) > 0:
+            return self.__frames.pop(0)
+        return None
+
+
+class Server:
+    # Serves requests over USB CDC, calling the handler registered for each opcode, such as
+    # {OP_GANTRY_HOME: home}. Requests are read from the Yukon's monitor loop, so they are acknowledged
+    # (and a stop acted on) whilst an operation runs, not just between operations. Ctrl-C is disabled
+    # whilst serving, as its byte can appear in frames, so use OP_EXIT to return to the REPL.
+    #
+    # If given a CommandReader, that is fed OP_STOP instead of reading stdin, so the operations that
+    # wait for a "stop" line end on a stop frame. Only one operation runs at a time.
+
+    DEFAULT_POLL_MS = 5
+    MAX_PENDING = 8
+    MAX_BYTES_PER_SERVICE = 128     # Bounds the time a single service() call can take
+
+    def __init__(self, handlers, monitor=None, commands=None, stream_in=None, stream_out=None, poll_ms=DEFAULT_POLL_MS):
+        import uselect
+        from pimoroni_yukon.errors import OverVoltageError, UnderVoltageError, OverCurrentError, OverTemperatureError, FaultError
+
+        self.__handlers = handlers
+        self.__monitor = monitor
+        self.__commands = commands
+        self.__in = stream_in if stream_in is not None else sys.stdin.buffer
+        self.__out = stream_out if stream_out is not None else sys.stdout.buffer
+        self.__poll_ms = poll_ms
+
+        self.__poller = uselect.poll()
+        self.__poller.register(self.__in, uselect.POLLIN)
+        self.__decoder = FrameDecoder()
+
+        # Bytes are read one at a time into these, so a pass of the monitor loop with nothing received allocates nothing
+        self.__byte = bytearray(1)
+        self.__received = bytearray(self.MAX_BYTES_PER_SERVICE)
+        self.__received_view = memoryview(self.__received)
+
+        # Faults that turn off the Yukon's output. These are reported, then end serve()
+        self.__faults = (OverVoltageError, UnderVoltageError, OverCurrentError, OverTemperatureError, FaultError)
+
+        self.__pending = []
+        self.__exit_id = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.requests = 0
+        self.completed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.__decoder.reset_stats()
+
+    def service(self, *readings):
+        # Read whatever bytes are waiting, without blocking, and handle any frames they complete. Accepts
+        # and ignores the readings passed to a Yukon monitor action, so it can be assigned as one directly
+        if not self.__waiting():
+            return
+
+        received = self.__received
+        byte = self.__byte
+        count = 0
+        while count < self.MAX_BYTES_PER_SERVICE:
+            if not self.__in.readinto(byte):
+                break
+            received[count] = byte[0]
+            count += 1
+            if not self.__waiting():
+                break
+
+        if count == 0 or self.__decoder.feed(self.__received_view[:count]) == 0:
+            return
+
+        frame = self.__decoder.pop()
+        while frame is not None:
+            self.__receive(*frame)
+            frame = self.__decoder.pop()
+
+    def __waiting(self):
+        # True if a byte can be read. ipoll() is used, as unlike poll() it does not allocate a list of what is ready
+        for _ in self.__poller.ipoll(0):
+            return True
+        return False
+
+    def __receive(self, request_id, opcode, payload):
+        self.requests += 1
+        if opcode == OP_PING:
+            self.__send(request_id, OP_ACK, bytes((len(self.__pending),)))
+            self.__done(request_id, STATUS_OK)
+        elif opcode == OP_STOP:
+            self.__send(request_id, OP_ACK, bytes((len(self.__pending),)))
+            self.__cancel_pending()
+            if self.__commands is not None:
+                self.__commands.request_stop()
+            self.__done(request_id, STATUS_OK)
+        elif opcode == OP_EXIT:
+            self.__send(request_id, OP_ACK, bytes((len(self.__pending),)))
+            self.__exit_id = request_id
+        elif opcode not in self.__handlers:
+            self.__reject(request_id, STATUS_UNKNOWN_OPCODE)
+        else:
+            args = decode_args(opcode, payload)
+            if args is None:
+                self.__reject(request_id, STATUS_BAD_ARGUMENTS)
+            elif len(self.__pending) >= self.MAX_PENDING or self.__exit_id is not None:
+                self.__reject(request_id, STATUS_BUSY)
+            else:
+                self.__send(request_id, OP_ACK, bytes((len(self.__pending),)))
+                self.__pending.append((request_id, opcode, args))
+
+    def __send(self, request_id, opcode, payload=b""):
+        # Frames are written in one call, so they are not split by anything printed
+        self.__out.write(encode_frame(request_id, opcode, payload))
+
+    def __done(self, request_id, status, result=None):
+        self.__send(request_id, OP_DONE, encode_status(status, result))
+
+    def __reject(self, request_id, status):
+        self.rejected += 1
+        self.__send(request_id, OP_ERROR, encode_status(status))
+
+    def __cancel_pending(self):
+        while len(self.__pending) > 0:
+            request_id, _, _ = self.__pending.pop(0)
+            self.cancelled += 1
+            self.__done(request_id, STATUS_CANCELLED)
+
+    def __execute(self, request_id, opcode, args):
+        try:
+            result = self.__handlers[opcode](*args)
+        except Exception as e:
+            self.__done(request_id, STATUS_EXCEPTION, f"{type(e).__name__}: {e}")
+            if isinstance(e, self.__faults):
+                raise
+            return
+
+        self.completed += 1
+        if result is False:
+            self.__done(request_id, STATUS_FAILED)
+        elif result is None or result is True:
+            self.__done(request_id, STATUS_OK)
+        else:
+            self.__done(request_id, STATUS_OK, result)
+
+    def serve(self):
+        # Serve requests until OP_EXIT is received, or the Yukon faults
+        import micropython
+
+        self.__exit_id = None
+        micropython.kbd_intr(-1)
+        if self.__commands is not None:
+            self.__commands.set_source(self.service)
+        if self.__monitor is not None:
+            self.__monitor.assign_monitor_action(self.service)
+
+        try:
+            while self.__exit_id is None or len(self.__pending) > 0:
+                self.service()
+                if len(self.__pending) > 0:
+                    self.__execute(*self.__pending.pop(0))
+                elif self.__monitor is not None:
+                    self.__monitor.monitored_sleep_ms(self.__poll_ms)
+                else:
+                    time.sleep_ms(self.__poll_ms)
+        finally:
+            self.__cancel_pending()
+            if self.__monitor is not None:
+                self.__monitor.assign_monitor_action(None)
+            if self.__commands is not None:
+                self.__commands.set_source(None)
+            micropython.kbd_intr(3)
+
+        if self.__exit_id is not None:
+            self.__done(self.__exit_id, STATUS_OK)
+
+    def get_stats(self):
+        return {
+            "requests": self.requests,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "cancelled": self.cancelled,
+            "crc_errors": self.__decoder.crc_errors,
+            "skipped_bytes": self.__decoder.skipped_bytes
+        }
+
+    def print_stats(self):
+        print(self.get_stats())
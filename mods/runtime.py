@@ -0,0 +1,94 @@
+import asyncio
+
+from pimoroni_yukon.timing import ticks_ms, ticks_add, ticks_diff
+from pimoroni_yukon import spans
+
+# A cooperative runtime for the controllers. The Yukon's monitoring runs as a background task, so the
+# coroutines here and the *_async methods in mods.motors can wait with asyncio rather than with
+# yukon.monitored_sleep(). That lets servo settling, stepper moves, spool ramps and sensor waits overlap.
+#
+# Coroutines must not call the blocking helpers (monitored_sleep, wait_for_move, extrude_length, ...),
+# as nothing else runs, including the monitor, until they return.
+
+
+DEFAULT_POLL_MS = 10
+DEFAULT_RAMP_UPDATES = 20     # How many times to update a motor's speed per second during a ramp
+
+
+class Runtime:
+
+    DEFAULT_MONITOR_PERIOD_MS = 10
+
+    def __init__(self, yukon, monitor_period_ms=DEFAULT_MONITOR_PERIOD_MS):
+        self.yukon = yukon
+        self.monitor_period_ms = monitor_period_ms
+        self.fault = None
+        self.__main = None
+
+    def run(self, coro):
+        # Run a coroutine to completion with the Yukon monitored alongside it. If the monitor
+        # raises (e.g. an over current), the coroutine is cancelled and the fault raised from here
+        return asyncio.run(self.__supervise(coro))
+
+    async def __supervise(self, coro):
+        self.fault = None
+        self.__main = asyncio.create_task(coro)
+        monitor = asyncio.create_task(self.__monitor())
+        try:
+            return await self.__main
+        except asyncio.CancelledError:
+            if self.fault is not None:
+                raise self.fault
+            raise
+        finally:
+            monitor.cancel()
+            self.__main = None
+
+    async def __monitor(self):
+        self.yukon.clear_readings()
+        try:
+            while True:
+                self.yukon.monitor()
+                await asyncio.sleep(self.monitor_period_ms / 1000)
+        except Exception as e:
+            self.fault = e
+            if self.__main is not None:
+                self.__main.cancel()
+
+
+async def wait_until(condition, timeout=None, poll_ms=DEFAULT_POLL_MS):
+    # Wait for condition() (e.g. a sensor lookup) to become true.
+    # Returns True once it has, or False if the timeout (in seconds) elapsed first
+    if timeout is not None:
+        end_ms = ticks_add(ticks_ms(), int(timeout * 1000))
+
+    with spans.step("sensor"):
+        while not condition():
+            if timeout is not None and ticks_diff(end_ms, ticks_ms()) <= 0:
+                return False
+            await asyncio.sleep(poll_ms / 1000)
+    return True
+
+
+async def ramp(motor, start_speed, end_speed, duration, abort=None, updates=DEFAULT_RAMP_UPDATES):
+    # Linearly ramp a DC motor (e.g. module.motor) from one speed to another over the duration.
+    # Returns False without finishing the ramp if abort() becomes true, otherwise True.
+    # The motor is stopped if the ramp is cancelled
+    start_ms = ticks_ms()
+    period = 1 / updates
+    try:
+        with spans.step("spool"):
+            while True:
+                if abort is not None and abort():
+                    return False
+
+                elapsed = ticks_diff(ticks_ms(), start_ms) / 1000.0
+                if elapsed >= duration:
+                    motor.speed(end_speed)
+                    return True
+
+                motor.speed(start_speed + (end_speed - start_speed) * (elapsed / duration))
+                await asyncio.sleep(period)
+    except asyncio.CancelledError:
+        motor.speed(0)
+        raise
@@ -1,8 +1,11 @@
 import time
+from array import array
+from machine import Pin
 
 from breakout_ioexpander import BreakoutIOExpander
 
 from pimoroni_yukon import Yukon as yukon
+from pimoroni_yukon.timing import ticks_ms, ticks_us, ticks_diff
 
 
 
@@ -89,11 +92,23 @@ class Sensor:
 
 # Class for filament counter module Orthus, needs to be completed
 class FilamentCounter(Sensor):
+
+    EDGE_HISTORY = 16  # Number of edge timestamps kept, must be a power of two
+
     def __init__(self, pin):
         super().__init__(pin, 'digital')
         self.count = 0
         self.pulse_length = 0.156  # length of filament per pulse in mm
 
+        # Interrupt counting state. The edge total is only ever written by the interrupt handler,
+        # and resets just move the base it is measured from, so no locking is needed
+        self.irq_mode = False
+        self.edges = 0
+        self.edge_base = 0
+        self.edge_ticks = array('L', [0] * self.EDGE_HISTORY)
+        self.__io = None
+        self.__irq_pin = None
+
     def initialise(self, io):
         """
         Initialize the filament counter.
@@ -102,10 +117,74 @@ class FilamentCounter(Sensor):
         print("✨ Filament counter initialized as digital on pin", self.pin, "✨")
         self.last_state = self.check(io)
 
+    def attach_pin_irq(self, irq_pin, trigger=Pin.IRQ_RISING):
+        """
+        Count pulses with a hard interrupt on an RP2040 pin wired to the counter output.
+        Once attached, check() no longer needs to be polled.
+        :param irq_pin: Pin object the counter output is wired to
+        :param trigger: Edge that counts as a pulse
+        """
+        self.detach_irq()
+        irq_pin.init(Pin.IN, Pin.PULL_UP)
+        self.__irq_pin = irq_pin
+        self.irq_mode = True
+        self.reset_count()
+        irq_pin.irq(trigger=trigger, handler=self.__pin_edge, hard=True)
+
+    def attach_io_interrupt(self, io, int_pin):
+        """
+        Count pulses using the IO expander's interrupt output, wired to an RP2040 pin.
+        The expander only reports that its pin changed, so each change costs an I2C read
+        from a soft interrupt. Prefer attach_pin_irq() for fast feed rates.
+        :param io: The IO expander the counter is attached to
+        :param int_pin: Pin object the expander's INT output is wired to
+        """
+        self.detach_irq()
+        self.__io = io
+        self.last_state = super().check_state(io)
+        io.set_pin_interrupt(self.pin, True)
+        io.enable_interrupt_out()
+        io.clear_interrupt_flag()
+        int_pin.init(Pin.IN, Pin.PULL_UP)
+        self.__irq_pin = int_pin
+        self.irq_mode = True
+        self.reset_count()
+        int_pin.irq(trigger=Pin.IRQ_FALLING, handler=self.__io_edge)
+
+    def detach_irq(self):
+        """
+        Stop interrupt counting and go back to polling with check().
+        """
+        if self.__irq_pin is not None:
+            self.__irq_pin.irq(handler=None)
+            self.__irq_pin = None
+        if self.__io is not None:
+            self.__io.set_pin_interrupt(self.pin, False)
+            self.__io = None
+        if self.irq_mode:
+            self.irq_mode = False
+            self.count = 0
+
+    def __pin_edge(self, pin):
+        # Runs in a hard interrupt, so must not allocate
+        self.edge_ticks[self.edges & (self.EDGE_HISTORY - 1)] = ticks_us()
+        self.edges += 1
+
+    def __io_edge(self, pin):
+        current_state = self.__io.input(self.pin)
+        self.__io.clear_interrupt_flag()
+        if current_state != self.last_state and current_state == 1:
+            self.edge_ticks[self.edges & (self.EDGE_HISTORY - 1)] = ticks_us()
+            self.edges += 1
+        self.last_state = current_state
+
     def check(self, io):
         """
         Check the state of the filament counter and update the count if the state has changed.
+        Does nothing when pulses are being counted by interrupt.
         """
+        if self.irq_mode:
+            return
         save_last_state = self.last_state
         current_state = super().check_state(io)
         if current_state != save_last_state and current_state == 1:  # assuming a pulse is a transition to high
@@ -116,6 +195,8 @@ class FilamentCounter(Sensor):
         Get the current filament count.
         :return: Filament count
         """
+        if self.irq_mode:
+            return self.edges - self.edge_base
         return self.count
 
     def reset_count(self):
@@ -123,13 +204,40 @@ class FilamentCounter(Sensor):
         Reset the filament count to zero.
         """
         self.count = 0
+        self.edge_base = self.edges
 
     def filament_length(self):
         """
         Get the length of filament that has passed through.
         :return: Length of filament in mm
         """
-        return self.count * self.pulse_length
+        return self.get_count() * self.pulse_length
+
+    def last_edge_ticks(self):
+        """
+        Get the time of the most recent interrupt counted pulse.
+        :return: ticks_us() value, or None if no pulse has been counted since the last reset
+        """
+        edges = self.edges
+        if edges == self.edge_base:
+            return None
+        return self.edge_ticks[(edges - 1) & (self.EDGE_HISTORY - 1)]
+
+    def feed_rate(self):
+        """
+        Estimate the filament speed from the timestamps of recent interrupt counted pulses.
+        :return: Speed in mm/s, or 0.0 if there are not enough pulses to tell
+        """
+        edges = self.edges
+        pulses = min(edges - self.edge_base, self.EDGE_HISTORY) - 1
+        if pulses < 1:
+            return 0.0
+        newest = self.edge_ticks[(edges - 1) & (self.EDGE_HISTORY - 1)]
+        oldest = self.edge_ticks[(edges - 1 - pulses) & (self.EDGE_HISTORY - 1)]
+        elapsed_us = ticks_diff(newest, oldest)
+        if elapsed_us <= 0 or ticks_diff(ticks_us(), newest) > elapsed_us:
+            return 0.0  # Filament has stopped since the last pulse
+        return (pulses * self.pulse_length * 1000000) / elapsed_us
 
     def watch_until_length(self, length_mm, io):
         """
@@ -142,3 +250,139 @@ class FilamentCounter(Sensor):
             time.sleep(0.001)  # small delay to avoid busy-waiting
             print(f"Filament of {self.filament_length()} extruded")
         print(f" Desired length of {length_mm} mm of filament has passed through.")
+
+
+class SensorBank:
+    """
+    Reads a group of digital IO expander pins with one register read per port,
+    and caches the result for a short staleness window.
+    Snapshots are a bitmask, with bit N holding the state of the Nth added sensor.
+    """
+
+    ADDRESS = 0x18
+    DEFAULT_MAX_AGE_MS = 2
+
+    # Input port registers of the Nuvoton MS51 on the IO expander breakout
+    REG_P0 = 0x40
+    REG_P1 = 0x50
+    REG_P3 = 0x70
+
+    # (port register, bit) for IO expander pins 1 to 14
+    PIN_PORTS = ((REG_P1, 5), (REG_P1, 0), (REG_P1, 2), (REG_P1, 4), (REG_P0, 0),
+                 (REG_P0, 1), (REG_P1, 1), (REG_P0, 3), (REG_P0, 4), (REG_P3, 0),
+                 (REG_P0, 6), (REG_P0, 5), (REG_P0, 7), (REG_P1, 7))
+
+    def __init__(self, io, i2c, address=ADDRESS, max_age_ms=DEFAULT_MAX_AGE_MS):
+        """
+        :param io: BreakoutIOExpander used to configure the pins
+        :param i2c: I2C bus the IO expander is on, used for the bulk reads
+        :param address: I2C address of the IO expander
+        :param max_age_ms: How long a snapshot is reused before the pins are read again
+        """
+        self.io = io
+        self.i2c = i2c
+        self.address = address
+        self.max_age_ms = max_age_ms
+
+        self.names = []
+        self.pins = []
+        self.__ports = []       # Port registers that need reading
+        self.__buffers = []     # One preallocated byte per port register
+        self.__sources = []     # (port index, bit, invert) per sensor
+
+        self.__mask = 0
+        self.__ticks = 0
+        self.__valid = False
+
+    def add(self, name, pin, invert=False):
+        """
+        Add a digital sensor to the bank.
+        :param name: Name used to look the sensor up
+        :param pin: IO expander pin number (1 to 14)
+        :param invert: Report 1 when the pin reads low (e.g. active low switches)
+        """
+        if name in self.names:
+            raise ValueError(f"sensor '{name}' already added")
+        if pin < 1 or pin > len(self.PIN_PORTS):
+            raise ValueError(f"pin out of range. Expected 1 to {len(self.PIN_PORTS)}")
+
+        reg, bit = self.PIN_PORTS[pin - 1]
+        if reg not in self.__ports:
+            self.__ports.append(reg)
+            self.__buffers.append(bytearray(1))
+
+        self.names.append(name)
+        self.pins.append(pin)
+        self.__sources.append((self.__ports.index(reg), bit, invert))
+        self.__valid = False
+
+    def initialise(self, mode=None):
+        """
+        Set all the sensor pins to inputs (pulled up by default).
+        """
+        if mode is None:
+            mode = self.io.PIN_IN_PU
+        for pin in self.pins:
+            self.io.set_mode(pin, mode)
+
+    def read(self):
+        """
+        Read all the sensors now, ignoring any cached snapshot.
+        :return: Snapshot bitmask
+        """
+        for i in range(len(self.__ports)):
+            self.i2c.readfrom_mem_into(self.address, self.__ports[i], self.__buffers[i])
+
+        mask = 0
+        for i in range(len(self.__sources)):
+            port, bit, invert = self.__sources[i]
+            if ((self.__buffers[port][0] >> bit) & 1) != invert:
+                mask |= 1 << i
+
+        self.__mask = mask
+        self.__ticks = ticks_ms()
+        self.__valid = True
+        return mask
+
+    def snapshot(self):
+        """
+        Get the sensor states, only reading the IO expander if the cached snapshot is too old.
+        :return: Snapshot bitmask
+        """
+        if not self.__valid or ticks_diff(ticks_ms(), self.__ticks) > self.max_age_ms:
+            return self.read()
+        return self.__mask
+
+    def invalidate(self):
+        """
+        Force the next snapshot to read the IO expander.
+        """
+        self.__valid = False
+
+    def bit(self, name):
+        return 1 << self.names.index(name)
+
+    def get(self, name, default=None):
+        """
+        Get the state of a single sensor.
+        :return: 1 or 0, or default if there is no sensor with that name
+        """
+        try:
+            bit = self.bit(name)
+        except ValueError:
+            return default
+        return 1 if self.snapshot() & bit else 0
+
+    def state(self, mask, name):
+        """
+        Get the state of a sensor from a previously taken snapshot.
+        """
+        return 1 if mask & self.bit(name) else 0
+
+    def to_dict(self, mask=None):
+        """
+        Get the states of all sensors as a dictionary of name to state.
+        """
+        if mask is None:
+            mask = self.snapshot()
+        return {name: (mask >> i) & 1 for i, name in enumerate(self.names)}
@@ -0,0 +1,50 @@
+import os
+import sys
+
+from sim.clock import VirtualClock, Costs
+from sim.world import World, Rail, FilamentPath, Spool, counter_source, active
+
+# Runs the controllers on CPython, against simulated hardware on a virtual clock, faster than real time.
+#
+#   import sim
+#   world = sim.install()          # Before anything imports machine, pimoroni_yukon, or mods
+#   from pimoroni_yukon import Yukon
+#
+# install() puts stand-ins for the firmware's modules (machine, tca, motor, servo, encoder, breakout_ioexpander,
+# uselect, utime, micropython, ucollections) ahead of everything else on the path, and makes CPython's time
+# functions and asyncio event loops run on the World's clock. Modules registered with a Yukon are fitted to
+# the simulated board. sim.boards wires each of the machine's boards up, ready to import its main_*.py.
+#
+# Not simulated: the DMA streamed stepper backend, UART and I2S.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRMWARE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "firmware")
+LIB = os.path.join(ROOT, "lib")
+
+
+def install(world=None):
+    # Make world (or a new one) the simulated hardware. Returns the world
+    from sim import shims, world as world_module
+
+    if world is None:
+        world = World()
+    world_module.set_active(world)
+
+    for path in (ROOT, LIB, FIRMWARE):
+        if path in sys.path:
+            sys.path.remove(path)
+        sys.path.insert(0, path)
+
+    shims.patch_time()
+    shims.patch_asyncio(world.clock)
+    shims.patch_sys()
+    shims.patch_yukon(world)
+    return world
+
+
+def uninstall():
+    # Put CPython's time functions and event loops back. Imported stand-ins stay imported
+    from sim import shims, world as world_module
+    shims.restore_asyncio()
+    shims.restore()
+    world_module.set_active(None)
@@ -0,0 +1,56 @@
+import sys
+import time
+
+import sim.boards
+
+# Runs a board's operations against the simulation, printing how long each took on the virtual clock
+# and for real:
+#
+#   python -m sim [gantry|printer|storage]
+
+
+def run(board, label, function, *args):
+    clock = board.world.clock
+    virtual_start = clock.seconds()
+    real_start = time.perf_counter()
+    result = function(*args)
+    virtual = clock.seconds() - virtual_start
+    real = time.perf_counter() - real_start
+    print(f"== {label}: {result}, {virtual:.2f}s simulated in {real:.2f}s ({virtual / max(real, 1e-9):.0f}x)")
+    return result
+
+
+def main(name="gantry"):
+    main_module, board = sim.boards.load(name)
+
+    if name == "gantry":
+        run(board, "Home", main_module.home)
+        run(board, "Move to station 2", main_module.move_to, 2)
+        print(f"   Carriage at {board.rail.x:.1f} steps, over station {board.rail.station()}")
+        run(board, "Intake", main_module.intake_filament)
+        print(f"   Filament tip at {board.filament.tip:.1f}mm")
+        # Stopped 10s in, after a 2s load and the 5s ramp up, as a stop frame would
+        board.world.clock.schedule_in(10000000, lambda clock: main_module.commands.request_stop())
+        run(board, "Spool up until stopped", main_module.spool_up_until, 0.5, 2)
+        print(f"   Ramped down {main_module.commands.last_stop_latency_us / 1000:.1f}ms after the stop")
+    elif name == "printer":
+        run(board, "Dock", main_module.dock)
+        run(board, "Intake", main_module.intake_filament)
+        print(f"   Filament tip at {board.filament.tip:.1f}mm")
+    elif name == "storage":
+        run(board, "Deliver 120mm", main_module.stepper_TL.deliver_filament, 120)
+        print(f"   Filament tip at {board.filament_tl.tip:.2f}mm")
+        run(board, "Cut", main_module.cutFilament)
+    else:
+        raise ValueError(f"unknown board '{name}'. Expected one of {list(sim.boards.BUILDERS)}")
+
+    # The telemetry the board's Yukon recorded whilst monitoring, which should span every operation above
+    telemetry = main_module.telemetry
+    ticks = [row[0] for row in telemetry.rows()]
+    if len(ticks) > 0:
+        print(f"   Telemetry: {len(telemetry)} samples of {len(telemetry.names)} channels, "
+              f"over the last {(max(ticks) - min(ticks)) / 1000:.1f}s")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
@@ -0,0 +1,93 @@
+import os
+import sys
+import json
+import time
+import contextlib
+import subprocess
+
+# Runs the benchmarks in mods/bench.py against the simulated hardware, for each board's own objects:
+#
+#   python -m sim.bench                             Every board, printed
+#   python -m sim.bench gantry --out bench.json     One board, also written as JSON
+#   python -m sim.bench --calls 1000
+#
+# Latencies are on the virtual clock, so they are what the simulation's costs (sim.clock.Costs) say the
+# calls would take on an RP2040. They count bus transfers and pin accesses rather than Python's speed, and
+# are the same from run to run, which makes a change in the number of hardware accesses easy to spot.
+# Allocations are measured with tracemalloc, and include what the simulated hardware allocates.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOARDS = ("gantry", "printer", "storage")
+
+
+def bench_objects(name, module):
+    # The objects each board's main_*.py makes that the benchmarks exercise
+    if name == "gantry":
+        return {"yukon": module.yukon, "stepper": module.gantryStepper1.stepper, "check_inputs": module.check_inputs}
+    if name == "printer":
+        return {"yukon": module.yukon, "stepper": module.printerFilamentStepper.stepper,
+                "check_inputs": module.check_inputs}
+    if name == "storage":
+        return {"yukon": module.yukon, "stepper": module.stepper_TL.stepper.stepper,
+                "counter": module.filament_counter, "io": module.io}
+    raise ValueError(f"unknown board '{name}'. Expected one of {list(BOARDS)}")
+
+
+def bench_board(name, calls):
+    # Run the benchmarks for a board in this process. Returns the results
+    import sim.boards
+
+    with open(os.devnull, "w") as output, contextlib.redirect_stdout(output):
+        module, board = sim.boards.load(name)
+        from mods import bench
+        start = time.perf_counter()
+        results = bench.run(calls=calls, show=False, **bench_objects(name, module))
+
+    results["board"] = name
+    results["clock"] = "virtual"
+    results["host_seconds"] = time.perf_counter() - start
+    return results
+
+
+def main(argv):
+    args = list(argv)
+    names, out, calls, child = [], None, None, False
+    while len(args) > 0:
+        arg = args.pop(0)
+        if arg == "--out":
+            out = args.pop(0)
+        elif arg == "--calls":
+            calls = int(args.pop(0))
+        elif arg == "--child":
+            child = True
+        else:
+            names.append(arg)
+
+    import sim
+    sim.install()
+    from mods import bench
+    calls = calls if calls is not None else bench.DEFAULT_CALLS
+
+    if child:
+        sys.__stdout__.write(json.dumps(bench_board(names[0], calls)))
+        return
+
+    # Each board in a process of its own, as only one can be loaded per process
+    results = {}
+    for name in names if len(names) > 0 else BOARDS:
+        command = [sys.executable, "-m", "sim.bench", name, "--child", "--calls", str(calls)]
+        process = subprocess.run(command, cwd=ROOT, stdout=subprocess.PIPE, text=True)
+        if process.returncode != 0:
+            raise RuntimeError(f"benchmarking the {name} failed with exit code {process.returncode}")
+        results[name] = json.loads(process.stdout)
+
+    for name, result in results.items():
+        print(f"== {name} ({result['host_seconds']:.1f}s)")
+        bench.print_results(result)
+    if out is not None:
+        with open(out, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
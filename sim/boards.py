@@ -0,0 +1,95 @@
+import importlib
+
+import sim
+from sim.world import World, Rail, FilamentPath, counter_source
+
+# The machine's three boards, wired as their main_*.py files expect: the same slots, IO expander pins and
+# servo channels. Each builder returns a Board holding the World and the models of its parts, and load()
+# installs the World and imports the board's main_*.py, running its setup as at power-up:
+#
+#   gantry, board = sim.boards.load("gantry")
+#   gantry.home()
+#   gantry.move_to(2)
+#   print(board.rail.station(), board.world.clock.seconds())
+#
+# Only one board can be loaded per process, as the main_*.py files and mods share module level objects.
+# Distances along the filament paths are in mm from where the filament starts, and are rough guesses.
+
+IO_ADDRESS = 0x18
+
+
+class Board:
+
+    def __init__(self, name, world, **parts):
+        self.name = name
+        self.world = world
+        self.io = world.io_expander(IO_ADDRESS)
+        for key, value in parts.items():
+            setattr(self, key, value)
+
+
+def gripping(world, pin_name, threshold, engaged_below=True):
+    # A grip source that is true whilst the drive servo is pressing the filament against the drive gear
+    def grip():
+        servo = world.servo(pin_name)
+        if servo is None or not servo.is_enabled():
+            return False
+        position = servo.position()
+        return position < threshold if engaged_below else position > threshold
+    return grip
+
+
+def gantry(world=None, lock_mm=60.0, int_pin=None):
+    # SLOT1 rail stepper, SLOT2 filament stepper, SLOT3 servos (drive on servo2), SLOT5 spool. int_pin is the
+    # RP2040 pin the IO expander's INT output is wired to, if any, for latching the home endstop
+    world = world if world is not None else World()
+    rail = Rail(world.stepper(1))
+    # The drive servo backs off to -32 when engaged and -25 when disengaged
+    filament = FilamentPath(world.stepper(2), tip=5.0, grip=gripping(world, "SLOT3_FAST2", -28.5))
+    spool = world.spool(5)
+
+    io = world.io_expander(IO_ADDRESS, int_pin)
+    io.set_input(3, rail.hall)
+    io.set_input(4, rail.home_left)
+    io.set_input(5, rail.home_right)
+    io.set_input(6, 1)                                          # Guide fitted
+    io.set_input(7, filament.sensor(0.0), invert=True)          # Active low when filament is present
+    io.set_input(8, filament.sensor(lock_mm), invert=True)
+    return Board("gantry", world, rail=rail, filament=filament, spool=spool)
+
+
+def printer(world=None, lock_mm=30.0):
+    # SLOT1 spool, SLOT2 filament stepper, SLOT3 servos (drive on servo2)
+    world = world if world is not None else World()
+    # The drive servo backs off to 15 when engaged and 27 when disengaged
+    filament = FilamentPath(world.stepper(2), tip=0.0, grip=gripping(world, "SLOT3_FAST2", 21.0))
+    spool = world.spool(1)
+
+    io = world.io_expander(IO_ADDRESS)
+    io.set_input(3, filament.sensor(0.0), invert=True)          # Intake sensor
+    io.set_input(4, 1)                                          # Guide fitted
+    io.set_input(5, filament.sensor(lock_mm), invert=True)
+    return Board("printer", world, filament=filament, spool=spool)
+
+
+def storage(world=None, pulse_mm=0.156):
+    # SLOT1 servos (TL drive on servo4, TR drive on servo2), SLOT2 TL stepper, SLOT6 TR stepper, counter on pin 1
+    world = world if world is not None else World()
+    # The drive servos back off to -31 when engaged, and only -30 when disengaged, so the threshold is tight
+    filament_tl = FilamentPath(world.stepper(2), grip=gripping(world, "SLOT1_FAST4", -30.5))
+    filament_tr = FilamentPath(world.stepper(6), grip=gripping(world, "SLOT1_FAST2", -30.5))
+
+    io = world.io_expander(IO_ADDRESS)
+    io.set_input(1, counter_source((filament_tl, filament_tr), pulse_mm))
+    return Board("storage", world, filament_tl=filament_tl, filament_tr=filament_tr)
+
+
+BUILDERS = {"gantry": gantry, "printer": printer, "storage": storage}
+
+
+def load(name, world=None, **kwargs):
+    # Build the board, install its World, and import its main_*.py. Returns (module, board)
+    board = BUILDERS[name](world, **kwargs)
+    sim.install(board.world)
+    module = importlib.import_module(f"main_{name}")
+    return module, board
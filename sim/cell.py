@@ -0,0 +1,523 @@
+import os
+import sys
+import json
+import heapq
+import contextlib
+import subprocess
+
+# A discrete event simulation of the whole cell: the gantry, printer and storage boards working through a
+# list of jobs together, to find where the cell spends its time and to try scheduling changes.
+#
+#   import sim.cell
+#   jobs = [sim.cell.filament_change(0, home=True), sim.cell.filament_change(1)]
+#   report = sim.cell.Cell(jobs).run()
+#   report.print()
+#
+# Nothing is estimated from constants copied out of the controllers. Each board runs its own steps, in order,
+# through its real main_*.py on the simulated hardware (sim.boards), so servo travel times, OkayStepper moves,
+# the spool_up ramps, monitored_sleep pauses and sensor triggered loops all take as long as the code makes them.
+# Each board is profiled in its own process (only one board can be loaded per process), and the time its steps
+# spend is split by what the code was doing:
+#
+#   pause    in a fixed monitored_sleep
+#   servo    waiting out a servo's travel time
+#   stepper  waiting for a stepper move to finish
+#   ramp     pacing a DC motor ramp with monitor_until_ms
+#   hold     waiting for the host's stop command, in the operations that run until told to
+#   sensing  anything else, mostly polling sensors whilst something moves
+#
+# Whether anything was actually moving (a stepper stepping, a servo travelling or a spool turning) is sampled
+# alongside, so a pause taken whilst the spool runs is told apart from one where the whole board stands still.
+#
+# Each board works through its own steps in the order they appear in the job list, one at a time, as its
+# protocol.Server does. The simulation then adds the hand-offs between boards (a step's "after" dependencies)
+# to find when each step starts, the cycle time, each station's utilisation, and the critical path.
+#
+# Run from the repository root:
+#
+#   python -m sim.cell                         The built in example, two filament changes
+#   python -m sim.cell jobs.json               A job list (see load_jobs())
+#   python -m sim.cell --scale pause=0.5       Halve every pause, to see what that would buy
+#   python -m sim.cell --json                  Print the report as JSON
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STATIONS = ("gantry", "printer", "storage")
+CATEGORIES = ("pause", "servo", "stepper", "ramp", "hold", "sensing")
+
+SAMPLE_PERIOD_US = 10000        # How often whether anything is moving is sampled
+
+
+class Step:
+    # One operation on one station, named as in mods/protocol.py without the OP_<STATION>_ prefix (so "move_to"
+    # for OP_GANTRY_MOVE_TO), and run with args. after holds the indices of the steps in the same job it waits
+    # for, and defaults to the step before. hold is how many seconds an operation that runs until told to stop
+    # (such as "deliver_until") runs for before the host sends "stop"
+
+    def __init__(self, station, op, args=(), after=None, hold=None, label=None):
+        if station not in STATIONS:
+            raise ValueError(f"unknown station '{station}'. Expected one of {list(STATIONS)}")
+        self.station = station
+        self.op = op
+        self.args = tuple(args)
+        self.after = None if after is None else tuple(after)
+        self.hold = hold
+        self.label = label if label is not None else f"{station}.{op}{self.args if len(self.args) > 0 else '()'}"
+
+    def __repr__(self):
+        return f"Step({self.label})"
+
+    def key(self):
+        return [self.op, list(self.args), self.hold]
+
+
+def filament_change(filament_set=0, storage_station=1, printer_station=3, length=120, spool_time=10, home=False):
+    # A filament change: the gantry fetches a length of filament from the storage station and loads it into the
+    # printer. The storage output docks whilst the gantry travels, and the printer docks whenever it is free
+    steps = [
+        Step("gantry", "move_to", (storage_station,), after=()),               # 0
+        Step("storage", "dock", after=()),                                      # 1
+        Step("storage", "deliver", (filament_set, length), after=(0, 1)),      # 2
+        Step("gantry", "intake", after=(2,)),                                   # 3
+        Step("storage", "cut", after=(3,)),                                     # 4
+        Step("storage", "undock", after=(4,)),                                  # 5
+        Step("gantry", "move_to", (printer_station,), after=(4,)),              # 6
+        Step("printer", "dock", after=()),                                      # 7
+        Step("gantry", "deliver", (25,), after=(6, 7)),                         # 8
+        Step("printer", "intake", after=(8,)),                                  # 9
+        Step("printer", "spool_up", (spool_time, 0.5), after=(9,)),             # 10
+        Step("printer", "undock", after=(10,)),                                 # 11
+    ]
+    if home:
+        steps.insert(0, Step("gantry", "home", after=()))
+        steps[1].after = (0,)
+        for step in steps[2:]:
+            step.after = tuple(i + 1 for i in step.after)
+    return steps
+
+
+def load_jobs(path):
+    # A JSON list of jobs, each a list of steps:
+    #   [[{"station": "gantry", "op": "move_to", "args": [1], "after": []}, ...], ...]
+    with open(path) as file:
+        jobs = json.load(file)
+    return [[Step(s["station"], s["op"], s.get("args", ()), s.get("after"), s.get("hold"), s.get("label"))
+             for s in job] for job in jobs]
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Profiling the boards
+# ---------------------------------------------------------------------------------------------------------------
+
+def _arrive_at_gantry(board):
+    # New filament pushed up to the gantry's input sensor by the storage station
+    board.filament.tip = 5.0
+
+
+def _arrive_at_printer(board):
+    # Filament pushed up to the printer's intake sensor by the gantry
+    board.filament.tip = 0.0
+
+
+# Filament handed over from another station, which a board's own simulation cannot see arrive
+ARRIVALS = {
+    ("gantry", "intake"): _arrive_at_gantry,
+    ("printer", "intake"): _arrive_at_printer,
+    ("printer", "wait_for_intake"): _arrive_at_printer,
+}
+
+
+class _Tracker:
+    # Splits the time spent in a step by what the code was doing, attributing nested waits (such as the
+    # monitored_sleep_ms inside ServoMove.wait) to the outermost one
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.category = None
+        self.seconds = dict.fromkeys(CATEGORIES, 0.0)
+
+    def wrap(self, function, category):
+        def tracked(*args, **kwargs):
+            if self.category is not None:
+                return function(*args, **kwargs)
+            self.category = category
+            start = self.clock.now_us
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.seconds[category] += (self.clock.now_us - start) / 1000000
+                self.category = None
+        return tracked
+
+    def reset(self):
+        self.seconds = dict.fromkeys(CATEGORIES, 0.0)
+
+
+class _MotionSampler:
+    # Counts the time during which any stepper steps, servo travels or spool turns
+
+    def __init__(self, world):
+        self.world = world
+        self.entry = None
+        self.positions = {}
+        self.moving_us = 0.0
+
+    def __is_moving(self):
+        moving = False
+        for slot_id, stepper in self.world.steppers.items():
+            if stepper.position != self.positions.get(slot_id):
+                self.positions[slot_id] = stepper.position
+                moving = True
+        for servo in self.world.servos.values():
+            if servo.is_enabled() and servo.position() != servo.value():
+                moving = True
+        for spool in self.world.spools.values():
+            spool.update()
+            if abs(spool.rps) > 0.01:
+                moving = True
+        return moving
+
+    def __sample(self, clock):
+        if self.__is_moving():
+            self.moving_us += SAMPLE_PERIOD_US
+        self.entry = clock.schedule_in(SAMPLE_PERIOD_US, self.__sample)
+
+    def start(self):
+        self.moving_us = 0.0
+        self.__is_moving()
+        self.entry = self.world.clock.schedule_in(SAMPLE_PERIOD_US, self.__sample)
+
+    def stop(self):
+        self.world.clock.cancel(self.entry)
+        self.entry = None
+        return self.moving_us / 1000000
+
+
+def _handler(module, station, op):
+    from mods import protocol
+    opcode = getattr(protocol, f"OP_{station.upper()}_{op.upper()}", None)
+    if opcode is None or opcode not in module.handlers:
+        raise ValueError(f"'{op}' is not an operation of the {station}")
+    return module.handlers[opcode]
+
+
+def profile_board(station, steps):
+    # Run a board's steps in order on the simulated hardware, in this process. steps is a list of
+    # [op, args, hold]. Returns a dict per step, of its duration, result, category split and moving time
+    import sim
+    import sim.boards
+    from sim import shims
+
+    output = open(os.devnull, "w")      # The controllers print as they go, which is not wanted in the results
+    with contextlib.redirect_stdout(output):
+        module, board = sim.boards.load(station)
+
+    import pimoroni_yukon
+    from mods import motors, commands
+
+    clock = board.world.clock
+    tracker = _Tracker(clock)
+    for target, name, category in ((pimoroni_yukon.Yukon, "monitored_sleep_ms", "pause"),
+                                   (pimoroni_yukon.Yukon, "monitor_until_ms", "ramp"),
+                                   (motors.ServoMove, "wait", "servo"),
+                                   (motors.StepperMotor, "wait_for_move", "stepper"),
+                                   (commands.CommandReader, "wait_for_stop", "hold")):
+        shims.patch(target, name, tracker.wrap(getattr(target, name), category))
+    sampler = _MotionSampler(board.world)
+
+    results = []
+    for op, args, hold in steps:
+        handler = _handler(module, station, op)
+        arrive = ARRIVALS.get((station, op))
+        if arrive is not None:
+            arrive(board)
+
+        stop_entry = None
+        if hold is not None:
+            stop_entry = clock.schedule_in(hold * 1000000, lambda clock: module.commands.request_stop())
+
+        tracker.reset()
+        sampler.start()
+        start = clock.now_us
+        result, error = None, None
+        try:
+            with contextlib.redirect_stdout(output):
+                result = handler(*args)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        duration = (clock.now_us - start) / 1000000
+        moving = sampler.stop()
+        clock.cancel(stop_entry)
+
+        seconds = dict(tracker.seconds)
+        seconds["sensing"] = max(duration - sum(seconds.values()), 0.0)
+        results.append({"duration": duration, "result": result if isinstance(result, (bool, int, float)) else None,
+                        "error": error, "seconds": seconds, "moving": min(moving, duration)})
+    return results
+
+
+def _profile_in_process(station, steps):
+    # Profile in a new process, as each board has to be loaded in one of its own
+    command = [sys.executable, "-m", "sim.cell", "--profile", station]
+    return subprocess.Popen(command, cwd=ROOT, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True), steps
+
+
+def profile(jobs, cache=None):
+    # Profile every station's steps, the stations in parallel. cache is the path of a JSON file to keep the
+    # profiles in, so trying a different schedule with the same steps on each station does not profile again.
+    # Returns {station: [result per step, in job list order]}
+    sequences = {station: [] for station in STATIONS}
+    for job in jobs:
+        for step in job:
+            sequences[step.station].append(step.key())
+
+    cached = {}
+    if cache is not None and os.path.exists(cache):
+        with open(cache) as file:
+            cached = json.load(file)
+
+    profiles, running = {}, {}
+    for station, steps in sequences.items():
+        if len(steps) == 0:
+            profiles[station] = []
+            continue
+        key = json.dumps([station, steps])
+        if key in cached:
+            profiles[station] = cached[key]
+        else:
+            running[station] = (key,) + _profile_in_process(station, steps)
+
+    for station, (key, process, steps) in running.items():
+        out, _ = process.communicate(json.dumps(steps))
+        if process.returncode != 0:
+            raise RuntimeError(f"profiling the {station} failed with exit code {process.returncode}")
+        profiles[station] = json.loads(out)
+        cached[key] = profiles[station]
+
+    if cache is not None and len(running) > 0:
+        with open(cache, "w") as file:
+            json.dump(cached, file)
+    return profiles
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# The cell
+# ---------------------------------------------------------------------------------------------------------------
+
+class _Task:
+    # A step of a job, with its profile and where the simulation put it
+
+    def __init__(self, job, index, step, profile, scale):
+        self.job = job
+        self.index = index
+        self.step = step
+        self.profile = profile
+        self.seconds = {c: profile["seconds"][c] * scale.get(c, 1.0) for c in CATEGORIES}
+        self.duration = sum(self.seconds.values())
+        # Moving time shrinks or grows with the step, so a scaled pause still shows as standing still
+        self.moving = profile["moving"] * (self.duration / profile["duration"] if profile["duration"] > 0 else 0.0)
+        self.deps = []
+        self.previous = None        # The task before this on the same station
+        self.start = None
+        self.end = None
+        self.cause = None           # The task that this one started after finishing, None if it started at zero
+
+    def name(self):
+        return f"job {self.job} {self.step.label}"
+
+
+class Cell:
+    # The three stations working through jobs (lists of Steps). scale multiplies the time spent in each
+    # category, such as {"pause": 0.5}, to see what shortening it would buy without changing the controllers
+
+    def __init__(self, jobs, scale=None, cache=None):
+        self.jobs = [list(job) for job in jobs]
+        self.scale = dict(scale) if scale is not None else {}
+        self.cache = cache
+        for category in self.scale:
+            if category not in CATEGORIES:
+                raise ValueError(f"unknown category '{category}'. Expected one of {list(CATEGORIES)}")
+        self.profiles = None
+
+    def profile(self):
+        if self.profiles is None:
+            self.profiles = profile(self.jobs, self.cache)
+        return self.profiles
+
+    def __tasks(self):
+        profiles = self.profile()
+        taken = {station: 0 for station in STATIONS}
+        last = {station: None for station in STATIONS}
+        tasks = []
+        for j, job in enumerate(self.jobs):
+            job_tasks = []
+            for i, step in enumerate(job):
+                task = _Task(j, i, step, profiles[step.station][taken[step.station]], self.scale)
+                taken[step.station] += 1
+                task.previous = last[step.station]
+                last[step.station] = task
+                job_tasks.append(task)
+            for i, task in enumerate(job_tasks):
+                after = task.step.after if task.step.after is not None else ((i - 1,) if i > 0 else ())
+                for d in after:
+                    if not 0 <= d < len(job_tasks) or d == i:
+                        raise ValueError(f"{task.name()} waits for step {d}, which is not another step of its job")
+                    task.deps.append(job_tasks[d])
+            tasks.extend(job_tasks)
+        return tasks
+
+    def run(self):
+        # Simulate the jobs, returning a Report
+        tasks = self.__tasks()
+        events = []         # (time, sequence, task) for each task finishing
+        sequence = 0
+        busy = {station: None for station in STATIONS}
+        queues = {station: [t for t in tasks if t.step.station == station] for station in STATIONS}
+        now = 0.0
+
+        def ready(task):
+            return all(d.end is not None and d.end <= now for d in task.deps)
+
+        while True:
+            # Start the next step on each free station, if what it waits for has finished
+            for station in STATIONS:
+                queue = queues[station]
+                if busy[station] is None and len(queue) > 0 and ready(queue[0]):
+                    task = queue.pop(0)
+                    task.start = now
+                    task.end = now + task.duration
+                    finished = [d for d in task.deps] + ([task.previous] if task.previous is not None else [])
+                    if len(finished) > 0:
+                        # The latest to finish held this one up. Ties go to the hand-off rather than the station
+                        task.cause = max(finished, key=lambda t: (t.end, t is not task.previous))
+                    busy[station] = task
+                    heapq.heappush(events, (task.end, sequence, task))
+                    sequence += 1
+
+            if len(events) == 0:
+                break
+            now, _, task = heapq.heappop(events)
+            busy[task.step.station] = None
+
+        waiting = [queue[0].name() for queue in queues.values() if len(queue) > 0]
+        if len(waiting) > 0:
+            raise ValueError(f"the jobs cannot finish, as each station's next step waits on another: {waiting}")
+        return Report(tasks, self.scale)
+
+
+class Report:
+
+    def __init__(self, tasks, scale):
+        self.tasks = tasks
+        self.scale = scale
+        self.makespan = max((t.end for t in tasks), default=0.0)
+
+        job_ends = {}
+        for task in tasks:
+            job_ends[task.job] = max(job_ends.get(task.job, 0.0), task.end)
+        ends = sorted(job_ends.values())
+        # The interval between jobs finishing once the cell is running, which the first job's start up is left out of
+        self.cycle_time = (ends[-1] - ends[0]) / (len(ends) - 1) if len(ends) > 1 else self.makespan
+
+        self.stations = {}
+        for station in STATIONS:
+            own = [t for t in tasks if t.step.station == station]
+            busy = sum(t.duration for t in own)
+            self.stations[station] = {
+                "steps": len(own),
+                "busy": busy,
+                "utilisation": busy / self.makespan if self.makespan > 0 else 0.0,
+                "moving": sum(t.moving for t in own),
+                "seconds": {c: sum(t.seconds[c] for t in own) for c in CATEGORIES},
+            }
+
+        # Back from the last step to finish, through whatever held each step up
+        self.critical_path = []
+        task = max(tasks, key=lambda t: t.end, default=None)
+        while task is not None:
+            self.critical_path.insert(0, task)
+            task = task.cause
+        self.critical_seconds = {c: sum(t.seconds[c] for t in self.critical_path) for c in CATEGORIES}
+        self.critical_moving = sum(t.moving for t in self.critical_path)
+        self.errors = [(t.name(), t.profile["error"]) for t in tasks if t.profile["error"] is not None]
+
+    def to_dict(self):
+        def task_dict(t):
+            return {"job": t.job, "step": t.index, "label": t.step.label, "station": t.step.station,
+                    "start": t.start, "end": t.end, "duration": t.duration, "moving": t.moving,
+                    "seconds": t.seconds, "result": t.profile["result"], "error": t.profile["error"]}
+
+        return {
+            "makespan": self.makespan,
+            "cycle_time": self.cycle_time,
+            "scale": self.scale,
+            "stations": self.stations,
+            "critical_path": [task_dict(t) for t in self.critical_path],
+            "critical_seconds": self.critical_seconds,
+            "critical_moving": self.critical_moving,
+            "steps": [task_dict(t) for t in self.tasks],
+            "errors": self.errors,
+        }
+
+    def print(self):
+        def split(seconds):
+            return "  ".join(f"{c} {seconds[c]:.1f}s" for c in CATEGORIES if seconds[c] >= 0.05)
+
+        jobs = len(set(t.job for t in self.tasks))
+        print(f"{jobs} jobs in {self.makespan:.1f}s, cycle time {self.cycle_time:.1f}s")
+        if len(self.scale) > 0:
+            print(f"Scaled: {self.scale}")
+
+        print("\nStation   Steps   Busy      Util   Moving")
+        for station, s in self.stations.items():
+            print(f"{station:<9} {s['steps']:>5}   {s['busy']:>6.1f}s  {s['utilisation']:>5.0%}   {s['moving']:>6.1f}s   {split(s['seconds'])}")
+
+        critical = sum(t.duration for t in self.critical_path)
+        print(f"\nCritical path, {critical:.1f}s of which {self.critical_moving:.1f}s has something moving:")
+        print(f"  {split(self.critical_seconds)}")
+        for t in self.critical_path:
+            print(f"  {t.start:>7.1f}s  {t.duration:>6.1f}s  job {t.job}  {t.step.label:<32} {split(t.seconds)}")
+
+        for name, error in self.errors:
+            print(f"\n{name} failed: {error}")
+
+
+def _parse_scale(values):
+    scale = {}
+    for value in values:
+        category, _, factor = value.partition("=")
+        scale[category] = float(factor)
+    return scale
+
+
+def main(argv):
+    if len(argv) >= 2 and argv[0] == "--profile":
+        # Profile one board for profile(), reading its steps from stdin and writing the results to stdout
+        steps = json.load(sys.stdin)
+        results = profile_board(argv[1], steps)
+        sys.__stdout__.write(json.dumps(results))
+        return
+
+    scale, path, cache, as_json = [], None, None, False
+    args = list(argv)
+    while len(args) > 0:
+        arg = args.pop(0)
+        if arg == "--scale":
+            scale.append(args.pop(0))
+        elif arg == "--cache":
+            cache = args.pop(0)
+        elif arg == "--json":
+            as_json = True
+        else:
+            path = arg
+
+    jobs = load_jobs(path) if path is not None else [filament_change(0, home=True), filament_change(1)]
+    report = Cell(jobs, _parse_scale(scale), cache).run()
+    if as_json:
+        print(json.dumps(report.to_dict(), indent=2))
+    else:
+        report.print()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,132 @@
+import heapq
+
+# A virtual clock for running the controllers faster than real time. Nothing here sleeps: sleeping advances
+# the clock, running any timer callbacks and other events that fall due along the way, as interrupts would.
+#
+# Code that busy-waits on ticks_ms() or polls hardware without sleeping would never see time pass, so every
+# hardware access (and every ticks call) charges a small cost to the clock, roughly what it takes on an RP2040.
+
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+
+class Costs:
+    # Microseconds charged to the clock for each operation. Rough figures for MicroPython on an RP2040
+    TICKS = 10
+    PIN = 5
+    ADC = 5
+    I2C = 50
+    I2C_PER_BYTE = 25
+    PWM = 10
+    TIMER_CALLBACK = 30
+
+
+class VirtualClock:
+
+    EPOCH = 1704067200      # time() at the start of a simulation (2024-01-01)
+
+    def __init__(self):
+        self.now_us = 0.0
+        self.events = 0
+        self.__queue = []
+        self.__sequence = 0     # Keeps events due at the same time in the order they were scheduled
+        self.__dispatching = False
+
+    def schedule(self, at_us, callback):
+        # Run callback(clock) once the clock reaches at_us. Returns a handle for cancel()
+        entry = [at_us, self.__sequence, callback]
+        self.__sequence += 1
+        heapq.heappush(self.__queue, entry)
+        return entry
+
+    def schedule_in(self, us, callback):
+        return self.schedule(self.now_us + us, callback)
+
+    def cancel(self, entry):
+        if entry is not None:
+            entry[2] = None     # Left in the queue and skipped, as removing it would need a re-heapify
+
+    def next_due(self):
+        while len(self.__queue) > 0 and self.__queue[0][2] is None:
+            heapq.heappop(self.__queue)
+        return self.__queue[0][0] if len(self.__queue) > 0 else None
+
+    def is_dispatching(self):
+        return self.__dispatching
+
+    def advance(self, us, until=None):
+        # Move the clock on by us, running every event that falls due in order. If until() becomes
+        # true after an event, the clock stops at that event instead. Returns the microseconds advanced
+        start = self.now_us
+        end = self.now_us + max(us, 0)
+        if self.__dispatching:
+            # Called from within an event (an interrupt), so just take the time
+            self.now_us = end
+            return end - start
+
+        while True:
+            due = self.next_due()
+            if due is None or due > end:
+                break
+            _, _, callback = heapq.heappop(self.__queue)
+            self.now_us = max(self.now_us, due)
+            self.__dispatching = True
+            try:
+                callback(self)
+            finally:
+                self.__dispatching = False
+            self.events += 1
+            if until is not None and until():
+                return self.now_us - start
+
+        self.now_us = max(self.now_us, end)
+        return self.now_us - start
+
+    def charge(self, us):
+        # Account for time spent doing something, such as a bus transfer
+        self.advance(us)
+
+    def run_until_idle(self, limit_us=None):
+        # Run events until none remain, or the limit is reached
+        while True:
+            due = self.next_due()
+            if due is None or (limit_us is not None and due > limit_us):
+                return
+            self.advance(due - self.now_us)
+
+    # MicroPython's time functions, on the virtual clock
+
+    def sleep(self, seconds):
+        self.advance(seconds * 1000000)
+
+    def sleep_ms(self, ms):
+        self.advance(ms * 1000)
+
+    def sleep_us(self, us):
+        self.advance(us)
+
+    def ticks_us(self):
+        self.charge(Costs.TICKS)
+        return int(self.now_us) & TICKS_MAX
+
+    def ticks_ms(self):
+        self.charge(Costs.TICKS)
+        return int(self.now_us // 1000) & TICKS_MAX
+
+    def ticks_cpu(self):
+        return self.ticks_us()
+
+    def time(self):
+        return self.EPOCH + self.now_us / 1000000
+
+    def seconds(self):
+        return self.now_us / 1000000
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & TICKS_MAX
+
+
+def ticks_diff(ticks1, ticks2):
+    return ((ticks1 - ticks2 + TICKS_HALFPERIOD) & TICKS_MAX) - TICKS_HALFPERIOD
@@ -0,0 +1,68 @@
+from sim.clock import Costs
+from sim.world import active, IOExpanderDevice
+
+# A stand-in for Pimoroni's breakout_ioexpander module, onto the World's IOExpanderDevice at the address.
+# Each call costs roughly the I2C transfers the real driver makes
+
+
+class BreakoutIOExpander:
+    PIN_IN = 1
+    PIN_IN_PU = 2
+    PIN_OUT = 3
+    PIN_OD = 4
+    PIN_PWM = 5
+    PIN_ADC = 6
+
+    def __init__(self, i2c, address=0x18, interrupt=None):
+        self.__world = active()
+        self.__device = self.__world.io_expander(address)
+
+    def __transfer(self, nbytes=3):
+        self.__world.clock.charge(Costs.I2C + Costs.I2C_PER_BYTE * nbytes)
+        return self.__device
+
+    def set_mode(self, pin, mode, schmitt_trigger=False, invert=False):
+        device = self.__transfer(6)
+        if mode == self.PIN_IN_PU:
+            device.modes[pin] = IOExpanderDevice.MODE_IN_PU
+        elif mode == self.PIN_ADC:
+            device.modes[pin] = IOExpanderDevice.MODE_ADC
+        elif mode in (self.PIN_OUT, self.PIN_OD, self.PIN_PWM):
+            device.modes[pin] = IOExpanderDevice.MODE_OUT
+        else:
+            device.modes[pin] = IOExpanderDevice.MODE_IN
+
+    def get_mode(self, pin):
+        return self.__device.modes[pin]
+
+    def input(self, pin, adc_timeout=1):
+        device = self.__transfer()
+        if device.modes[pin] == IOExpanderDevice.MODE_ADC:
+            return int(device.voltage(pin) * 4095 / 3.3)
+        return device.level(pin)
+
+    def input_as_voltage(self, pin, adc_timeout=1):
+        return self.__transfer(6).voltage(pin)
+
+    def output(self, pin, value, load=True):
+        device = self.__transfer()
+        device.outputs[pin] = 1 if value else 0
+
+    def set_pin_interrupt(self, pin, enabled):
+        device = self.__transfer()
+        device.interrupts[pin] = enabled
+        device.last_levels[pin] = device.level(pin) if enabled else None
+
+    def enable_interrupt_out(self, pin_swap=False):
+        self.__transfer().int_out = True
+
+    def disable_interrupt_out(self):
+        self.__transfer().int_out = False
+
+    def get_interrupt_flag(self):
+        return self.__transfer().flag
+
+    def clear_interrupt_flag(self):
+        device = self.__transfer()
+        device.flag = False
+        self.__world.refresh()      # The INT output is released
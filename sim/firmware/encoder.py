@@ -0,0 +1,53 @@
+import math
+
+from sim.world import active
+
+# A stand-in for Pimoroni's encoder module, counting the revolutions of the Spool in the encoder's slot
+
+MMME_CPR = 12
+ROTARY_CPR = 24
+
+
+class Encoder:
+
+    def __init__(self, pio, sm, pins, common_pin=None, direction=0, counts_per_rev=ROTARY_CPR, count_microsteps=False, freq_divider=1):
+        self.__world = active()
+        name = pins[0].name
+        self.__slot_id = int(name[4]) if name.startswith("SLOT") else None
+        self.__counts_per_rev = counts_per_rev * (4 if count_microsteps else 1)
+        self.__zero = 0
+        self.__last = 0
+
+    def __revolutions(self):
+        spool = self.__world.spools.get(self.__slot_id)
+        if spool is None:
+            return 0.0
+        spool.update()
+        return spool.revolutions
+
+    def count(self):
+        return int(self.__revolutions() * self.__counts_per_rev) - self.__zero
+
+    def delta(self):
+        count = self.count()
+        delta = count - self.__last
+        self.__last = count
+        return delta
+
+    def zero(self):
+        self.__zero += self.count()
+        self.__last = 0
+
+    def revolutions(self):
+        return self.count() / self.__counts_per_rev
+
+    def degrees(self):
+        return self.revolutions() * 360.0
+
+    def radians(self):
+        return self.revolutions() * math.pi * 2
+
+    def counts_per_rev(self, counts_per_rev=None):
+        if counts_per_rev is None:
+            return self.__counts_per_rev
+        self.__counts_per_rev = counts_per_rev
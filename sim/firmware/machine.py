@@ -0,0 +1,255 @@
+from sim.clock import Costs
+from sim.world import active, PinState
+
+# A stand-in for MicroPython's machine module, on the active simulated World.
+# Pins are handles onto the World's pin states, so objects made before a World is installed still work with it
+
+
+# Pins behind the TCA9555 IO expanders, which cost an I2C transfer to change or read
+TCA_PINS = ("ADC_ADDR_1", "ADC_ADDR_2", "ADC_ADDR_3", "ADC_MUX_EN_1", "ADC_MUX_EN_2",
+            "MAIN_EN", "LED_A", "LED_B", "SW_A", "SW_B", "USER_SW")
+
+
+def is_tca_pin(name):
+    return name in TCA_PINS or (name.startswith("SLOT") and "_SLOW" in name)
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    ALT = 3
+
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    __pins = {}
+
+    class board:
+        pass
+
+    def __new__(cls, id, *args, **kwargs):
+        name = id if isinstance(id, str) else f"GP{id}"
+        pin = Pin.__pins.get(name)
+        if pin is None:
+            pin = super().__new__(cls)
+            pin.name = name
+            pin.__cost = Costs.I2C if is_tca_pin(name) else Costs.PIN
+            Pin.__pins[name] = pin
+        return pin
+
+    def __init__(self, id, mode=-1, pull=-1, *, value=None):
+        if mode != -1 or value is not None:
+            self.init(mode, pull, value=value)
+
+    def __repr__(self):
+        return f"Pin({self.name})"
+
+    def __state(self):
+        world = active()
+        world.clock.charge(self.__cost)
+        return world, world.pin(self.name)
+
+    def init(self, mode=-1, pull=-1, *, value=None):
+        world, state = self.__state()
+        if mode != -1:
+            state.mode = PinState.OUT if mode in (Pin.OUT, Pin.OPEN_DRAIN) else PinState.IN
+        if pull != -1:
+            state.pull = "up" if pull == Pin.PULL_UP else "down" if pull == Pin.PULL_DOWN else None
+        if value is not None:
+            state.latch = 1 if value else 0
+
+    def value(self, x=None):
+        world, state = self.__state()
+        if x is None:
+            return world.level(self.name)
+        state.latch = 1 if x else 0
+        if state.mode == PinState.OUT:
+            world.refresh()
+
+    def __call__(self, x=None):
+        return self.value(x)
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    high = on
+    low = off
+
+    def toggle(self):
+        self.value(1 - self.value())
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        world, state = self.__state()
+        state.handler = handler
+        state.handle = self
+        state.rising = (trigger & Pin.IRQ_RISING) != 0
+        state.falling = (trigger & Pin.IRQ_FALLING) != 0
+        state.last_level = world.level(self.name) if handler is not None else None
+
+
+class _Board:
+    def __getattr__(self, name):
+        return Pin(name)
+
+
+Pin.board = _Board()
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, **kwargs):
+        self.__entry = None
+        self.__mode = Timer.PERIODIC
+        self.__period_us = 0
+        self.__callback = None
+        if len(kwargs) > 0:
+            self.init(**kwargs)
+
+    def init(self, *, mode=PERIODIC, period=-1, freq=-1, tick_hz=1000, callback=None):
+        self.deinit()
+        if freq > 0:
+            period_us = 1000000 / freq
+        elif period >= 0:
+            period_us = period * 1000000 / tick_hz
+        else:
+            raise ValueError("period or freq must be given")
+
+        clock = active().clock
+        self.__mode = mode
+        self.__period_us = max(period_us, 1)
+        self.__callback = callback
+        self.__entry = clock.schedule(clock.now_us + self.__period_us, self.__fire)
+
+    def deinit(self):
+        if self.__entry is not None:
+            active().clock.cancel(self.__entry)
+            self.__entry = None
+
+    def __fire(self, clock):
+        due = self.__entry[0]
+        self.__entry = None
+        if self.__mode == Timer.PERIODIC:
+            # Scheduled from when this was due rather than now, so callbacks do not drift
+            self.__entry = clock.schedule(due + self.__period_us, self.__fire)
+        clock.charge(Costs.TIMER_CALLBACK)
+        if self.__callback is not None:
+            self.__callback(self)
+
+
+class ADC:
+    CORE_TEMP = 4
+
+    def __init__(self, pin):
+        self.__name = pin.name if isinstance(pin, Pin) else f"GP{pin}"
+
+    def read_u16(self):
+        world = active()
+        if self.__name == "SHARED_ADC":
+            return world.read_adc_u16()
+        world.clock.charge(Costs.ADC)
+        source = world.inputs.get(self.__name)
+        value = source() if callable(source) else source
+        if value is None:
+            return 0
+        return max(min(int(float(value) * 65535 / 3.3), 65535), 0)
+
+
+class I2C:
+
+    def __init__(self, id=0, *, sda=None, scl=None, freq=400000):
+        self.freq = freq
+
+    def __device(self, addr, nbytes):
+        world = active()
+        world.clock.charge(Costs.I2C + Costs.I2C_PER_BYTE * nbytes)
+        device = world.i2c_devices.get(addr)
+        if device is None:
+            raise OSError(5)    # EIO, as when nothing acknowledges the address
+        return device
+
+    def scan(self):
+        return sorted(active().i2c_devices.keys())
+
+    def readfrom_mem_into(self, addr, memaddr, buf):
+        device = self.__device(addr, 2 + len(buf))
+        for i in range(len(buf)):
+            buf[i] = device.read_register(memaddr + i)
+
+    def readfrom_mem(self, addr, memaddr, nbytes):
+        buf = bytearray(nbytes)
+        self.readfrom_mem_into(addr, memaddr, buf)
+        return bytes(buf)
+
+    def writeto_mem(self, addr, memaddr, buf):
+        device = self.__device(addr, 2 + len(buf))
+        write = getattr(device, "write_register", None)
+        if write is not None:
+            for i in range(len(buf)):
+                write(memaddr + i, buf[i])
+
+
+class PWM:
+
+    def __init__(self, dest, *, freq=1000, duty_u16=0):
+        self.__freq = freq
+        self.__duty = duty_u16
+
+    def freq(self, value=None):
+        if value is None:
+            return self.__freq
+        self.__freq = value
+
+    def duty_u16(self, value=None):
+        if value is None:
+            return self.__duty
+        active().clock.charge(Costs.PWM)
+        self.__duty = value
+
+    def deinit(self):
+        pass
+
+
+class UART:
+
+    def __init__(self, *args, **kwargs):
+        raise NotImplementedError("UART is not simulated")
+
+
+class I2S:
+    RX = 0
+    TX = 1
+    MONO = 0
+    STEREO = 1
+
+    def __init__(self, *args, **kwargs):
+        raise NotImplementedError("I2S is not simulated")
+
+
+def freq(hz=None):
+    return 125000000
+
+
+def disable_irq():
+    # Callbacks only run between the steps of the simulated clock, so there is never one to hold off
+    return 1
+
+
+def enable_irq(state=1):
+    pass
+
+
+def reset():
+    raise SystemExit("machine.reset()")
+
+
+def unique_id():
+    return b"\x00sim\x00yuk"
@@ -0,0 +1,42 @@
+# A stand-in for the micropython module. Code emitters are left as plain Python, and scheduled
+# functions run straight away, as the simulated interrupts already run between Python statements
+
+
+def const(value):
+    return value
+
+
+def native(function):
+    return function
+
+
+def viper(function):
+    return function
+
+
+def kbd_intr(char):
+    pass
+
+
+def schedule(function, arg):
+    function(arg)
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def opt_level(level=None):
+    return 0 if level is None else None
+
+
+def heap_lock():
+    return 0
+
+
+def heap_unlock():
+    return 0
+
+
+def mem_info(verbose=False):
+    print("mem: not simulated")
@@ -0,0 +1,96 @@
+from sim.clock import Costs
+from sim.world import active
+
+# A stand-in for Pimoroni's motor module. The world is told of every change, so steppers and spools can follow
+
+NORMAL_DIR = 0
+REVERSED_DIR = 1
+
+FAST_DECAY = 0
+SLOW_DECAY = 1
+
+
+class Motor:
+
+    def __init__(self, pins, direction=NORMAL_DIR, speed_scale=1.0, zeropoint=0.0, deadzone=0.05, freq=25000, mode=SLOW_DECAY, ph_en_driver=False):
+        self.__world = active()
+        self.pins = tuple(pin.name for pin in pins)
+        self.__direction = direction
+        self.__speed_scale = speed_scale
+        self.__deadzone = deadzone
+        self.__freq = freq
+        self.__mode = mode
+        self.__duty = 0.0
+        self.__enabled = False
+        self.__world.motors.append(self)
+
+    def __changed(self):
+        self.__world.clock.charge(Costs.PWM)
+        self.__world.on_motor_changed(self)
+
+    def enable(self):
+        self.__enabled = True
+        self.__changed()
+
+    def disable(self):
+        self.__enabled = False
+        self.__changed()
+
+    def is_enabled(self):
+        return self.__enabled
+
+    def duty(self, duty=None):
+        if duty is None:
+            return self.__duty
+        self.__duty = max(min(float(duty), 1.0), -1.0)
+        self.__enabled = True
+        self.__changed()
+
+    def speed(self, speed=None):
+        if speed is None:
+            return self.__duty * self.__speed_scale
+        self.duty(speed / self.__speed_scale)
+
+    def frequency(self, freq=None):
+        if freq is None:
+            return self.__freq
+        self.__freq = freq
+
+    def stop(self):
+        self.duty(0.0)
+
+    def coast(self):
+        self.__duty = 0.0
+        self.disable()
+
+    def brake(self):
+        self.duty(0.0)
+
+    def full_negative(self):
+        self.duty(-1.0)
+
+    def full_positive(self):
+        self.duty(1.0)
+
+    def to_percent(self, value, value_min=0.0, value_max=1.0, speed_min=-1.0, speed_max=1.0):
+        self.speed(speed_min + (value - value_min) * (speed_max - speed_min) / (value_max - value_min))
+
+    def direction(self, direction=None):
+        if direction is None:
+            return self.__direction
+        self.__direction = direction
+
+    def speed_scale(self, speed_scale=None):
+        if speed_scale is None:
+            return self.__speed_scale
+        self.__speed_scale = speed_scale
+
+    def deadzone(self, deadzone=None):
+        if deadzone is None:
+            return self.__deadzone
+        self.__deadzone = deadzone
+
+    def decay_mode(self, mode=None):
+        if mode is None:
+            return self.__mode
+        self.__mode = mode
@@ -0,0 +1,97 @@
+from sim.clock import Costs
+from sim.world import active
+
+# A stand-in for Pimoroni's servo module. Servos move towards their value at SPEED degrees per second,
+# so models can tell where a servo actually is, rather than where it was last told to go
+
+ANGULAR = 0
+LINEAR = 1
+CONTINUOUS = 2
+
+
+class Servo:
+    SPEED = 300.0           # Degrees per second
+    MIN_VALUE = -90.0
+    MAX_VALUE = 90.0
+    MIN_PULSE = 500.0
+    MAX_PULSE = 2500.0
+
+    def __init__(self, pin, calibration=ANGULAR, freq=50):
+        self.__world = active()
+        self.pin = pin.name
+        self.__freq = freq
+        self.__enabled = False
+        self.__value = 0.0
+        self.__start = None         # Where the current move started, None if not known
+        self.__start_us = 0.0
+        self.__world.servos[self.pin] = self
+
+    def enable(self):
+        self.__enabled = True
+
+    def disable(self):
+        self.__settle()
+        self.__enabled = False
+
+    def is_enabled(self):
+        return self.__enabled
+
+    def __settle(self):
+        # Fix the position reached so far, as the servo stops being driven
+        if self.__enabled:
+            self.__start = self.position()
+            self.__value = self.__start
+
+    def value(self, value=None):
+        if value is None:
+            return self.__value
+        self.__world.clock.charge(Costs.PWM)
+        value = max(min(float(value), self.MAX_VALUE), self.MIN_VALUE)
+        self.__start = self.position() if self.__enabled else self.__start
+        self.__start_us = self.__world.clock.now_us
+        self.__value = value
+        self.__enabled = True
+
+    def position(self):
+        # Where the servo is now. Without a known start, it is assumed to already be there
+        if self.__start is None:
+            return self.__value
+        travelled = self.SPEED * (self.__world.clock.now_us - self.__start_us) / 1000000
+        if abs(self.__value - self.__start) <= travelled:
+            return self.__value
+        return self.__start + travelled * (1 if self.__value > self.__start else -1)
+
+    def is_at(self, value, tolerance=2.0):
+        return self.__enabled and abs(self.position() - value) <= tolerance
+
+    def pulse(self, pulse=None):
+        span = self.MAX_PULSE - self.MIN_PULSE
+        if pulse is None:
+            return self.MIN_PULSE + (self.__value - self.MIN_VALUE) * span / (self.MAX_VALUE - self.MIN_VALUE)
+        self.value(self.MIN_VALUE + (pulse - self.MIN_PULSE) * (self.MAX_VALUE - self.MIN_VALUE) / span)
+
+    def frequency(self, freq=None):
+        if freq is None:
+            return self.__freq
+        self.__freq = freq
+
+    def min_value(self):
+        return self.MIN_VALUE
+
+    def mid_value(self):
+        return (self.MIN_VALUE + self.MAX_VALUE) / 2
+
+    def max_value(self):
+        return self.MAX_VALUE
+
+    def to_min(self):
+        self.value(self.MIN_VALUE)
+
+    def to_mid(self):
+        self.value(self.mid_value())
+
+    def to_max(self):
+        self.value(self.MAX_VALUE)
+
+    def to_percent(self, value, value_min=0.0, value_max=1.0, angle_min=MIN_VALUE, angle_max=MAX_VALUE):
+        self.value(angle_min + (value - value_min) * (angle_max - angle_min) / (value_max - value_min))
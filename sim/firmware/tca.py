@@ -0,0 +1,35 @@
+from sim.clock import Costs
+from sim.world import active
+from machine import TCA_PINS, is_tca_pin
+
+# A stand-in for the Yukon firmware's tca module, which drives the TCA9555 IO expanders' pins together.
+# The named pins are on chip 0, and the slots' slow pins fill chips 1 and 2
+
+PINS_PER_CHIP = 16
+
+
+def _locate(name):
+    if not is_tca_pin(name):
+        raise ValueError(f"{name} is not on a TCA IO expander")
+    if name in TCA_PINS:
+        return 0, TCA_PINS.index(name)
+    index = (int(name[4]) - 1) * 3 + (int(name[-1]) - 1)
+    return 1 + index // PINS_PER_CHIP, index % PINS_PER_CHIP
+
+
+def get_chip(pin):
+    return _locate(pin.name)[0]
+
+
+def get_number(pin):
+    return _locate(pin.name)[1]
+
+
+def change_output_mask(chip, mask, state):
+    world = active()
+    world.clock.charge(Costs.I2C + Costs.I2C_PER_BYTE * 3)
+    for name in world.pins:
+        if is_tca_pin(name):
+            pin_chip, number = _locate(name)
+            if pin_chip == chip and mask & (1 << number):
+                world.pins[name].latch = 1 if state & (1 << number) else 0
@@ -0,0 +1 @@
+from collections import OrderedDict, namedtuple, deque
@@ -0,0 +1,57 @@
+import select as _select
+
+from sim.world import active
+
+# A stand-in for MicroPython's uselect. Streams with a sim_available() method (such as a simulated console)
+# are ready when it returns true. Real files are checked without blocking, and waits pass on the virtual clock
+
+POLLIN = 0x001
+POLLOUT = 0x004
+POLLERR = 0x008
+POLLHUP = 0x010
+
+
+class _Poll:
+
+    def __init__(self):
+        self.__registered = {}
+
+    def register(self, obj, eventmask=POLLIN | POLLOUT):
+        self.__registered[id(obj)] = (obj, eventmask)
+
+    def unregister(self, obj):
+        self.__registered.pop(id(obj), None)
+
+    def modify(self, obj, eventmask):
+        self.__registered[id(obj)] = (obj, eventmask)
+
+    def __ready(self):
+        ready = []
+        for obj, mask in self.__registered.values():
+            available = getattr(obj, "sim_available", None)
+            if available is not None:
+                if available() and mask & POLLIN:
+                    ready.append((obj, POLLIN))
+                continue
+            try:
+                fileno = obj.fileno()
+            except (AttributeError, OSError, ValueError):
+                continue    # Not a real file, such as captured output, so never ready
+            readable, writable, _ = _select.select([fileno] if mask & POLLIN else [], [fileno] if mask & POLLOUT else [], [], 0)
+            if readable or writable:
+                ready.append((obj, (POLLIN if readable else 0) | (POLLOUT if writable else 0)))
+        return ready
+
+    def poll(self, timeout=-1):
+        ready = self.__ready()
+        if len(ready) == 0 and timeout > 0:
+            active().clock.sleep_ms(timeout)
+            ready = self.__ready()
+        return ready
+
+    def ipoll(self, timeout=-1, flags=0):
+        return iter(self.poll(timeout))
+
+
+def poll():
+    return _Poll()
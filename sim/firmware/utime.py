@@ -0,0 +1,40 @@
+from sim.clock import ticks_add, ticks_diff
+from sim.world import active
+
+# A stand-in for MicroPython's time functions, on the active World's clock. sim.install() also sets these onto
+# CPython's time module, as MicroPython code imports them from either
+
+
+def sleep(seconds):
+    active().clock.sleep(seconds)
+
+
+def sleep_ms(ms):
+    active().clock.sleep_ms(ms)
+
+
+def sleep_us(us):
+    active().clock.sleep_us(us)
+
+
+def ticks_ms():
+    return active().clock.ticks_ms()
+
+
+def ticks_us():
+    return active().clock.ticks_us()
+
+
+def ticks_cpu():
+    return active().clock.ticks_cpu()
+
+
+def time():
+    return active().clock.time()
+
+
+def time_ns():
+    return int(active().clock.time() * 1000000000)
+
+
+__all__ = ["sleep", "sleep_ms", "sleep_us", "ticks_ms", "ticks_us", "ticks_cpu", "ticks_add", "ticks_diff", "time", "time_ns"]
@@ -0,0 +1,213 @@
+import re
+import sys
+import time
+import asyncio
+import inspect
+import selectors
+
+# The differences between CPython and MicroPython that the controllers run into, smoothed over so they
+# run unmodified: MicroPython's extra time functions, asyncio.ThreadSafeFlag, a virtual time event loop,
+# and double underscore names, which MicroPython does not mangle and CPython does.
+
+_originals = {}
+_policies = []
+
+
+def patch(target, name, value):
+    key = (id(target), name)
+    if key not in _originals:
+        _originals[key] = (target, name, getattr(target, name, None), hasattr(target, name))
+    setattr(target, name, value)
+
+
+def restore():
+    for target, name, value, existed in _originals.values():
+        if existed:
+            setattr(target, name, value)
+        else:
+            delattr(target, name)
+    _originals.clear()
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# time
+# ---------------------------------------------------------------------------------------------------------------
+
+def patch_time():
+    # MicroPython code imports its time functions from time as well as utime, so both are virtual.
+    # Note this includes time.sleep() and time.time() for everything else in the process
+    import utime
+    for name in utime.__all__:
+        patch(time, name, getattr(utime, name))
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# asyncio
+# ---------------------------------------------------------------------------------------------------------------
+
+class ThreadSafeFlag:
+    # MicroPython's asyncio.ThreadSafeFlag. set() may be called from a simulated interrupt, which runs on the
+    # same thread, and a waiting task clears the flag as it wakes
+
+    def __init__(self):
+        self.__flag = False
+        self.__event = None
+
+    def set(self):
+        self.__flag = True
+        if self.__event is not None:
+            self.__event.set()
+
+    def clear(self):
+        self.__flag = False
+
+    async def wait(self):
+        while not self.__flag:
+            self.__event = asyncio.Event()      # Made per wait, as each asyncio.run() has its own loop
+            try:
+                await self.__event.wait()
+            finally:
+                self.__event = None
+        self.__flag = False
+
+
+class VirtualSelector(selectors.BaseSelector):
+    # Waits by advancing the clock rather than blocking, stopping early should an event (such as a timer
+    # callback setting a ThreadSafeFlag) make a callback ready. Only blocks for real when nothing is scheduled
+
+    def __init__(self, clock):
+        self.__clock = clock
+        self.__selector = selectors.DefaultSelector()
+        self.ready = None
+
+    def register(self, fileobj, events, data=None):
+        return self.__selector.register(fileobj, events, data)
+
+    def unregister(self, fileobj):
+        return self.__selector.unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+        return self.__selector.modify(fileobj, events, data)
+
+    def get_map(self):
+        return self.__selector.get_map()
+
+    def close(self):
+        self.__selector.close()
+
+    def select(self, timeout=None):
+        events = self.__selector.select(0)
+        if len(events) > 0 or (timeout is not None and timeout <= 0):
+            return events
+        if timeout is None:
+            if self.__clock.next_due() is None:
+                return self.__selector.select(None)
+            timeout = (self.__clock.next_due() - self.__clock.now_us) / 1000000
+        self.__clock.advance(timeout * 1000000, until=self.ready)
+        return self.__selector.select(0)
+
+
+class VirtualEventLoop(asyncio.SelectorEventLoop):
+
+    def __init__(self, clock):
+        selector = VirtualSelector(clock)
+        super().__init__(selector)
+        selector.ready = lambda: len(self._ready) > 0   # Callbacks queued by an event, so waiting should end
+        self.__clock = clock
+        self._clock_resolution = 1e-6
+
+    def time(self):
+        return self.__clock.seconds()
+
+
+class VirtualEventLoopPolicy(asyncio.DefaultEventLoopPolicy):
+
+    def __init__(self, clock):
+        super().__init__()
+        self.__clock = clock
+
+    def new_event_loop(self):
+        return VirtualEventLoop(self.__clock)
+
+
+async def sleep_ms(ms):
+    await asyncio.sleep(ms / 1000)
+
+
+def patch_asyncio(clock):
+    patch(asyncio, "ThreadSafeFlag", ThreadSafeFlag)
+    patch(asyncio, "sleep_ms", sleep_ms)
+    if len(_policies) == 0:
+        _policies.append(asyncio.get_event_loop_policy())
+    asyncio.set_event_loop_policy(VirtualEventLoopPolicy(clock))
+
+
+def restore_asyncio():
+    if len(_policies) > 0:
+        asyncio.set_event_loop_policy(_policies.pop())
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# sys
+# ---------------------------------------------------------------------------------------------------------------
+
+def patch_sys():
+    # The Yukon logs the firmware from the part of sys.version after '; '
+    if "; " not in sys.version:
+        patch(sys, "version", sys.version.replace("\n", " ") + "; CPython sim")
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Name mangling
+# ---------------------------------------------------------------------------------------------------------------
+
+def _mangled(cls):
+    return f"_{cls.__name__.lstrip('_')}__"
+
+
+def alias_private_members(base, cls):
+    # Let cls use the base's double underscore methods and attributes as MicroPython allows, by aliasing
+    # the base's mangled names under cls's. Instance attributes cls assigns itself are left as its own
+    base_prefix = _mangled(base)
+    cls_prefix = _mangled(cls)
+
+    for name, value in list(vars(base).items()):
+        if name.startswith(base_prefix):
+            alias = cls_prefix + name[len(base_prefix):]
+            if alias not in vars(cls):
+                setattr(cls, alias, value)
+
+    assignment = r"self\.__{}\s*=(?!=)"
+    cls_source = inspect.getsource(cls)
+    for attr in set(re.findall(assignment.format(r"(\w+)"), inspect.getsource(base))):
+        alias = cls_prefix + attr
+        if alias in vars(cls) or re.search(assignment.format(attr), cls_source):
+            continue
+        target = base_prefix + attr
+        setattr(cls, alias, property(lambda self, target=target: getattr(self, target),
+                                     lambda self, value, target=target: setattr(self, target, value)))
+
+
+def patch_yukon(world):
+    # Alias the module classes' private members, and fit each module registered with a slot to the
+    # simulated board, so detection finds what the code expects
+    import pimoroni_yukon
+    from pimoroni_yukon.modules import KNOWN_MODULES
+    from pimoroni_yukon.modules.common import YukonModule
+
+    for module_type in KNOWN_MODULES:
+        alias_private_members(YukonModule, module_type)
+
+    register = pimoroni_yukon.Yukon.register_with_slot
+    if getattr(register, "simulated", False):
+        return
+
+    def register_with_slot(self, module, slot):
+        register(self, module, slot)
+        slot_id = slot if isinstance(slot, int) else slot.ID
+        active = sys.modules["sim.world"].active()
+        if active.slot(slot_id).NAME is None and module.NAME is not None:
+            active.fit(slot_id, module.NAME)
+
+    register_with_slot.simulated = True
+    patch(pimoroni_yukon.Yukon, "register_with_slot", register_with_slot)
@@ -0,0 +1,624 @@
+import math
+
+from sim.clock import VirtualClock, Costs
+
+# The physical side of a simulated Yukon: what the fake hardware in sim.firmware reads and drives.
+#
+# The World holds the state of every pin, the modules fitted to each slot, and the devices on the I2C bus.
+# Models of the machine hang off it: steppers turn as their coil duties rotate, and move a gantry Rail or a
+# FilamentPath, whose positions then drive the sensors wired to pins or IO expander inputs.
+#
+# Sensors are callables returning a level (or a voltage), evaluated whenever the pin is read. After any motion
+# the World refreshes the pins that have interrupts attached, so edges fire as the sensor passes its position.
+
+_active = None
+
+
+def active():
+    if _active is None:
+        raise RuntimeError("No simulated world is installed. Call sim.install() first")
+    return _active
+
+
+def set_active(world):
+    global _active
+    _active = world
+
+
+ADC_REF = 3.3
+U16_MAX = 65535
+
+
+def voltage_to_u16(voltage):
+    return max(min(int(voltage * U16_MAX / ADC_REF + 0.5), U16_MAX), 0)
+
+
+def temp_to_analog(celsius, pullup=5100, r25=10000.0, beta=3435):
+    # The inverse of pimoroni_yukon.conversion.analog_to_temp
+    kelvin = celsius + 273.15
+    r_thermistor = r25 * math.exp(beta * (1 / kelvin - 1 / 298.15))
+    return ADC_REF * r_thermistor / (r_thermistor + pullup)
+
+
+class PinState:
+    IN = 0
+    OUT = 1
+
+    def __init__(self, name):
+        self.name = name
+        self.mode = self.IN
+        self.pull = None
+        self.latch = 0
+        self.handler = None
+        self.handle = None      # The Pin passed to the handler
+        self.rising = False
+        self.falling = False
+        self.last_level = None
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Slots. Each fitted module presents the detection levels the Yukon expects on its ADCs and slow pins
+# ---------------------------------------------------------------------------------------------------------------
+
+class EmptySlot:
+    NAME = None
+
+    def __init__(self, world, slot_id):
+        self.world = world
+        self.id = slot_id
+
+    def pin_name(self, kind):
+        return f"SLOT{self.id}_{kind}"
+
+    def output_level(self, kind):
+        state = self.world.pins.get(self.pin_name(kind))
+        return state is not None and state.mode == PinState.OUT and state.latch == 1
+
+    def adc1(self):
+        return ADC_REF / 2      # Floating
+
+    def adc2(self):
+        return ADC_REF
+
+    def slow(self, index):
+        return 1
+
+
+class DualMotorSlot(EmptySlot):
+    NAME = "Dual Motor"
+
+    def adc1(self):
+        return ADC_REF          # Pulled high by the driver's nFAULT unless in fault
+
+    def adc2(self):
+        return temp_to_analog(self.world.temperature)
+
+    def slow(self, index):
+        return 1 if index == 3 else 0
+
+    def is_powered(self):
+        return self.world.is_main_output_on() and self.output_level("SLOW3")
+
+
+class QuadServoRegSlot(EmptySlot):
+    NAME = "Quad Servo Regulated"
+
+    def adc1(self):
+        return ADC_REF
+
+    def adc2(self):
+        return temp_to_analog(self.world.temperature)
+
+    def slow(self, index):
+        return 0 if index == 1 else 1   # SLOW3 is power good
+
+    def is_powered(self):
+        return self.world.is_main_output_on() and self.output_level("SLOW1")
+
+
+class QuadServoDirectSlot(EmptySlot):
+    NAME = "Quad Servo Direct"
+
+    def slow(self, index):
+        return 0
+
+    def is_powered(self):
+        return self.world.is_main_output_on()
+
+
+class BigMotorSlot(EmptySlot):
+    NAME = "Big Motor + Encoder"
+    SHUNT_GAIN = 0.001 * 80     # Volts per amp from the current sense amplifier
+    AMPS_AT_FULL_SPEED = 2.0
+
+    def current(self):
+        if not self.is_powered():
+            return 0.0
+        return sum(abs(m.speed()) for m in self.world.motors_in_slot(self.id)) * self.AMPS_AT_FULL_SPEED
+
+    def adc1(self):
+        if not self.world.is_main_output_on():
+            return 0.0          # The current sense amplifier is unpowered
+        return ADC_REF / 2 + self.current() * self.SHUNT_GAIN
+
+    def adc2(self):
+        return temp_to_analog(self.world.temperature)
+
+    def slow(self, index):
+        if index == 2:
+            return 1 if self.world.is_main_output_on() else 0  # nFAULT
+        return 1 if index == 3 else 0
+
+    def is_powered(self):
+        return self.world.is_main_output_on() and self.output_level("SLOW3")
+
+
+SLOT_MODELS = {model.NAME: model for model in (DualMotorSlot, QuadServoRegSlot, QuadServoDirectSlot, BigMotorSlot)}
+
+# The shared ADC's mux address of each slot's ADC1 and ADC2
+SLOT_ADDRESSES = {1: (0, 3), 2: (1, 6), 3: (4, 2), 4: (5, 7), 5: (8, 11), 6: (9, 10)}
+CURRENT_SENSE_ADDR = 12
+TEMP_SENSE_ADDR = 13
+VOLTAGE_OUT_SENSE_ADDR = 14
+VOLTAGE_IN_SENSE_ADDR = 15
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# I2C devices
+# ---------------------------------------------------------------------------------------------------------------
+
+class IOExpanderDevice:
+    # The Nuvoton MS51 on an IO expander breakout, as seen over I2C and through BreakoutIOExpander
+
+    NUM_PINS = 14
+
+    REG_P0 = 0x40
+    REG_P1 = 0x50
+    REG_P3 = 0x70
+
+    # (port register, bit) for pins 1 to 14
+    PIN_PORTS = ((REG_P1, 5), (REG_P1, 0), (REG_P1, 2), (REG_P1, 4), (REG_P0, 0),
+                 (REG_P0, 1), (REG_P1, 1), (REG_P0, 3), (REG_P0, 4), (REG_P3, 0),
+                 (REG_P0, 6), (REG_P0, 5), (REG_P0, 7), (REG_P1, 7))
+
+    MODE_IN = 0
+    MODE_IN_PU = 1
+    MODE_OUT = 2
+    MODE_ADC = 3
+
+    def __init__(self, world, address=0x18, int_pin=None):
+        self.world = world
+        self.address = address
+        self.int_pin = int_pin      # Name of the RP2040 pin the INT output is wired to, if any
+
+        self.modes = [self.MODE_IN_PU] * (self.NUM_PINS + 1)
+        self.outputs = [0] * (self.NUM_PINS + 1)
+        self.sources = [None] * (self.NUM_PINS + 1)
+        self.inverts = [False] * (self.NUM_PINS + 1)
+
+        self.interrupts = [False] * (self.NUM_PINS + 1)
+        self.last_levels = [None] * (self.NUM_PINS + 1)
+        self.int_out = False
+        self.flag = False
+        self.reads = 0
+
+        if int_pin is not None:
+            world.set_input(int_pin, self.int_level)
+
+    def set_input(self, pin, source, invert=False):
+        # source is a level, or a callable returning a level (or a voltage for ADC pins)
+        self.__check_pin(pin)
+        self.sources[pin] = source
+        self.inverts[pin] = invert
+
+    def __check_pin(self, pin):
+        if pin < 1 or pin > self.NUM_PINS:
+            raise ValueError(f"pin out of range. Expected 1 to {self.NUM_PINS}")
+
+    def raw(self, pin):
+        source = self.sources[pin]
+        if source is None:
+            value = 1 if self.modes[pin] == self.MODE_IN_PU else 0
+        else:
+            value = source() if callable(source) else source
+        return value
+
+    def level(self, pin):
+        if self.modes[pin] == self.MODE_OUT:
+            return self.outputs[pin]
+        value = self.raw(pin)
+        if isinstance(value, float):
+            value = 1 if value > ADC_REF / 2 else 0
+        return (1 if value else 0) ^ self.inverts[pin]
+
+    def voltage(self, pin):
+        value = self.raw(pin)
+        if isinstance(value, float):
+            return value
+        return ADC_REF if (1 if value else 0) ^ self.inverts[pin] else 0.0
+
+    def read_register(self, reg):
+        self.reads += 1
+        byte = 0
+        for pin in range(1, self.NUM_PINS + 1):
+            port, bit = self.PIN_PORTS[pin - 1]
+            if port == reg and self.level(pin):
+                byte |= 1 << bit
+        return byte
+
+    def int_level(self):
+        return 0 if (self.flag and self.int_out) else 1
+
+    def refresh(self):
+        for pin in range(1, self.NUM_PINS + 1):
+            if self.interrupts[pin]:
+                level = self.level(pin)
+                if self.last_levels[pin] is not None and level != self.last_levels[pin]:
+                    self.flag = True
+                self.last_levels[pin] = level
+
+    def is_watched(self):
+        return any(self.interrupts)
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# The machine
+# ---------------------------------------------------------------------------------------------------------------
+
+class StepperModel:
+    # A stepper on a Dual Motor slot, turning to follow the electrical angle of its two coils.
+    # The rotor only follows whilst the driver has power. Otherwise the field moves without it, and the steps are lost
+
+    STEPS_PER_CYCLE = 4     # Full steps per electrical revolution
+
+    def __init__(self, world, slot_id):
+        self.world = world
+        self.slot_id = slot_id
+        self.position = 0.0     # In full steps
+        self.lost_steps = 0.0
+        self.duties = [0.0, 0.0]
+        self.enabled = [False, False]
+        self.listeners = []
+        self.__angle = None
+
+    def add_listener(self, listener):
+        # listener(steps) is called with the distance of every movement
+        self.listeners.append(listener)
+
+    def is_powered(self):
+        slot = self.world.slot(self.slot_id)
+        return slot.is_powered() and self.enabled[0] and self.enabled[1]
+
+    def set_coil(self, coil, duty, enabled):
+        self.duties[coil] = duty
+        self.enabled[coil] = enabled
+        a, b = self.duties
+        if a == 0.0 and b == 0.0:
+            return
+
+        angle = math.atan2(-b, a)
+        if self.__angle is None:
+            self.__angle = angle
+            return
+
+        delta = angle - self.__angle
+        if delta > math.pi:
+            delta -= 2 * math.pi
+        elif delta <= -math.pi:
+            delta += 2 * math.pi
+        self.__angle = angle
+        if delta == 0.0:
+            return
+
+        steps = delta * self.STEPS_PER_CYCLE / (2 * math.pi)
+        if not self.is_powered():
+            self.lost_steps += abs(steps)
+            return
+
+        self.position += steps
+        for listener in self.listeners:
+            listener(steps)
+        self.world.refresh()
+
+
+class Rail:
+    # The gantry's rail, in full steps of its stepper. Zero is the right hand end, where the home endstop
+    # triggers, and positions to the left are negative. A hall effect sensor on the carriage sees a magnet
+    # at each station. Driving past either end stalls against the hard stop, losing the steps
+
+    def __init__(self, stepper, length=1200, station_spacing=150, first_station=-40, stations=6, magnet_half_width=12,
+                 endstop_width=4, start=-200):
+        self.stepper = stepper
+        self.length = length
+        self.magnet_half_width = magnet_half_width
+        self.endstop_width = endstop_width
+        self.magnets = [first_station - i * station_spacing for i in range(stations)]
+        self.x = float(start)
+        self.stalled_steps = 0.0
+        stepper.add_listener(self.__moved)
+
+    def __moved(self, steps):
+        x = self.x + steps
+        if x > self.endstop_width:
+            self.stalled_steps += x - self.endstop_width
+            x = self.endstop_width
+        elif x < -self.length - self.endstop_width:
+            self.stalled_steps += -self.length - self.endstop_width - x
+            x = -self.length - self.endstop_width
+        self.x = x
+
+    def home_right(self):
+        return 1 if self.x >= 0 else 0
+
+    def home_left(self):
+        return 1 if self.x <= -self.length else 0
+
+    def hall(self):
+        for magnet in self.magnets:
+            if abs(self.x - magnet) <= self.magnet_half_width:
+                return 1
+        return 0
+
+    def station(self):
+        # The station the carriage is over, or None
+        for i, magnet in enumerate(self.magnets):
+            if abs(self.x - magnet) <= self.magnet_half_width:
+                return i
+        return None
+
+
+class FilamentPath:
+    # Filament driven by a stepper, when grip() says it is pinched against the drive gear.
+    # The tip position (in mm) moves with the stepper. Sensors along the path see filament once the tip
+    # has passed them, and the counter wheel's output toggles every half pulse of travel
+
+    def __init__(self, stepper, steps_per_mm=52, tip=0.0, direction=1, grip=None):
+        self.stepper = stepper
+        self.steps_per_mm = steps_per_mm
+        self.direction = direction
+        self.grip = grip
+        self.tip = float(tip)
+        self.travel = 0.0       # Total distance moved in either direction
+        self.slipped = 0.0      # Distance the drive turned without gripping
+        stepper.add_listener(self.__moved)
+
+    def __moved(self, steps):
+        mm = steps * self.direction / self.steps_per_mm
+        if self.grip is not None and not self.grip():
+            self.slipped += abs(mm)
+            return
+        self.tip += mm
+        self.travel += abs(mm)
+
+    def sensor(self, at_mm):
+        # A source for a sensor at the given distance along the path. Reads 1 when filament is present
+        return lambda: 1 if self.tip >= at_mm else 0
+
+
+def counter_source(paths, pulse_mm=0.156):
+    # A source for a counter wheel that any of the paths' filament runs over
+    def level():
+        travel = 0.0
+        for path in paths:
+            travel += path.travel
+        return int(travel * 2 / pulse_mm) & 1
+    return level
+
+
+class Spool:
+    # A spool on a DC motor. Its speed lags the motor's commanded speed, and its revolutions feed the encoder
+
+    def __init__(self, world, slot_id, max_rps=2.0, time_constant=0.2):
+        self.world = world
+        self.slot_id = slot_id
+        self.max_rps = max_rps
+        self.time_constant = time_constant
+        self.rps = 0.0
+        self.revolutions = 0.0
+        self.__updated_us = world.clock.now_us
+
+    def target_rps(self):
+        if not self.world.slot(self.slot_id).is_powered():
+            return 0.0
+        return sum(m.speed() for m in self.world.motors_in_slot(self.slot_id)) * self.max_rps
+
+    def update(self):
+        # Integrate the first order lag since the last update, exactly, for the target that has applied since
+        now = self.world.clock.now_us
+        dt = (now - self.__updated_us) / 1000000
+        self.__updated_us = now
+        if dt <= 0:
+            return
+        target = self.target_rps()
+        decay = math.exp(-dt / self.time_constant)
+        self.revolutions += target * dt + (self.rps - target) * self.time_constant * (1 - decay)
+        self.rps = target + (self.rps - target) * decay
+
+
+class World:
+
+    def __init__(self, clock=None, voltage_in=12.0, temperature=25.0, idle_current=0.1):
+        self.clock = clock if clock is not None else VirtualClock()
+        self.voltage_in = voltage_in
+        self.temperature = temperature
+        self.idle_current = idle_current
+
+        self.pins = {}          # Pin name to PinState
+        self.inputs = {}        # Pin name to a level, or a callable returning one
+        self.slots = {slot_id: EmptySlot(self, slot_id) for slot_id in SLOT_ADDRESSES}
+        self.i2c_devices = {}
+        self.motors = []
+        self.servos = {}        # Pin name to Servo
+        self.steppers = {}      # Slot ID to StepperModel
+        self.spools = {}        # Slot ID to Spool
+        self.__refreshing = False
+
+    # Pins
+
+    def pin(self, name):
+        state = self.pins.get(name)
+        if state is None:
+            state = PinState(name)
+            self.pins[name] = state
+        return state
+
+    def set_input(self, name, source):
+        # Drive an RP2040 (or TCA) pin with a level, or a callable returning one
+        self.inputs[name] = source
+
+    def read_input(self, name):
+        source = self.inputs.get(name)
+        if source is not None:
+            return 1 if (source() if callable(source) else source) else 0
+
+        if name.startswith("SLOT") and "_SLOW" in name:
+            slot_id = int(name[4])
+            return self.slots[slot_id].slow(int(name[-1]))
+
+        state = self.pins.get(name)
+        if state is not None and state.pull == "down":
+            return 0
+        return 1        # Unconnected inputs float high on the Yukon's pull-ups
+
+    def level(self, name):
+        state = self.pin(name)
+        if state.mode == PinState.OUT:
+            return state.latch
+        return self.read_input(name)
+
+    def is_main_output_on(self):
+        state = self.pins.get("MAIN_EN")
+        return state is not None and state.mode == PinState.OUT and state.latch == 1
+
+    def refresh(self):
+        # Fire any interrupts whose inputs have changed, after something has moved
+        if self.__refreshing:
+            return
+        self.__refreshing = True
+        try:
+            for device in self.i2c_devices.values():
+                if isinstance(device, IOExpanderDevice) and device.is_watched():
+                    device.refresh()
+
+            for state in list(self.pins.values()):
+                if state.handler is None:
+                    continue
+                level = self.level(state.name)
+                last = state.last_level
+                state.last_level = level
+                if last is None or level == last:
+                    continue
+                if (level == 1 and state.rising) or (level == 0 and state.falling):
+                    state.handler(state.handle)
+        finally:
+            self.__refreshing = False
+
+    # Slots
+
+    def fit(self, slot_id, name):
+        # Fit a module to a slot, by its NAME
+        if name not in SLOT_MODELS:
+            raise ValueError(f"'{name}' cannot be simulated. Expected one of {list(SLOT_MODELS)}")
+        self.slots[slot_id] = SLOT_MODELS[name](self, slot_id)
+
+    def slot(self, slot_id):
+        return self.slots[slot_id]
+
+    def motors_in_slot(self, slot_id):
+        prefix = f"SLOT{slot_id}_"
+        return [motor for motor in self.motors if motor.pins[0].startswith(prefix)]
+
+    def stepper(self, slot_id):
+        # The stepper driven by the Dual Motor in the slot
+        model = self.steppers.get(slot_id)
+        if model is None:
+            model = StepperModel(self, slot_id)
+            self.steppers[slot_id] = model
+        return model
+
+    def spool(self, slot_id, **kwargs):
+        model = self.spools.get(slot_id)
+        if model is None:
+            model = Spool(self, slot_id, **kwargs)
+            self.spools[slot_id] = model
+        return model
+
+    def servo(self, pin_name):
+        return self.servos.get(pin_name)
+
+    def servo_at(self, slot_id, index):
+        return self.servos.get(f"SLOT{slot_id}_FAST{index}")
+
+    def io_expander(self, address=0x18, int_pin=None):
+        device = self.i2c_devices.get(address)
+        if device is None:
+            device = IOExpanderDevice(self, address, int_pin)
+            self.i2c_devices[address] = device
+        return device
+
+    def on_motor_changed(self, motor):
+        # Called by the fake Motor whenever its output changes
+        if motor.pins[0].startswith("SLOT"):
+            slot_id = int(motor.pins[0][4])
+            spool = self.spools.get(slot_id)
+            if spool is not None:
+                spool.update()
+            if isinstance(self.slots[slot_id], DualMotorSlot):
+                coil = 0 if motor.pins[0].endswith(("FAST1", "FAST2")) else 1
+                self.stepper(slot_id).set_coil(coil, motor.duty(), motor.is_enabled())
+
+    # The shared ADC
+
+    def mux_address(self):
+        en1, en2 = self.level("ADC_MUX_EN_1"), self.level("ADC_MUX_EN_2")
+        if en1 == en2:
+            return None     # Both muxes off (or fighting)
+        address = 8 if en1 else 0
+        for bit, name in enumerate(("ADC_ADDR_1", "ADC_ADDR_2", "ADC_ADDR_3")):
+            if self.level(name):
+                address |= 1 << bit
+        return address
+
+    def total_current(self):
+        if not self.is_main_output_on():
+            return 0.0
+        current = self.idle_current
+        for motor in self.motors:
+            if motor.is_enabled():
+                current += abs(motor.duty()) * 0.5
+        return current
+
+    def read_adc_u16(self):
+        self.clock.charge(Costs.ADC)
+        address = self.mux_address()
+        if address is None:
+            return voltage_to_u16(ADC_REF / 2)
+
+        if address == VOLTAGE_IN_SENSE_ADDR:
+            from pimoroni_yukon import conversion as c
+            volts = self.voltage_in
+            if volts >= c.VOLTAGE_IN_MIN:
+                return int((volts - c.VOLTAGE_IN_MIN) / c.MEASURED_TO_VOLTAGE_IN_MAX_MIN + c.MEASURED_AT_VOLTAGE_IN_MIN)
+            return int(volts / c.MEASURED_TO_VOLTAGE_IN_MIN_ZERO + c.MEASURED_AT_VOLTAGE_IN_ZERO)
+
+        if address == VOLTAGE_OUT_SENSE_ADDR:
+            from pimoroni_yukon import conversion as c
+            volts = self.voltage_in if self.is_main_output_on() else 0.0
+            if volts >= c.VOLTAGE_OUT_MIN:
+                return int((volts - c.VOLTAGE_OUT_MIN) / c.MEASURED_TO_VOLTAGE_OUT_MAX_MIN + c.MEASURED_AT_VOLTAGE_OUT_MIN)
+            return int(volts / c.MEASURED_TO_VOLTAGE_OUT_MIN_ZERO + c.MEASURED_AT_VOLTAGE_OUT_ZERO)
+
+        if address == CURRENT_SENSE_ADDR:
+            from pimoroni_yukon import conversion as c
+            u16 = (self.total_current() - c.CURRENT_MID) / c.MEASURED_TO_CURRENT_MAX_MID + c.MEASURED_AT_CURRENT_MID
+            return max(min(int(u16), U16_MAX), 0)
+
+        if address == TEMP_SENSE_ADDR:
+            return voltage_to_u16(temp_to_analog(self.temperature))
+
+        for slot_id, (adc1, adc2) in SLOT_ADDRESSES.items():
+            if address == adc1:
+                return voltage_to_u16(self.slots[slot_id].adc1())
+            if address == adc2:
+                return voltage_to_u16(self.slots[slot_id].adc2())
+        return 0
@@ -0,0 +1,130 @@
+import pytest
+
+import sim
+
+# CommandReader on the simulated board's clock, reading lines from a stream as it would stdin
+
+
+class Stream:
+    # Characters waiting to be read, ready to the simulated uselect whilst any remain
+
+    def __init__(self, text=""):
+        self.text = text
+
+    def sim_available(self):
+        return len(self.text)
+
+    def read(self, size):
+        text, self.text = self.text[:size], self.text[size:]
+        return text
+
+
+@pytest.fixture(scope="module")
+def world():
+    world = sim.install()
+    yield world
+    sim.uninstall()
+
+
+@pytest.fixture
+def stream(world):
+    return Stream()
+
+
+@pytest.fixture
+def reader(stream):
+    from mods.commands import CommandReader
+    return CommandReader(stream)
+
+
+@pytest.mark.parametrize("line", ["stop\n", "STOP\r\n", "  stop \r"])
+def test_stop(stream, reader, line):
+    stream.text = line
+    reader.service()
+    assert reader.is_stop_requested()
+    assert not reader.is_abort_requested()
+    assert reader.next_command() is None
+
+
+def test_abort_is_a_stop(stream, reader):
+    stream.text = "abort\n"
+    reader.service()
+    assert reader.is_stop_requested()
+    assert reader.is_abort_requested()
+
+
+def test_partial_line_waits_for_its_end(stream, reader):
+    stream.text = "sto"
+    reader.service()
+    assert not reader.is_stop_requested()
+    stream.text = "p\n"
+    reader.service()
+    assert reader.is_stop_requested()
+
+
+def test_other_lines_are_queued(stream, reader):
+    stream.text = "home\n\nMove 2\nstop\n"
+    reader.service()
+    assert reader.is_stop_requested()
+    assert reader.next_command() == "home"
+    assert reader.next_command() == "move 2"
+    assert reader.next_command() is None
+
+
+def test_queue_drops_the_oldest(stream, reader):
+    stream.text = "".join(f"c{i}\n" for i in range(reader.MAX_QUEUED_COMMANDS + 2))
+    while stream.text:
+        reader.service()
+    assert reader.dropped_commands == 2
+    assert reader.next_command() == "c2"
+
+
+def test_clear_stop(stream, reader):
+    stream.text = "abort\n"
+    reader.service()
+    reader.clear_stop()
+    assert not reader.is_stop_requested()
+    assert not reader.is_abort_requested()
+    assert reader.acknowledge_stop() == 0
+    assert reader.stops == 0
+
+
+def test_latency_from_the_stop_line(world, stream, reader):
+    # Measured from the first character of the line, not from when the line is finished
+    stream.text = "st"
+    reader.service()
+    world.clock.advance(2000)
+    stream.text = "op\n"
+    reader.service()
+    world.clock.advance(3000)
+    latency_us = reader.acknowledge_stop()
+    assert latency_us == pytest.approx(5000, abs=100)
+    assert not reader.is_stop_requested()
+
+    reader.request_stop()
+    world.clock.advance(1000)
+    reader.acknowledge_stop()
+    stats = reader.get_stats()
+    assert stats["stops"] == 2
+    assert stats["last_stop_latency_ms"] == pytest.approx(1, abs=0.1)
+    assert stats["max_stop_latency_ms"] == pytest.approx(5, abs=0.1)
+
+
+def test_wait_for_stop(world, stream, reader):
+    assert not reader.wait_for_stop(timeout=0.1)
+    world.clock.schedule_in(50000, lambda clock: setattr(stream, "text", "stop\n"))
+    start = world.clock.seconds()
+    assert reader.wait_for_stop(timeout=1)
+    assert world.clock.seconds() - start == pytest.approx(0.05, abs=0.02)
+
+
+def test_source_replaces_the_stream(stream, reader):
+    serviced = []
+    reader.set_source(lambda: serviced.append(True) or reader.request_stop())
+    stream.text = "home\n"
+    reader.service()
+    assert serviced == [True]
+    assert reader.is_stop_requested()
+    assert reader.next_command() is None     # The stream was left alone
+    with pytest.raises(TypeError):
+        reader.set_source(1)
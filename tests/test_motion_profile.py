@@ -0,0 +1,86 @@
+import importlib.util
+import os
+
+import pytest
+
+# Loaded by its path, as importing the pimoroni_yukon package needs MicroPython's machine module
+PATH = os.path.join(os.path.dirname(__file__), "..", "lib", "pimoroni_yukon", "devices", "motion_profile.py")
+spec = importlib.util.spec_from_file_location("motion_profile", PATH)
+motion_profile = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(motion_profile)
+
+MotionProfile = motion_profile.MotionProfile
+TRAPEZOID = motion_profile.TRAPEZOID
+S_CURVE = motion_profile.S_CURVE
+
+
+def intervals(profile):
+    return [profile.interval(i) for i in range(profile.steps)]
+
+
+def test_trapezoid_step_counts():
+    profile = MotionProfile()
+    peak_rate = profile.plan(1000, 400, 800)
+    assert peak_rate == 400
+    assert profile.steps == 1000
+    assert profile.ramp_steps == 100        # v^2 / 2a
+    assert profile.cruise_interval == 2500
+    assert len(intervals(profile)) == 1000
+    assert sum(intervals(profile)) == profile.duration_us()
+    # 0.5s up to speed, 2s at speed over the 800 steps between the ramps, then 0.5s back down
+    assert profile.duration_us() == pytest.approx(3000000, rel=0.01)
+
+
+def test_s_curve_step_counts():
+    profile = MotionProfile()
+    peak_rate = profile.plan(1000, 400, 800, curve=S_CURVE)
+    assert peak_rate == 400
+    assert profile.steps == 1000
+    assert profile.ramp_steps == 150        # 1.5x the trapezoid ramp
+    assert profile.cruise_interval == 2500
+    assert sum(intervals(profile)) == profile.duration_us()
+
+
+@pytest.mark.parametrize("curve", [TRAPEZOID, S_CURVE])
+def test_intervals_monotonic_through_ramps(curve):
+    profile = MotionProfile()
+    profile.plan(1000, 400, 800, curve=curve)
+    steps = intervals(profile)
+    ramp = profile.ramp_steps
+    accelerating = steps[:ramp]
+    decelerating = steps[-ramp:]
+    assert all(a >= b for a, b in zip(accelerating, accelerating[1:]))
+    assert all(a <= b for a, b in zip(decelerating, decelerating[1:]))
+    assert accelerating[-1] >= profile.cruise_interval
+    assert all(interval == profile.cruise_interval for interval in steps[ramp:-ramp])
+
+
+@pytest.mark.parametrize("curve", [TRAPEZOID, S_CURVE])
+def test_triangular_profile(curve):
+    # Too short to reach max_rate, so it ramps up for half the move and straight back down
+    profile = MotionProfile()
+    peak_rate = profile.plan(100, 400, 800, curve=curve)
+    assert peak_rate < 400
+    assert 0 < profile.ramp_steps <= 50
+    assert profile.steps - 2 * profile.ramp_steps <= 2
+    steps = intervals(profile)
+    assert len(steps) == 100
+    assert all(a >= b for a, b in zip(steps[:profile.ramp_steps], steps[1:profile.ramp_steps]))
+
+
+def test_ramp_beyond_capacity_raises():
+    profile = MotionProfile(64)
+    profile.plan(100, 400, 800)
+    with pytest.raises(ValueError):
+        profile.plan(10000, 400, 800)       # Needs a 100 step ramp
+    # The profile planned before is left as it was
+    assert profile.steps == 100
+    assert profile.ramp_steps == 50
+
+
+def test_long_move_within_capacity():
+    # However long the move, only the ramps are stored
+    profile = MotionProfile(128)
+    profile.plan(1000000, 400, 800)
+    assert profile.ramp_steps == 100
+    assert profile.interval(500000) == profile.cruise_interval
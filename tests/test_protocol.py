@@ -0,0 +1,176 @@
+import io
+
+import pytest
+
+import sim
+from mods import protocol
+
+# The frame codec needs nothing from MicroPython. The Server is run on the simulated board, fed from a stream
+
+
+class Stream:
+    # Bytes waiting to be read, ready to the simulated uselect whilst any remain
+
+    def __init__(self, data=b""):
+        self.data = bytearray(data)
+
+    def sim_available(self):
+        return len(self.data)
+
+    def read(self, size):
+        data = bytes(self.data[:size])
+        del self.data[:size]
+        return data
+
+    def readinto(self, buffer):
+        size = min(len(buffer), len(self.data))
+        buffer[:size] = self.data[:size]
+        del self.data[:size]
+        return size
+
+
+def decode_all(data):
+    decoder = protocol.FrameDecoder()
+    decoder.feed(data)
+    frames = []
+    frame = decoder.pop()
+    while frame is not None:
+        frames.append(frame)
+        frame = decoder.pop()
+    return decoder, frames
+
+
+def test_round_trip():
+    frame = protocol.encode_request(7, protocol.OP_STORAGE_DELIVER, 2, 150.0)
+    decoder, frames = decode_all(frame)
+    assert len(frames) == 1
+    request_id, opcode, payload = frames[0]
+    assert (request_id, opcode) == (7, protocol.OP_STORAGE_DELIVER)
+    assert protocol.decode_args(opcode, payload) == (2, 150.0)
+    assert (decoder.frames, decoder.crc_errors, decoder.skipped_bytes) == (1, 0, 0)
+
+
+def test_round_trip_byte_at_a_time():
+    frame = protocol.encode_request(1, protocol.OP_GANTRY_MOVE_TO, 3)
+    decoder = protocol.FrameDecoder()
+    counts = [decoder.feed(frame[i:i + 1]) for i in range(len(frame))]
+    assert counts == [0] * (len(frame) - 1) + [1]
+    assert decoder.pop() == (1, protocol.OP_GANTRY_MOVE_TO, bytes((3,)))
+
+
+def test_status_round_trip():
+    assert protocol.decode_status(protocol.encode_status(protocol.STATUS_OK)) == (protocol.STATUS_OK, None)
+    assert protocol.decode_status(protocol.encode_status(protocol.STATUS_OK, 2.5)) == (protocol.STATUS_OK, 2.5)
+    assert protocol.decode_status(protocol.encode_status(protocol.STATUS_EXCEPTION, "ValueError: x")) == \
+        (protocol.STATUS_EXCEPTION, "ValueError: x")
+
+
+def test_bad_arguments():
+    assert protocol.decode_args(protocol.OP_GANTRY_MOVE_TO, b"") is None
+    assert protocol.decode_args(protocol.OP_GANTRY_HOME, b"\x01") is None
+    with pytest.raises(ValueError):
+        protocol.encode_request(1, protocol.OP_GANTRY_HOME, 1)
+    with pytest.raises(ValueError):
+        protocol.encode_frame(1, protocol.OP_PING, bytes(protocol.MAX_PAYLOAD + 1))
+
+
+def test_crc_failure_is_dropped():
+    frame = protocol.encode_request(3, protocol.OP_PING)
+    frame[-1] ^= 0xFF
+    decoder, frames = decode_all(frame)
+    assert frames == []
+    assert decoder.crc_errors == 1
+
+
+def test_resync_after_bad_crc():
+    bad = protocol.encode_request(3, protocol.OP_GANTRY_MOVE_TO, 1)
+    bad[4] ^= 0xFF
+    good = protocol.encode_request(4, protocol.OP_GANTRY_MOVE_TO, 2)
+    decoder, frames = decode_all(bad + good)
+    assert frames == [(4, protocol.OP_GANTRY_MOVE_TO, bytes((2,)))]
+    assert decoder.crc_errors == 1
+    assert decoder.skipped_bytes == len(bad)
+
+
+def test_resync_after_sync_in_printed_text():
+    # A stray SYNC in print() output claims a length running into the real frame, so fails its CRC
+    text = b"Moved to station 3\r\n\xa5\x02ok\r\n"
+    good = protocol.encode_request(5, protocol.OP_PING)
+    decoder, frames = decode_all(text + good)
+    assert frames == [(5, protocol.OP_PING, b"")]
+    assert decoder.crc_errors == 1
+    assert decoder.skipped_bytes == len(text)
+
+
+@pytest.fixture(scope="module")
+def world():
+    world = sim.install()
+    yield world
+    sim.uninstall()
+
+
+def serve(world, handlers, *requests):
+    # Runs a Server over the requests, followed by an exit, returning the frames it replied with
+    stream_in = Stream(b"".join(protocol.encode_request(*request) for request in requests) +
+                       protocol.encode_request(255, protocol.OP_EXIT))
+    stream_out = io.BytesIO()
+    server = protocol.Server(handlers, stream_in=stream_in, stream_out=stream_out)
+    server.serve()
+    return server, decode_all(stream_out.getvalue())[1]
+
+
+def test_request_sequencing(world):
+    ran = []
+    handlers = {
+        protocol.OP_GANTRY_MOVE_TO: lambda station: ran.append(station),
+        protocol.OP_GANTRY_DELIVER: lambda length: length * 2,
+    }
+    server, frames = serve(world, handlers,
+                           (1, protocol.OP_GANTRY_MOVE_TO, 3),
+                           (2, protocol.OP_GANTRY_DELIVER, 10.0),
+                           (3, protocol.OP_GANTRY_HOME))
+    assert ran == [3]
+    replies = [(request_id, opcode) for request_id, opcode, _ in frames]
+    # Every request is acknowledged as it arrives, ahead of any being run, and an unknown one is rejected
+    assert replies == [
+        (1, protocol.OP_ACK), (2, protocol.OP_ACK), (3, protocol.OP_ERROR), (255, protocol.OP_ACK),
+        (1, protocol.OP_DONE), (2, protocol.OP_DONE), (255, protocol.OP_DONE),
+    ]
+    assert frames[1][2] == bytes((1,))      # One request queued ahead of the second
+    assert protocol.decode_status(frames[2][2]) == (protocol.STATUS_UNKNOWN_OPCODE, None)
+    assert protocol.decode_status(frames[5][2]) == (protocol.STATUS_OK, 20.0)
+    assert server.get_stats()["completed"] == 2
+
+
+def test_failed_and_raising_requests(world):
+    def fail(station):
+        if station == 0:
+            raise ValueError("no station 0")
+        return False
+
+    _, frames = serve(world, {protocol.OP_GANTRY_MOVE_TO: fail},
+                      (1, protocol.OP_GANTRY_MOVE_TO, 0),
+                      (2, protocol.OP_GANTRY_MOVE_TO, 1))
+    done = {request_id: protocol.decode_status(payload) for request_id, opcode, payload in frames
+            if opcode == protocol.OP_DONE}
+    assert done[1] == (protocol.STATUS_EXCEPTION, "ValueError: no station 0")
+    assert done[2] == (protocol.STATUS_FAILED, None)
+
+
+def test_service_bounds_the_bytes_read(world):
+    # Nothing is read with nothing waiting, and no more than MAX_BYTES_PER_SERVICE bytes in one call
+    stream_in = Stream()
+    stream_out = io.BytesIO()
+    server = protocol.Server({}, stream_in=stream_in, stream_out=stream_out)
+    server.service()
+    assert stream_out.getvalue() == b""
+
+    ping = protocol.encode_request(1, protocol.OP_PING)
+    pings = protocol.Server.MAX_BYTES_PER_SERVICE // len(ping) + 1
+    stream_in.data = bytearray(ping * pings)
+    server.service()
+    assert server.requests == pings - 1
+    assert len(stream_in.data) > 0
+    server.service()
+    assert server.requests == pings
+    assert len(stream_in.data) == 0
@@ -0,0 +1,116 @@
+import pytest
+
+import sim
+
+# OkayStepper on a Dual Motor module in slot 1 of the simulated board, stepped by the virtual clock's timers
+
+
+@pytest.fixture(scope="module")
+def module():
+    sim.install()
+    from pimoroni_yukon import Yukon
+    from pimoroni_yukon.modules import DualMotorModule
+    yukon = Yukon()
+    module = DualMotorModule()
+    yukon.register_with_slot(module, 1)
+    yukon.verify_and_initialise()
+    yukon.enable_main_output()
+    module.enable()
+    yield module
+    sim.uninstall()
+
+
+@pytest.fixture
+def stepper(module):
+    from pimoroni_yukon.devices.stepper import OkayStepper
+    stepper = OkayStepper(module.motor1, module.motor2)
+    yield stepper
+    stepper.stop()
+
+
+def test_accel_move_completes(stepper):
+    stepper.move_by_steps_accel(50, 100, 400)
+    assert stepper.is_moving()
+    stepper.wait_for_move(timeout=5)
+    assert stepper.steps() == 50
+
+
+def test_move_of_nothing_stops(stepper):
+    stepper.move_by_steps_accel(50, 100, 400)
+    stepper.move_by_steps_accel(0, 100, 400)
+    assert not stepper.is_moving()
+    stepper.wait_for_move(timeout=0.1)     # Would raise TimeoutError if still waiting on a stopped timer
+
+
+def test_move_to_where_it_is_stops(stepper):
+    stepper.move_by_steps_accel(50, 100, 400)
+    stepper.move_to_step_accel(stepper.steps(), 100, 400)
+    assert not stepper.is_moving()
+    stepper.wait_for_move(timeout=0.1)
+
+
+def test_move_that_fails_to_plan_stops(stepper):
+    stepper.move_by_steps_accel(50, 100, 400)
+    with pytest.raises(ValueError):
+        stepper.move_by_steps_accel(100000, 100000, 1)     # A ramp far longer than the profile holds
+    assert not stepper.is_moving()
+    stepper.wait_for_move(timeout=0.1)
+
+
+def advance(seconds):
+    from sim.world import active
+    active().clock.advance(seconds * 1000000)
+
+
+def test_slow_to_stop_decelerates_accel_move(stepper):
+    # 100 steps/s at 400 steps/s^2 takes 12.5 steps to slow from, rather than the 400 the move had left
+    stepper.move_by_steps_accel(500, 100, 400)
+    advance(1)
+    assert stepper.is_moving()
+    seen = stepper.steps()
+    stepper.slow_to_stop()
+    stepper.wait_for_move(timeout=1)
+    assert 10 <= stepper.steps() - seen <= 14
+
+
+def test_slow_to_stop_drops_queued_moves(stepper):
+    for _ in range(4):
+        stepper.queue_by_steps(50, 100, 400)
+    advance(1)
+    seen = stepper.steps()
+    stepper.slow_to_stop()
+    stepper.wait_for_move(timeout=1)
+    assert 10 <= stepper.steps() - seen <= 14
+    assert stepper.queue_depth() == 0
+
+
+def queued_rates(stepper, moves):
+    # Queues the moves, then steps through them, returning the rate of each microstep and the segment it is in
+    rates = []
+    next_interval = stepper._OkayStepper__queue_interval
+
+    def recording_interval():
+        interval = next_interval()
+        rates.append((stepper._OkayStepper__queue_popped, stepper._OkayStepper__rate))
+        return interval
+
+    stepper._OkayStepper__queue_interval = recording_interval
+    first = stepper._OkayStepper__queue_popped
+    for steps, max_speed, acceleration in moves:
+        assert stepper.queue_by_steps(steps, max_speed, acceleration)
+    stepper.wait_for_move(timeout=5)
+    return [(segment - first, rate) for segment, rate in rates]
+
+
+@pytest.mark.parametrize("first_speed, second_speed", [(200, 200), (200, 100), (100, 200)])
+def test_queue_exit_matches_next_entry(stepper, first_speed, second_speed):
+    # The lookahead plans each segment to leave at the rate the next can be entered at, slowing only as much as it
+    # needs. Rates are in microsteps, at 8 per step
+    two_a = 2 * 4000 * 8
+    rates = queued_rates(stepper, [(40, first_speed, 4000), (40, second_speed, 4000)])
+    exit_rate = [rate for segment, rate in rates if segment == 0][-1]
+    entry_rate = [rate for segment, rate in rates if segment == 1][0]
+    assert abs(entry_rate * entry_rate - exit_rate * exit_rate) <= two_a + 2 * max(entry_rate, exit_rate)
+    assert exit_rate == pytest.approx(min(first_speed, second_speed) * 8, rel=0.05)
+    # The end of the queue is a stop
+    assert rates[-1][1] * rates[-1][1] <= 2 * two_a
@@ -0,0 +1,47 @@
+import pytest
+
+import sim
+
+# TelemetryRecorder on the simulated board's clock, so samples can be spaced out in time
+
+
+@pytest.fixture(scope="module")
+def world():
+    world = sim.install()
+    yield world
+    sim.uninstall()
+
+
+@pytest.fixture
+def recorder(world):
+    from pimoroni_yukon.telemetry import TelemetryRecorder
+    recorder = TelemetryRecorder(capacity=16, interval_ms=200)
+    recorder.add_channels("", ["volts", "fault"])
+    return recorder
+
+
+def values(recorder, name):
+    # In time order, as a sample replaced later in its interval keeps its place in the ring
+    return [value for _, channel, value in sorted(recorder.rows()) if channel == name]
+
+
+def test_spike_and_dip_within_an_interval_are_kept(world, recorder):
+    for value in (12.0, 12.0, 15.0, 12.0, 9.0, 12.0):
+        recorder.record(0, value)
+        world.clock.advance(10000)
+    assert values(recorder, "volts") == [15.0, 9.0]
+
+
+def test_steady_channel_takes_one_sample_per_interval(world, recorder):
+    for _ in range(10):
+        recorder.record(1, 0)
+        world.clock.advance(10000)
+    assert values(recorder, "fault") == [0]
+
+
+def test_next_interval_starts_afresh(world, recorder):
+    recorder.record(0, 12.0)
+    recorder.record(0, 15.0)
+    world.clock.advance(200000)
+    recorder.record(0, 11.0)
+    assert values(recorder, "volts") == [12.0, 15.0, 11.0]